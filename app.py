@@ -1,48 +1,260 @@
 """
 Face Authentication Attendance System - Flask application.
-Run: python app.py
+Run: python app.py  (async serving mode: python asgi.py)
 """
 import base64
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
 from pathlib import Path
 
-import cv2
-import numpy as np
-from flask import Flask, request, jsonify, render_template, url_for
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context, url_for
 
-from config import DATA_DIR
+from config import (
+    ATTENDANCE_PAGE_MAX,
+    FLASK_DEBUG,
+    INFERENCE_QUEUE_SIZE,
+    INFERENCE_WORKERS,
+    MAX_BATCH_FRAMES,
+    METRICS_SERVER_TIMING,
+    PREFILTER_MAX_UNCHANGED,
+    WARMUP_ON_START,
+    ensure_data_dirs,
+)
 from face_auth import FaceRegistry, FaceIdentifier, SpoofDetector, AttendanceDB
+from face_auth import enrollment, export, ingest
+from face_auth.attendance import day_range
+from face_auth.liveness import LivenessSessionStore
+from face_auth.metrics import Metrics, server_timing
+from face_auth.partitions import iso_from_ms
+from face_auth.prefilter import FramePrefilter
+from face_auth.punch_cache import DUPLICATE, OUT_OF_ORDER, PunchCache
+from face_auth.streaming import StreamHub
+from face_auth.timing import StageTimer
+from face_auth.worker_pool import InferencePool, PoolSaturated
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10 MB
 
-# Shared instances
-registry = FaceRegistry()
-spoof = SpoofDetector()
-identifier = FaceIdentifier(registry=registry, spoof_detector=spoof)
-attendance_db = AttendanceDB()
+# Per-stage latency histograms for /metrics (and the optional Server-Timing header)
+metrics = Metrics()
+metrics.describe("stage_seconds", "Pipeline stage latency (decode, detect, landmarks, encode, match, db_write, ...)")
+metrics.describe("request_seconds", "HTTP request latency by endpoint and status")
+metrics.describe("stream_frame_seconds", "Latency of one streamed frame, decode to result")
+metrics.describe("rejections_total", "Frames or requests turned away before recognition, by reason")
+
+# Shared instances, built by create_app(). Nothing is built at import: spawned
+# inference workers re-import the main module and must not get their own set.
+registry = None
+spoof = None
+identifier = None
+attendance_db = None
+inference = None
+liveness_sessions = None
+prefilter = None
+lighting_prefiltered = False
+punch_cache = None
+streams = None
+_create_lock = threading.Lock()
+
+
+def create_app() -> Flask:
+    """
+    Build the shared services (once; later calls return at once) and return
+    the Flask app. The dlib models load on first inference or warm-up, not here.
+    """
+    global registry, spoof, identifier, attendance_db, inference, liveness_sessions
+    global prefilter, lighting_prefiltered, punch_cache, streams
+    with _create_lock:
+        if streams is not None:
+            return app
+        ensure_data_dirs()
+        registry = FaceRegistry()
+        spoof = SpoofDetector()
+        identifier = FaceIdentifier(registry=registry, spoof_detector=spoof)
+        attendance_db = AttendanceDB()
+        # Recognition runs through a bounded pool (worker processes, or inline when
+        # INFERENCE_WORKERS = 0); a full pool answers 429 instead of queueing forever.
+        inference = InferencePool(
+            INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, registry.embeddings_dir, identifier=identifier
+        )
+        liveness_sessions = LivenessSessionStore()
+        # Lighting / blur / no-change checks on a thumbnail, before a frame reaches the pool
+        prefilter = FramePrefilter()
+        lighting_prefiltered = "lighting" in prefilter.filters  # then workers skip their own lighting check
+        # Last punch per user, so double taps and retries are answered without a DB write
+        punch_cache = PunchCache()
+        punch_cache.warm(attendance_db)
+        # the same counters as /api/stats, as gauges on /metrics
+        # (face_auth_gallery_size, face_auth_prefilter_filters_blur_rejected, ...)
+        metrics.add_collector("", runtime_stats)
+        # Streamed frames share liveness sessions; a few consumer threads serve all streams
+        streams = StreamHub(liveness_sessions, _process_stream_frame)
+        if WARMUP_ON_START:
+            inference.start_warm_up()  # models + gallery + one dummy inference, in the background
+    return app
+
+
+def _request_timings():
+    """Stage timings dict of the current request (None when metrics are off)."""
+    return g.get("timings")
+
+
+def _analyze_session_frame(session, img, timings=None) -> dict:
+    """
+    Pre-filter one RGB frame, then analyze it in its session; the caller
+    holds session.lock. Unchanged frames repeat the last status, but at most
+    PREFILTER_MAX_UNCHANGED in a row, so blink and face-lost logic still see
+    a still scene.
+    """
+    previous = session.signature if session.unchanged < PREFILTER_MAX_UNCHANGED else None
+    rejected_by, message, signature = prefilter.check(img, is_rgb=True, previous=previous, timings=timings)
+    if rejected_by:
+        metrics.inc("rejections", reason=rejected_by)
+    if rejected_by == "change":
+        session.unchanged += 1
+        return session.skip()
+    if rejected_by:
+        session.signature = None  # the next usable frame is analyzed, not compared with an older one
+        return session.skip(message)
+    session.signature, session.unchanged = signature, 0
+    roi, want_identity = session.plan()
+    analysis = inference.submit(
+        "analyze_frame", img, want_identity=want_identity, want_ear=spoof.require_blink,
+        is_rgb=True, roi=roi, lighting_checked=lighting_prefiltered, timings=timings,
+    )
+    return session.apply(analysis, spoof)
+
+
+def _process_stream_frame(session, raw: bytes) -> dict:
+    """Run one streamed JPEG frame through its session (called by StreamHub consumers)."""
+    start = time.perf_counter()
+    timings = {} if metrics.enabled else None
+    with StageTimer(timings).stage("decode"):
+        img, err = ingest.decode_rgb(raw)
+    if err:
+        body = session.status(err)
+    else:
+        with session.lock:
+            try:
+                body = _analyze_session_frame(session, img, timings)
+            except PoolSaturated as e:
+                metrics.inc("rejections", reason="busy")
+                body = session.status(str(e))
+                body["busy"] = True
+    body["success"] = body["confirmed"]
+    metrics.observe_stages(timings)
+    metrics.observe("stream_frame_seconds", time.perf_counter() - start)
+    return body
+
+
+def _prefilter_still(img, lighting: bool = True):
+    """Lighting and blur pre-filters for a one-shot image. Returns (rejecting filter or None, message)."""
+    skip = ("change",) if lighting else ("change", "lighting")
+    rejected_by, message, _ = prefilter.check(img, is_rgb=True, skip=skip, timings=_request_timings())
+    if rejected_by:
+        metrics.inc("rejections", reason=rejected_by)
+    return rejected_by, message
+
+
+@app.before_request
+def start_request_timing():
+    g.started = time.perf_counter()
+    g.timings = {} if metrics.enabled else None
+
+
+@app.after_request
+def record_request_timing(response):
+    """Fold the request's stage timings into the histograms; add Server-Timing if enabled."""
+    if metrics.enabled and "started" in g and request.endpoint != "metrics_endpoint":
+        elapsed = time.perf_counter() - g.started
+        metrics.observe("request_seconds", elapsed, endpoint=request.endpoint or "unknown",
+                        status=str(response.status_code))
+        metrics.observe_stages(g.timings)
+        if METRICS_SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(g.timings, elapsed * 1000.0)
+    return response
+
+
+@app.errorhandler(PoolSaturated)
+def handle_pool_saturated(e):
+    metrics.inc("rejections", reason="busy")
+    return jsonify({"success": False, "message": str(e)}), 429
+
+
+def _decode_base64_image(value: str):
+    try:
+        b64 = value.split(",")[-1] if "," in value else value
+        return base64.b64decode(b64), None
+    except Exception as e:
+        return None, f"Invalid base64: {e}"
 
 
 def decode_image_from_request():
-    """Decode image from request (JSON base64 or multipart file)."""
+    """
+    Decode image from request (raw image/* body, JSON base64 or multipart file)
+    to an RGB array. A raw body is read into a reused buffer and decoded from it
+    directly (see face_auth.ingest).
+    """
+    with StageTimer(_request_timings()).stage("decode"):
+        return _read_image()
+
+
+def _read_image():
+    if request.mimetype and request.mimetype.startswith("image/"):
+        with ingest.request_body(request.stream, request.content_length) as view:
+            if not view.nbytes:
+                return None, "Empty image body."
+            return ingest.decode_rgb(view)
     if request.content_type and "application/json" in request.content_type:
         data = request.get_json()
         if not data or "image" not in data:
             return None, "Missing 'image' (base64) in JSON body."
-        try:
-            b64 = data["image"].split(",")[-1] if "," in data["image"] else data["image"]
-            raw = base64.b64decode(b64)
-        except Exception as e:
-            return None, f"Invalid base64: {e}"
+        raw, err = _decode_base64_image(data["image"])
+        if err:
+            return None, err
     elif request.files and "image" in request.files:
         f = request.files["image"]
         raw = f.read()
     else:
-        return None, "Send image as JSON { \"image\": \"<base64>\" } or multipart form 'image'."
-    nparr = np.frombuffer(raw, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    if img is None:
-        return None, "Could not decode image."
-    return img, None
+        return None, "Send image as a raw image/jpeg body, JSON { \"image\": \"<base64>\" } or multipart form 'image'."
+    return ingest.decode_rgb(raw)
+
+
+def decode_images_from_request():
+    """Decode several images: JSON { "images": [<base64>, ...] } or repeated multipart 'image'."""
+    with StageTimer(_request_timings()).stage("decode"):
+        return _read_images()
+
+
+def _read_images():
+    if request.content_type and "application/json" in request.content_type:
+        data = request.get_json() or {}
+        items = data.get("images") or ([data["image"]] if "image" in data else [])
+        raws = []
+        for item in items:
+            raw, err = _decode_base64_image(item)
+            if err:
+                return None, err
+            raws.append(raw)
+    elif request.files and "image" in request.files:
+        raws = [f.read() for f in request.files.getlist("image")]
+    else:
+        return None, "Send images as JSON { \"images\": [\"<base64>\", ...] } or multipart form 'image' (repeated)."
+    if not raws:
+        return None, "No images in request."
+    if len(raws) > MAX_BATCH_FRAMES:
+        return None, f"Too many images (max {MAX_BATCH_FRAMES})."
+    images = []
+    for raw in raws:
+        img, err = ingest.decode_rgb(raw)
+        if err:
+            return None, err
+        images.append(img)
+    return images, None
 
 
 @app.route("/")
@@ -54,33 +266,81 @@ def index():
 def register_page():
     if request.method == "GET":
         return render_template("register.html", users=registry.list_users())
-    # POST: register from JSON or form
+    # POST: register from JSON or form; an existing user gains a template
+    # unless 'replace' is set
     if request.is_json:
         data = request.get_json() or {}
         user_id = (data.get("user_id") or "").strip()
         name = (data.get("name") or "").strip()
+        replace = bool(data.get("replace"))
     else:
         user_id = (request.form.get("user_id") or "").strip()
         name = (request.form.get("name") or "").strip()
+        replace = request.form.get("replace") == "1"
     if not user_id or not name:
         return jsonify({"success": False, "message": "user_id and name required"}), 400
     img, err = decode_image_from_request()
     if err:
         return jsonify({"success": False, "message": err}), 400
-    success, message = registry.register_from_image(img, user_id, name)
+    success, message = registry.register_from_image(img, user_id, name, is_rgb=True, replace=replace)
     return jsonify({"success": success, "message": message})
 
 
+@app.route("/api/enroll/bulk", methods=["POST"])
+def api_enroll_bulk():
+    """
+    Enroll many users from an uploaded zip ('archive'): per-user folders or a
+    manifest.csv (user_id,name,image_path). ?dry_run=1 reports without
+    registering; ?skip_duplicates=1 leaves out users matching another
+    identity. Larger sites: python -m face_auth.enrollment.
+    """
+    upload = request.files.get("archive")
+    if upload is None:
+        return jsonify({"success": False, "message": "Upload a zip file as 'archive'."}), 400
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            with zipfile.ZipFile(upload.stream) as zf:
+                enrollment.extract_archive(zf, Path(tmp))
+        except zipfile.BadZipFile:
+            return jsonify({"success": False, "message": "Not a valid zip file."}), 400
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        root = Path(tmp)
+        entries = list(root.iterdir())
+        if len(entries) == 1 and entries[0].is_dir() and (
+            (entries[0] / "manifest.csv").exists() or any(p.is_dir() for p in entries[0].iterdir())
+        ):
+            root = entries[0]  # zip of the enrollment folder itself
+        try:
+            items = enrollment.collect(root, confine=True)  # manifest paths must stay inside the upload
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        if not items:
+            return jsonify({"success": False, "message": "No images found in the archive."}), 400
+        report = enrollment.enroll(
+            items,
+            registry,
+            dry_run=request.args.get("dry_run") == "1",
+            skip_duplicates=request.args.get("skip_duplicates") == "1",
+        )
+    for skipped in report["skipped"]:
+        skipped["image"] = os.path.relpath(skipped["image"], root)  # as written in the manifest or zip
+    return jsonify({"success": True, **report})
+
+
 @app.route("/attend")
 def attend_page():
-    return render_template("attend.html")
+    return render_template("attend.html", require_blink=spoof.require_blink)
 
 
 @app.route("/attendance")
 def attendance_page():
-    records = attendance_db.get_records(limit=200)
+    try:
+        records, next_cursor = attendance_db.get_records_page(limit=200, cursor=request.args.get("cursor"))
+    except ValueError:
+        records, next_cursor = attendance_db.get_records_page(limit=200)
     summary = attendance_db.get_today_summary()
-    return render_template("attendance.html", records=records, summary=summary)
+    return render_template("attendance.html", records=records, summary=summary, next_cursor=next_cursor)
 
 
 # ---------- API ----------
@@ -97,48 +357,351 @@ def api_delete_user(user_id):
     return jsonify({"success": False, "message": "User not found"}), 404
 
 
+def _record_filters_from_request():
+    """(user_id, start, end) from ?user_id=&from=YYYY-MM-DD&to=YYYY-MM-DD (to is inclusive)."""
+    start, end = day_range(request.args.get("from"), request.args.get("to"))
+    return request.args.get("user_id") or None, start, end
+
+
+@app.route("/api/attendance", methods=["GET"])
+def api_attendance():
+    """
+    Attendance history, newest first, one page at a time. Pass the returned
+    next_cursor as ?cursor= for the next page. Filters: user_id, from, to.
+    """
+    try:
+        user_id, start, end = _record_filters_from_request()
+        limit = min(max(1, int(request.args.get("limit", 100))), ATTENDANCE_PAGE_MAX)
+        records, next_cursor = attendance_db.get_records_page(
+            user_id, limit, cursor=request.args.get("cursor"), start=start, end=end
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return jsonify({"success": True, "records": records, "next_cursor": next_cursor})
+
+
+@app.route("/api/attendance/export", methods=["GET"])
+def api_attendance_export():
+    """
+    Stream attendance history (oldest first) as ?format=csv (default), parquet
+    or arrow; the last two need pyarrow. Filters: user_id, from, to.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.available_formats():
+        return jsonify({
+            "success": False,
+            "message": f"Unsupported format '{fmt}'. Available: {', '.join(export.available_formats())}.",
+        }), 400
+    try:
+        user_id, start, end = _record_filters_from_request()
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    chunks = attendance_db.iter_records(user_id, start, end)
+    body = export.csv_chunks(chunks) if fmt == "csv" else export.arrow_chunks(chunks, fmt)
+    mimetype, ext = export.FORMATS[fmt]
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=attendance.{ext}"},
+    )
+
+
+def runtime_stats() -> dict:
+    """Runtime counters (gallery cache, inference pool, pre-filters, encoding cache, streams, attendance writer, punch cache)."""
+    return {
+        "gallery": registry.get_gallery().stats(),
+        "inference": inference.stats(),
+        "liveness": liveness_sessions.stats(),
+        "prefilter": prefilter.stats(),
+        "encoding_cache": inference.encoding_cache_stats() or {},
+        "streams": streams.stats(),
+        "attendance": attendance_db.stats(),
+        "punches": punch_cache.stats(),
+    }
+
+
+@app.route("/api/stats", methods=["GET"])
+def api_stats():
+    return jsonify(runtime_stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape: stage and request latency histograms, rejection counters, runtime gauges."""
+    if not metrics.enabled:
+        return jsonify({"success": False, "message": "Metrics are disabled (METRICS_ENABLED)."}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 503 until the inference pool has warmed up, so a rolling
+    restart never routes a kiosk to a cold process. With WARMUP_ON_START off
+    (models load on first use) it always answers 200.
+    """
+    status = inference.readiness()
+    if not WARMUP_ON_START:
+        status["ready"] = True
+    return jsonify(status), 200 if status["ready"] else 503
+
+
 @app.route("/api/identify", methods=["POST"])
 def api_identify():
-    """Identify face in uploaded image. Optional ?spoof=0 to skip liveness."""
+    """
+    Identify face in uploaded image. Optional ?spoof=0 to skip liveness,
+    ?timings=1 to include per-stage milliseconds in the response.
+    """
     img, err = decode_image_from_request()
     if err:
         return jsonify({"success": False, "message": err}), 400
     run_spoof = request.args.get("spoof", "1") == "1"
-    user_id, name, message, _ = identifier.identify(
-        img, run_spoof_check=run_spoof, require_liveness=run_spoof
+    want_timings = request.args.get("timings") == "1"
+    timings = _request_timings()
+    if timings is None and want_timings:
+        timings = {}
+    rejected_by, message = _prefilter_still(img, lighting=run_spoof)
+    if rejected_by:
+        body = {"success": False, "user_id": None, "name": None, "message": message, "rejected_by": rejected_by}
+        return jsonify(body)
+    user_id, name, message, _ = inference.submit(
+        "identify", img, run_spoof_check=run_spoof, require_liveness=run_spoof, timings=timings, is_rgb=True,
+        lighting_checked=lighting_prefiltered,
     )
-    return jsonify({
+    body = {
         "success": user_id is not None,
         "user_id": user_id,
         "name": name,
         "message": message,
+    }
+    if want_timings:
+        body["timings"] = timings
+    return jsonify(body)
+
+
+@app.route("/api/identify/batch", methods=["POST"])
+def api_identify_batch():
+    """
+    Identify all faces in several frames (or one frame with several faces).
+    Optional ?spoof=0 to skip the lighting check. One result per face.
+    """
+    images, err = decode_images_from_request()
+    if err:
+        return jsonify({"success": False, "message": err}), 400
+    run_spoof = request.args.get("spoof", "1") == "1"
+    results, kept = [], []
+    for i, img in enumerate(images):
+        rejected_by, message = _prefilter_still(img, lighting=run_spoof)
+        if rejected_by:
+            results.append({"frame": i, "user_id": None, "name": None, "message": message,
+                            "face_box": None, "distance": None})
+        else:
+            kept.append(i)
+    if kept:
+        for r in inference.submit(
+            "identify_batch", [images[i] for i in kept], run_spoof_check=run_spoof, is_rgb=True,
+            lighting_checked=lighting_prefiltered, timings=_request_timings(),
+        ):
+            r["frame"] = kept[r["frame"]]
+            results.append(r)
+        results.sort(key=lambda r: r["frame"])
+    return jsonify({
+        "success": any(r["user_id"] is not None for r in results),
+        "results": results,
     })
 
 
-@app.route("/api/punch-in", methods=["POST"])
-def api_punch_in():
+@app.route("/api/liveness/sessions", methods=["POST"])
+def api_liveness_open():
+    """Open a liveness session; stream frames to it until 'confirmed' is true."""
+    session = liveness_sessions.open()
+    body = session.status("Look at the camera and blink once.")
+    body.update({"require_blink": spoof.require_blink, "ttl": liveness_sessions.ttl})
+    return jsonify(body)
+
+
+@app.route("/api/liveness/sessions/<session_id>/frames", methods=["POST"])
+def api_liveness_frame(session_id):
+    """Add one frame to a session. The face is tracked; its identity is reused between re-checks."""
+    session = liveness_sessions.get(session_id)
+    if session is None:
+        return jsonify({"success": False, "message": "Session not found or expired."}), 404
     img, err = decode_image_from_request()
     if err:
         return jsonify({"success": False, "message": err}), 400
-    user_id, name, message, _ = identifier.identify(img, run_spoof_check=True, require_liveness=True)
-    if user_id is None:
-        return jsonify({"success": False, "message": message}), 400
-    attendance_db.punch_in(user_id, name)
-    return jsonify({"success": True, "user_id": user_id, "name": name, "message": f"Punch-in recorded for {name}."})
+    with session.lock:
+        body = _analyze_session_frame(session, img, _request_timings())
+    body["success"] = body["confirmed"]
+    return jsonify(body)
 
 
-@app.route("/api/punch-out", methods=["POST"])
-def api_punch_out():
+@app.route("/api/liveness/sessions/<session_id>", methods=["DELETE"])
+def api_liveness_close(session_id):
+    streams.close(session_id)
+    if liveness_sessions.pop(session_id) is None:
+        return jsonify({"success": False, "message": "Session not found or expired."}), 404
+    return jsonify({"success": True})
+
+
+@app.route("/api/stream", methods=["POST"])
+def api_stream_open():
+    """
+    Open a frame stream (backed by a liveness session). Upload raw JPEG frames
+    to frames_url and read results from events_url (server-sent events).
+    """
+    stream = streams.open()
+    body = stream.session.status("Look at the camera.")
+    body.update({
+        "require_blink": spoof.require_blink,
+        "ttl": liveness_sessions.ttl,
+        "frames_url": url_for("api_stream_frame", stream_id=stream.session.id),
+        "events_url": url_for("api_stream_events", stream_id=stream.session.id),
+    })
+    return jsonify(body)
+
+
+@app.route("/api/stream/<stream_id>/frames", methods=["POST"])
+def api_stream_frame(stream_id):
+    """
+    Queue one frame: the raw image bytes as the body (Content-Type image/jpeg)
+    or multipart 'image'. Returns immediately; an unprocessed earlier frame is
+    replaced, so a slow server skips frames instead of falling behind.
+    """
+    stream = streams.get(stream_id)
+    if stream is None:
+        return jsonify({"success": False, "message": "Stream not found or expired."}), 404
+    if request.files and "image" in request.files:
+        raw = request.files["image"].read()
+    else:
+        raw = request.get_data(cache=False)
+    if not raw:
+        return jsonify({"success": False, "message": "Empty frame."}), 400
+    replaced = streams.push(stream, raw)
+    return jsonify({"success": True, "replaced": replaced}), 202
+
+
+@app.route("/api/stream/<stream_id>/events", methods=["GET"])
+def api_stream_events(stream_id):
+    """Server-sent events: one 'data:' message per processed frame."""
+    stream = streams.get(stream_id)
+    if stream is None:
+        return jsonify({"success": False, "message": "Stream not found or expired."}), 404
+
+    def generate():
+        yield "retry: 1000\n\n"
+        for result in stream.events():
+            if result is None:
+                # idle: stop once the session is gone, else keep the connection open
+                if streams.get(stream_id, touch=False) is None:
+                    break
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {json.dumps(result)}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _punch_session_id() -> str:
+    data = request.get_json(silent=True) or {}
+    return data.get("session_id") or request.form.get("session_id") or request.args.get("session_id")
+
+
+def _identify_for_punch(session_id: str):
+    """
+    Resolve who is punching: from a confirmed liveness session (consumed on
+    use) or by identifying the posted image.
+    Returns (user_id, name, session or None, error_response).
+    """
+    if session_id:
+        streams.close(session_id)
+        session = liveness_sessions.pop(session_id)
+        if session is None:
+            return None, None, None, (jsonify({"success": False, "message": "Session not found or expired."}), 404)
+        if not session.confirmed:
+            return None, None, None, (jsonify({"success": False, "message": "Liveness not confirmed. Please blink and try again."}), 400)
+        return session.user_id, session.name, session, None
     img, err = decode_image_from_request()
     if err:
-        return jsonify({"success": False, "message": err}), 400
-    user_id, name, message, _ = identifier.identify(img, run_spoof_check=True, require_liveness=True)
+        return None, None, None, (jsonify({"success": False, "message": err}), 400)
+    rejected_by, message = _prefilter_still(img)
+    if rejected_by:
+        return None, None, None, (jsonify({"success": False, "message": message}), 400)
+    user_id, name, message, _ = inference.submit(
+        "identify", img, run_spoof_check=True, require_liveness=True, is_rgb=True,
+        lighting_checked=lighting_prefiltered, timings=_request_timings(),
+    )
     if user_id is None:
-        return jsonify({"success": False, "message": message}), 400
-    attendance_db.punch_out(user_id, name)
-    return jsonify({"success": True, "user_id": user_id, "name": name, "message": f"Punch-out recorded for {name}."})
+        return None, None, None, (jsonify({"success": False, "message": message}), 400)
+    return user_id, name, None, None
+
+
+_PUNCH_LABELS = {"punch_in": "Punch-in", "punch_out": "Punch-out"}
+_OUT_OF_ORDER_MESSAGES = {
+    "punch_in": "{name} has not punched out since the last punch-in.",
+    "punch_out": "No punch-in on record for {name}.",
+}
+
+
+def _punch(action: str):
+    """
+    Identify, then record unless punch_cache finds a repeat of the same punch
+    within PUNCH_DEDUPE_WINDOW (answered as already recorded) or refuses an
+    out-of-order one. A retry for an already consumed session gets its
+    original response without recognition.
+    """
+    label = _PUNCH_LABELS[action]
+    session_id = _punch_session_id()
+    if session_id:
+        previous_response = punch_cache.session_response(session_id, action)
+        if previous_response is not None:
+            return jsonify(dict(previous_response, duplicate=True))
+    user_id, name, session, error = _identify_for_punch(session_id)
+    if error:
+        return error
+    verdict, previous = punch_cache.check(user_id, name, action)
+    response = {"success": True, "user_id": user_id, "name": name, "duplicate": False}
+    if verdict == DUPLICATE:
+        response.update(
+            duplicate=True,
+            recorded_at=iso_from_ms(previous[1]),
+            message=f"{label} already recorded for {name}.",
+        )
+    elif verdict == OUT_OF_ORDER and punch_cache.reject_out_of_order:
+        message = _OUT_OF_ORDER_MESSAGES[action].format(name=name)
+        return jsonify({"success": False, "user_id": user_id, "name": name, "message": message}), 409
+    else:
+        record = attendance_db.punch_in if action == "punch_in" else attendance_db.punch_out
+        try:
+            with StageTimer(_request_timings()).stage("db_write"):
+                record(user_id, name)
+        except Exception:
+            punch_cache.rollback(user_id, previous)
+            raise
+        response["message"] = f"{label} recorded for {name}."
+        if session is not None:
+            # a live, closely matched face keeps the user's templates current
+            registry.adapt(user_id, name, session.encoding, session.distance)
+        if verdict == OUT_OF_ORDER:
+            response["warning"] = _OUT_OF_ORDER_MESSAGES[action].format(name=name)
+    if session_id:
+        punch_cache.remember_session(session_id, action, response)
+    return jsonify(response)
+
+
+@app.route("/api/punch-in", methods=["POST"])
+def api_punch_in():
+    return _punch("punch_in")
+
+
+@app.route("/api/punch-out", methods=["POST"])
+def api_punch_out():
+    return _punch("punch_out")
 
 
 if __name__ == "__main__":
-    DATA_DIR.mkdir(exist_ok=True)
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=FLASK_DEBUG, threaded=True)
@@ -0,0 +1,63 @@
+"""
+Face Authentication Attendance System - asynchronous serving mode.
+Run: python asgi.py            (built-in asyncio server, no extra packages)
+     uvicorn asgi:application  (if uvicorn is installed)
+
+The Flask app from app.py, wrapped by face_auth.asgi.AsyncApp: uploads are
+received on the event loop and handlers run in per-group thread pools with
+the ASGI_LIMITS from config.py, so recognition load never delays the light
+endpoints.
+"""
+import argparse
+
+from werkzeug.exceptions import HTTPException
+
+from config import ASGI_HOST, ASGI_LIMITS, ASGI_PORT
+from app import app, create_app, metrics
+from face_auth.asgi import AsyncApp, serve
+
+# Flask endpoint -> ASGI_LIMITS group; anything not listed is "default"
+ENDPOINT_GROUPS = {
+    "api_identify": "recognition",
+    "api_identify_batch": "recognition",
+    "api_punch_in": "recognition",
+    "api_punch_out": "recognition",
+    "api_liveness_frame": "recognition",
+    "api_stream_frame": "recognition",
+    "register_page": "recognition",
+    "api_enroll_bulk": "recognition",
+    "api_stream_events": "events",
+    "api_attendance_export": "export",
+}
+
+_urls = app.url_map.bind("localhost")
+
+
+def _endpoint(method: str, path: str):
+    try:
+        endpoint, _ = _urls.match(path, method)
+    except HTTPException:  # 404 / 405 / redirect: Flask answers it in the default group
+        return None
+    return endpoint
+
+
+application = AsyncApp(
+    app,
+    limits=ASGI_LIMITS,
+    groups=ENDPOINT_GROUPS,
+    route=_endpoint,
+    max_body=app.config.get("MAX_CONTENT_LENGTH"),
+    on_reject=lambda group: metrics.inc("rejections", reason=f"busy_{group}"),
+    startup=create_app,  # the services are built once the server starts, not at import
+)
+metrics.add_collector("asgi", application.stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the attendance app asynchronously.")
+    parser.add_argument("--host", default=ASGI_HOST)
+    parser.add_argument("--port", type=int, default=ASGI_PORT)
+    args = parser.parse_args()
+    application.startup()
+    print(f"Serving on http://{args.host}:{args.port} (async)")
+    serve(application, args.host, args.port)
@@ -0,0 +1,174 @@
+"""
+Punch throughput with concurrent readers: the original per-call connection /
+rollback-journal / commit-per-row storage vs the pooled WAL AttendanceDB with
+group commit.
+
+Writer threads punch as fast as they can (each punch waits for its commit)
+while reader threads load the /attendance page queries in a loop.
+
+    python benchmarks/bench_attendance.py
+    python benchmarks/bench_attendance.py --writers 32 --punches 50 --readers 4 --json attendance.json
+"""
+import argparse
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from face_auth.attendance import AttendanceDB
+
+
+class LegacyAttendanceDB:
+    """The storage layer as it was: new connection per call, one row per transaction."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                "name TEXT NOT NULL, action TEXT NOT NULL, timestamp TEXT NOT NULL, created_at TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_user_id ON attendance(user_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance(timestamp)")
+
+    def _connect(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        return sqlite3.connect(str(self.db_path), timeout=10.0)
+
+    def punch_in(self, user_id: str, name: str) -> bool:
+        now = datetime.utcnow().isoformat() + "Z"
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO attendance (user_id, name, action, timestamp, created_at) VALUES (?, ?, 'punch_in', ?, ?)",
+                    (user_id, name, now, now),
+                )
+        finally:
+            conn.close()
+        return True
+
+    def get_records(self, limit: int = 100):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT id, user_id, name, action, timestamp FROM attendance ORDER BY timestamp DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def get_today_summary(self):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT user_id, name, MAX(timestamp) FROM attendance WHERE date(timestamp) = date(?) GROUP BY user_id, name",
+                (datetime.utcnow().strftime("%Y-%m-%d"),),
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        pass
+
+
+def seed(db, rows: int) -> None:
+    """Pre-populate history so reads do real work."""
+    for i in range(rows):
+        db.punch_in(f"seed{i % 500}", f"Seed {i % 500}")
+
+
+def run_case(db, writers: int, punches: int, readers: int) -> dict:
+    latencies = []
+    lat_lock = threading.Lock()
+    reads = [0]
+    read_errors = [0]
+    done = threading.Event()
+
+    def write(w: int) -> None:
+        mine = []
+        for i in range(punches):
+            start = time.perf_counter()
+            db.punch_in(f"user{w}", f"User {w}")
+            mine.append(time.perf_counter() - start)
+        with lat_lock:
+            latencies.extend(mine)
+
+    def read() -> None:
+        while not done.is_set():
+            try:
+                db.get_records(limit=200)
+                db.get_today_summary()
+                reads[0] += 1
+            except sqlite3.OperationalError:
+                read_errors[0] += 1
+
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+    for t in reader_threads:
+        t.start()
+    start = time.perf_counter()
+    for t in writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in reader_threads:
+        t.join()
+    lat_ms = np.array(latencies) * 1000.0
+    return {
+        "punches": len(latencies),
+        "seconds": elapsed,
+        "punches_per_s": len(latencies) / elapsed,
+        "punch_p50_ms": float(np.percentile(lat_ms, 50)),
+        "punch_p99_ms": float(np.percentile(lat_ms, 99)),
+        "reader_pages_per_s": reads[0] / elapsed,
+        "reader_errors": read_errors[0],
+    }
+
+
+def run(writers: int, punches: int, readers: int, seed_rows: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, factory in (("legacy", LegacyAttendanceDB), ("pooled_wal", AttendanceDB)):
+            db = factory(Path(tmp) / f"{label}.db")
+            seed(db, seed_rows)
+            results[label] = run_case(db, writers, punches, readers)
+            if label == "pooled_wal":
+                results[label]["writer"] = db.stats()
+            db.close()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--punches", type=int, default=50, help="punches per writer thread")
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seed-rows", type=int, default=2000)
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.writers, args.punches, args.readers, args.seed_rows)
+    for label, r in results.items():
+        print(
+            f"{label:>10}: {r['punches_per_s']:8.1f} punches/s  p50 {r['punch_p50_ms']:6.2f} ms  "
+            f"p99 {r['punch_p99_ms']:7.2f} ms  readers {r['reader_pages_per_s']:7.1f} pages/s "
+            f"({r['reader_errors']} errors)"
+        )
+    if "writer" in results.get("pooled_wal", {}):
+        print(f"            group commit: {results['pooled_wal']['writer']}")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
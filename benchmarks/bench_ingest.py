@@ -0,0 +1,114 @@
+"""
+Per-request cost of image ingestion: the old base64 JSON path vs face_auth.ingest.
+
+    legacy: JSON body -> json.loads -> split -> b64decode -> np.frombuffer
+            -> imdecode (BGR) -> cvtColor (RGB copy)
+    ingest: raw image/jpeg body -> readinto pooled buffer -> imdecode
+            (reduced scale for large JPEGs) -> in-place BGR->RGB
+
+Reports milliseconds and peak bytes allocated per request (tracemalloc, which
+also sees numpy/OpenCV arrays) for synthetic JPEG payloads of several sizes.
+
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --sizes 640x480 3840x2160 --json ingest.json
+"""
+import argparse
+import base64
+import io
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from face_auth import ingest
+
+
+def synthetic_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    """A smooth-ish random image (compresses like a camera frame, not like noise)."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def legacy_decode(body: bytes) -> np.ndarray:
+    value = json.loads(body)["image"]
+    raw = base64.b64decode(value.split(",")[-1] if "," in value else value)
+    bgr = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+
+def ingest_decode(body: bytes, max_side: int) -> np.ndarray:
+    with ingest.request_body(io.BytesIO(body), len(body)) as view:
+        rgb, _ = ingest.decode_rgb(view, max_side)
+    return rgb
+
+
+def _measure(fn, repeat: int):
+    fn()  # warm up (and fill the buffer pool)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    ms = (time.perf_counter() - start) / repeat * 1000.0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms, peak
+
+
+def run(sizes, repeat: int = 20, max_side: int = ingest.INGEST_MAX_SIDE) -> list:
+    results = []
+    for width, height in sizes:
+        jpeg = synthetic_jpeg(width, height)
+        json_body = json.dumps({"image": "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()}).encode()
+        legacy_ms, legacy_peak = _measure(lambda: legacy_decode(json_body), repeat)
+        ingest_ms, ingest_peak = _measure(lambda: ingest_decode(jpeg, max_side), repeat)
+        decoded = ingest_decode(jpeg, max_side)
+        results.append({
+            "size": f"{width}x{height}",
+            "jpeg_bytes": len(jpeg),
+            "json_bytes": len(json_body),
+            "decoded_shape": list(decoded.shape),
+            "legacy_ms": legacy_ms,
+            "ingest_ms": ingest_ms,
+            "legacy_peak_bytes": legacy_peak,
+            "ingest_peak_bytes": ingest_peak,
+        })
+    return results
+
+
+def _parse_size(value: str):
+    w, h = value.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_parse_size, nargs="+",
+                        default=[(320, 240), (640, 480), (1280, 720), (1920, 1080), (3840, 2160)])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-side", type=int, default=ingest.INGEST_MAX_SIDE)
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.max_side)
+    for r in results:
+        print(
+            f"{r['size']:>10}  jpeg {r['jpeg_bytes'] / 1024:7.1f} KiB (json {r['json_bytes'] / 1024:7.1f})  "
+            f"legacy {r['legacy_ms']:7.2f} ms {r['legacy_peak_bytes'] / 2**20:6.2f} MiB  |  "
+            f"ingest {r['ingest_ms']:7.2f} ms {r['ingest_peak_bytes'] / 2**20:6.2f} MiB  "
+            f"-> {r['decoded_shape'][1]}x{r['decoded_shape'][0]}"
+        )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Recall / latency benchmark: IVF matcher vs the exact matcher.
+
+Uses synthetic 128-D galleries shaped like dlib embeddings (different people
+~0.9 apart, probes ~0.35 from their enrolled vector).
+
+    python benchmarks/bench_matcher.py --sizes 1000 10000 100000 --nprobe 8 16 32
+    python benchmarks/bench_matcher.py --json results.json
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from face_auth.matcher import ExactMatcher, IVFMatcher
+
+
+def synthetic_gallery(n: int, n_queries: int, seed: int = 0, dim: int = 128):
+    """Return (gallery, queries, true_rows)."""
+    rng = np.random.default_rng(seed)
+    gallery = rng.normal(0.0, 0.9 / np.sqrt(2 * dim), (n, dim))
+    truth = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = gallery[truth] + rng.normal(0.0, 0.35 / np.sqrt(dim), (len(truth), dim))
+    return gallery, queries, truth
+
+
+def _time_per_query(matcher, queries, k: int, batch: bool) -> float:
+    start = time.perf_counter()
+    if batch:
+        matcher.search_batch(queries, k)
+    else:
+        for q in queries:
+            matcher.search(q, k)
+    return (time.perf_counter() - start) / len(queries) * 1000.0
+
+
+def run(sizes, nprobes, n_queries: int = 200, k: int = 2, seed: int = 0) -> list:
+    results = []
+    for n in sizes:
+        gallery, queries, truth = synthetic_gallery(n, n_queries, seed)
+        exact = ExactMatcher().fit(gallery)
+        exact_best = np.array([r.best_index for r in exact.search_batch(queries, k)])
+        row = {
+            "gallery_size": n,
+            "queries": len(queries),
+            "exact_ms_per_query": _time_per_query(exact, queries, k, batch=False),
+            "exact_batch_ms_per_query": _time_per_query(exact, queries, k, batch=True),
+            "exact_recall_at_1": float(np.mean(exact_best == truth)),
+            "ivf": [],
+        }
+        ivf = IVFMatcher(seed=seed)
+        start = time.perf_counter()
+        ivf.fit(gallery)
+        build_s = time.perf_counter() - start
+        for nprobe in nprobes:
+            ivf.nprobe = nprobe
+            ivf_best = np.array([r.best_index for r in ivf.search_batch(queries, k)])
+            row["ivf"].append({
+                "nprobe": nprobe,
+                "nlist": ivf.n_cells,
+                "build_s": build_s,
+                "ms_per_query": _time_per_query(ivf, queries, k, batch=True),
+                "agreement_with_exact": float(np.mean(ivf_best == exact_best)),
+            })
+        results.append(row)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.nprobe, args.queries, args.k, args.seed)
+    for row in results:
+        print(
+            f"N={row['gallery_size']:>8}  exact {row['exact_ms_per_query']:.3f} ms/q "
+            f"(batched {row['exact_batch_ms_per_query']:.3f})  recall@1 {row['exact_recall_at_1']:.3f}"
+        )
+        for r in row["ivf"]:
+            print(
+                f"    ivf nlist={r['nlist']:<5} nprobe={r['nprobe']:<4} {r['ms_per_query']:.3f} ms/q  "
+                f"agreement {r['agreement_with_exact']:.3f}  build {r['build_s']:.2f}s"
+            )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
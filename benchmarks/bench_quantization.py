@@ -0,0 +1,101 @@
+"""
+Accuracy drift vs speed of gallery representations.
+
+Each representation (gallery dtype + matcher quantization) is compared with
+the float64 exact matcher on the same synthetic galleries
+(bench_matcher.synthetic_gallery): how often the best match changes, the
+largest change in reported distance, and how often a decision at
+FACE_MATCH_THRESHOLD flips. Also reports the bytes one full scan reads and
+ms per query (single and batched).
+
+    python benchmarks/bench_quantization.py --sizes 10000 100000
+    python benchmarks/bench_quantization.py --rerank 8 32 --json results.json
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench_matcher import synthetic_gallery
+from config import FACE_MATCH_THRESHOLD
+from face_auth.matcher import ExactMatcher
+
+REPRESENTATIONS = (
+    ("float64", "none"),
+    ("float32", "none"),
+    ("float32", "float16"),
+    ("float32", "int8"),
+)
+
+
+def _ms_per_query(matcher, queries, k: int, batch: bool) -> float:
+    start = time.perf_counter()
+    if batch:
+        matcher.search_batch(queries, k)
+    else:
+        for q in queries:
+            matcher.search(q, k)
+    return (time.perf_counter() - start) / len(queries) * 1000.0
+
+
+def run(sizes, reranks, n_queries: int = 200, k: int = 2, seed: int = 0) -> list:
+    results = []
+    for n in sizes:
+        gallery, queries, truth = synthetic_gallery(n, n_queries, seed)
+        reference = ExactMatcher().fit(gallery).search_batch(queries, k)
+        ref_best = np.array([r.best_index for r in reference])
+        ref_dist = np.array([r.best_distance for r in reference])
+        row = {"gallery_size": n, "queries": len(queries), "representations": []}
+        for dtype, quantization in REPRESENTATIONS:
+            for rerank in reranks if quantization != "none" else (None,):
+                matcher = ExactMatcher(quantization, rerank or 0).fit(gallery.astype(dtype))
+                found = matcher.search_batch(queries, k)
+                best = np.array([r.best_index for r in found])
+                dist = np.array([r.best_distance for r in found])
+                row["representations"].append({
+                    "dtype": dtype,
+                    "quantization": quantization,
+                    "rerank": rerank,
+                    "scan_mb": round(matcher.scan_bytes / 2**20, 2),
+                    "ms_per_query": _ms_per_query(matcher, queries, k, batch=False),
+                    "batch_ms_per_query": _ms_per_query(matcher, queries, k, batch=True),
+                    "agreement_with_float64": float(np.mean(best == ref_best)),
+                    "recall_at_1": float(np.mean(best == truth)),
+                    "max_distance_drift": float(np.abs(dist - ref_dist).max()),
+                    "threshold_flips": int(np.sum((dist <= FACE_MATCH_THRESHOLD) != (ref_dist <= FACE_MATCH_THRESHOLD))),
+                })
+        results.append(row)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 32], help="Re-ranked candidates (0 = none)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.rerank, args.queries, args.k, args.seed)
+    for row in results:
+        print(f"N={row['gallery_size']}")
+        for r in row["representations"]:
+            label = r["dtype"] if r["quantization"] == "none" else f"{r['quantization']} rerank={r['rerank']}"
+            print(
+                f"    {label:<22} scan {r['scan_mb']:>8.2f} MB  {r['ms_per_query']:.3f} ms/q "
+                f"(batched {r['batch_ms_per_query']:.3f})  agreement {r['agreement_with_float64']:.3f}  "
+                f"drift {r['max_distance_drift']:.2e}  flips {r['threshold_flips']}"
+            )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Per-frame detection cost of a tracked stream: a full-frame pass (what every
+streamed frame used to run) vs FaceDetector.detect_roi around the last box
+(what frames between TRACK_FULL_DETECT_EVERY full passes run now).
+
+Uses a synthetic frame, so the detector finds nothing and both paths do their
+whole search; the timings are what matters, not the boxes.
+
+    python benchmarks/bench_tracker.py
+    python benchmarks/bench_tracker.py --size 1280x720 --face 200 --json tracker.json
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config import TRACK_FULL_DETECT_EVERY
+from face_auth.detection import FaceDetector
+
+
+def synthetic_frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def _ms(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", default="640x480", help="Frame WIDTHxHEIGHT")
+    parser.add_argument("--face", type=int, default=160, help="Tracked face box side in pixels")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", type=Path, default=None, help="Also write results here")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    rgb = synthetic_frame(width, height)
+    top, left = (height - args.face) // 2, (width - args.face) // 2
+    box = (top, left + args.face, top + args.face, left)
+    detector = FaceDetector()
+
+    full_ms = _ms(lambda: detector.detect(rgb), args.repeat)
+    roi_ms = _ms(lambda: detector.detect_roi(rgb, box), args.repeat)
+    n = max(1, TRACK_FULL_DETECT_EVERY)
+    tracked_ms = (full_ms + (n - 1) * roi_ms) / n
+    result = {
+        "size": args.size,
+        "face_px": args.face,
+        "full_ms": round(full_ms, 2),
+        "roi_ms": round(roi_ms, 2),
+        "full_every": n,
+        "tracked_avg_ms": round(tracked_ms, 2),
+        "speedup": round(full_ms / tracked_ms, 2) if tracked_ms else None,
+    }
+    print(
+        f"{args.size} face {args.face}px: full {full_ms:.1f} ms, roi {roi_ms:.1f} ms, "
+        f"tracked stream (1 full / {n}) {tracked_ms:.1f} ms/frame ({result['speedup']}x)"
+    )
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Load test: do light endpoints stay fast while recognition is saturated?
+
+Starts the app in a subprocess against a temporary data directory (seeded
+with a synthetic gallery), or targets a running server with --url. Two
+phases of --duration seconds each:
+
+    idle       --light clients polling /api/users and /api/attendance
+    saturated  the same, plus --heavy clients posting frames to
+               /api/identify back to back
+
+For each phase it reports p50/p95/p99/max latency of the light requests and
+status counts for both kinds. Run it once per serving mode to compare.
+
+    python benchmarks/load_test.py --server asgi
+    python benchmarks/load_test.py --server flask --heavy 32
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --json load.json
+"""
+import argparse
+import http.client
+import json
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import sys
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+LIGHT_PATHS = ("/api/users", "/api/attendance?limit=50")
+
+
+def _serve_child(kind: str, port: int, workdir: Path, gallery_size: int) -> None:
+    """Inside the server subprocess: isolate data, seed the gallery, serve."""
+    from suite import _isolate, _seed_registry
+
+    _isolate(workdir)
+    import app as web
+
+    web.create_app()
+    _seed_registry(web.registry, gallery_size)
+    if kind == "flask":
+        web.app.run(host="127.0.0.1", port=port, threaded=True)
+    else:
+        import asgi
+        from face_auth.asgi import serve
+
+        serve(asgi.application, "127.0.0.1", port)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(host: str, port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request("GET", "/ready")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server on {host}:{port} not ready after {timeout:.0f}s")
+
+
+class _Client(threading.Thread):
+    """Sends one kind of request in a loop until `stop`; records (latency ms, status)."""
+
+    def __init__(self, host: str, port: int, make_request, stop: threading.Event, pause: float = 0.0):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.make_request = make_request
+        self.stop = stop
+        self.pause = pause
+        self.samples = []
+
+    def run(self) -> None:
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        i = 0
+        while not self.stop.is_set():
+            method, path, body, headers = self.make_request(i)
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                status = "error"
+            self.samples.append(((time.perf_counter() - start) * 1000.0, status))
+            if self.pause:
+                self.stop.wait(self.pause)
+        conn.close()
+
+
+def _summary(samples) -> dict:
+    latencies = sorted(ms for ms, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    if not latencies:
+        return {"n": 0, "statuses": statuses}
+
+    def pct(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2)
+
+    return {
+        "n": len(latencies),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(latencies[-1], 2),
+        "statuses": statuses,
+    }
+
+
+def run_phase(host: str, port: int, light: int, heavy: int, duration: float, frames: list) -> dict:
+    stop = threading.Event()
+
+    def light_request(i):
+        return "GET", LIGHT_PATHS[i % len(LIGHT_PATHS)], None, {}
+
+    def heavy_request(i):
+        return "POST", "/api/identify", frames[i % len(frames)], {"Content-Type": "image/jpeg"}
+
+    light_clients = [_Client(host, port, light_request, stop, pause=0.05) for _ in range(light)]
+    heavy_clients = [_Client(host, port, heavy_request, stop) for _ in range(heavy)]
+    for client in heavy_clients + light_clients:
+        client.start()
+    time.sleep(duration)
+    stop.set()
+    for client in heavy_clients + light_clients:
+        client.join()
+    heavy_samples = [s for c in heavy_clients for s in c.samples]
+    result = {"light": _summary([s for c in light_clients for s in c.samples])}
+    if heavy:
+        result["heavy"] = dict(_summary(heavy_samples), requests_per_s=round(len(heavy_samples) / duration, 1))
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["asgi", "flask"], default="asgi", help="Serving mode to start")
+    parser.add_argument("--url", default=None, help="Test a running server instead of starting one")
+    parser.add_argument("--light", type=int, default=4, help="Clients polling light endpoints")
+    parser.add_argument("--heavy", type=int, default=16, help="Clients posting frames to /api/identify")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per phase")
+    parser.add_argument("--gallery", type=int, default=1000, help="Synthetic users seeded into a started server")
+    parser.add_argument("--faces", type=Path, default=None, help="Directory of face photos to post")
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    parser.add_argument("--serve-child", nargs=3, metavar=("KIND", "PORT", "DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve_child:
+        kind, port, workdir = args.serve_child
+        _serve_child(kind, int(port), Path(workdir), args.gallery)
+        return 0
+
+    from suite import fixture_frames
+
+    frames = fixture_frames(8, args.faces)
+    process = None
+    tmp = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="face_auth_load_")
+        host, port = "127.0.0.1", _free_port()
+        process = subprocess.Popen(
+            [sys.executable, __file__, "--gallery", str(args.gallery), "--serve-child", args.server, str(port), tmp.name],
+            cwd=ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    try:
+        _wait_ready(host, port, timeout=180)
+        results = {
+            "server": args.url or args.server,
+            "light_clients": args.light,
+            "heavy_clients": args.heavy,
+            "duration_s": args.duration,
+            "idle": run_phase(host, port, args.light, 0, args.duration, frames),
+            "saturated": run_phase(host, port, args.light, args.heavy, args.duration, frames),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+            tmp.cleanup()
+
+    for phase in ("idle", "saturated"):
+        light = results[phase]["light"]
+        line = (
+            f"{phase:<10} light p50 {light.get('p50_ms')} ms  p95 {light.get('p95_ms')} ms  "
+            f"p99 {light.get('p99_ms')} ms  max {light.get('max_ms')} ms  {light['statuses']}"
+        )
+        heavy = results[phase].get("heavy")
+        if heavy:
+            line += f"\n{'':<10} identify {heavy['requests_per_s']} req/s  p50 {heavy.get('p50_ms')} ms  {heavy['statuses']}"
+        print(line)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+Benchmark suite: one run over the recognition and attendance pipelines,
+written as a single JSON document so runs before and after a change (e.g. to
+MODEL, NUM_JITTERS, DETECTION_SCALE or MATCHER in config.py) can be compared.
+
+Sections:
+    gallery   store load (FaceRegistry.get_all_encodings) and resident
+              gallery build, per synthetic gallery size
+    identify  FaceIdentifier.identify per-stage latency (p50/p95 per stage)
+              on fixture frames, plus landmarks/encode on a fixed face box
+    matcher   exact (and IVF) queries/s against gallery size
+    attendance  AttendanceDB punch throughput with concurrent writers, and
+              today's summary / history page latency
+    http      end-to-end Flask requests through app.test_client()
+
+Galleries are random 128-D embeddings shaped like dlib's (see
+bench_matcher.synthetic_gallery). Fixture frames are camera-like JPEGs
+composed from the portrait in fixtures/astronaut.jpg (NASA photo of Eileen
+Collins, public domain, as shipped with scikit-image) at a different
+position, scale and exposure each, so identify runs detection, landmarks,
+encoding and matching, and the encoding cache can hit; point --faces at a
+directory of face photos to use those instead. Everything runs against a
+temporary data directory; the repo's data/ is not touched.
+
+    python benchmarks/suite.py --json before.json
+    python benchmarks/suite.py --quick --sections matcher attendance
+    python benchmarks/suite.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import sys
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import config
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+SECTIONS = ("gallery", "identify", "matcher", "attendance", "http")
+CONFIG_KEYS = (
+    "MODEL", "NUM_JITTERS", "FACE_MATCH_THRESHOLD", "DETECTION_SCALE", "DETECTION_UPSAMPLE",
+    "DETECTION_FALLBACK_SCALES", "MATCHER", "MATCH_TOP_K", "IVF_NPROBE", "MAX_TEMPLATES_PER_USER",
+    "MATCH_CANDIDATES", "INGEST_MAX_SIDE", "PREFILTERS", "ENCODING_CACHE_ENABLED", "INFERENCE_WORKERS", "EMBEDDING_STORE",
+    "EMBEDDING_DTYPE", "GALLERY_DTYPE", "MATCH_QUANTIZATION", "MATCH_RERANK",
+)
+
+
+def _isolate(workdir: Path) -> None:
+    """Point every data path at workdir. Must run before face_auth is imported."""
+    if "face_auth" in sys.modules:
+        raise RuntimeError("face_auth was imported before the benchmark data directory was set")
+    config.DATA_DIR = workdir
+    config.EMBEDDINGS_DIR = workdir / "embeddings"
+    config.DB_PATH = workdir / "attendance.db"
+    config.ATTENDANCE_ARCHIVE_DIR = workdir / "archive"
+    config.EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def _ms_summary(samples_ms) -> dict:
+    samples = sorted(samples_ms)
+    if not samples:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def _timed_ms(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000.0
+
+
+def fixture_frames(n: int, faces_dir=None, size=(640, 480)) -> list:
+    """JPEG bytes: the images in faces_dir if given, else n frames composed by face_frames()."""
+    if faces_dir:
+        paths = sorted(p for p in Path(faces_dir).iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+        if not paths:
+            raise SystemExit(f"No .jpg/.png images in {faces_dir}")
+        return [p.read_bytes() for p in paths[:n] or paths]
+    return face_frames(n, size)
+
+
+def face_frames(n: int, size=(640, 480), seed: int = 0) -> list:
+    """
+    n JPEG frames, each the fixture portrait pasted at a random position,
+    scale and exposure onto a smooth random background (like
+    bench_ingest.synthetic_jpeg), so every frame has one detectable face.
+    """
+    import cv2
+
+    portrait = cv2.imread(str(FIXTURES_DIR / "astronaut.jpg"))
+    width, height = size
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n):
+        small = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+        frame = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        scale = rng.uniform(1.1, 1.5)
+        face = cv2.resize(portrait, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        face = cv2.convertScaleAbs(face, alpha=rng.uniform(0.85, 1.15), beta=rng.uniform(-15, 15))
+        h, w = min(face.shape[0], height), min(face.shape[1], width)
+        y, x = int(rng.integers(0, height - h + 1)), int(rng.integers(0, width - w + 1))
+        frame[y:y + h, x:x + w] = face[:h, :w]
+        frames.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return frames
+
+
+def _seed_registry(registry, n: int, seed: int = 0) -> None:
+    from bench_matcher import synthetic_gallery
+
+    gallery, _, _ = synthetic_gallery(n, 1, seed)
+    registry.register_many([(f"user{i:07d}", f"User {i}", row) for i, row in enumerate(gallery)])
+
+
+def bench_gallery(workdir: Path, sizes, repeat: int) -> list:
+    from face_auth.face_registry import FaceRegistry
+
+    results = []
+    for n in sizes:
+        directory = workdir / f"gallery_{n}"
+        writer = FaceRegistry(directory)
+        write_ms = _timed_ms(lambda: _seed_registry(writer, n))
+        load, build = [], []
+        for _ in range(repeat):
+            reader = FaceRegistry(directory, detector=writer.detector, encoder=writer.encoder)
+            load.append(_timed_ms(reader.get_all_encodings))
+            build.append(_timed_ms(reader.get_gallery))
+        results.append({
+            "gallery_size": n,
+            "write_ms": round(write_ms, 2),
+            "get_all_encodings": _ms_summary(load),
+            "gallery_build": _ms_summary(build),
+        })
+    return results
+
+
+def bench_identify(workdir: Path, frames: list, gallery_size: int, repeat: int) -> dict:
+    from face_auth import ingest
+    from face_auth.face_identifier import FaceIdentifier
+    from face_auth.face_registry import FaceRegistry
+
+    registry = FaceRegistry(workdir / "identify")
+    _seed_registry(registry, gallery_size)
+    identifier = FaceIdentifier(registry=registry)
+    decoded = [ingest.decode_rgb(f)[0] for f in frames]
+    stages, totals, outcomes = {}, [], {}
+    for _ in range(repeat):
+        for rgb in decoded:
+            if identifier.encoding_cache is not None:
+                identifier.encoding_cache.clear()  # time the full pipeline, not a repeat
+            timings = {}
+            start = time.perf_counter()
+            _, _, message, _ = identifier.identify(rgb, timings=timings, is_rgb=True)
+            totals.append((time.perf_counter() - start) * 1000.0)
+            outcomes[message] = outcomes.get(message, 0) + 1
+            for stage, ms in timings.items():
+                if stage not in ("detect_scale", "detect_passes"):
+                    stages.setdefault(stage, []).append(ms)
+
+    # a resent frame: detected again, but its encoding comes from the cache (needs a real face to hit)
+    hit_ms = []
+    if identifier.encoding_cache is not None:
+        for rgb in decoded:
+            identifier.identify(rgb, is_rgb=True)
+            timings = {}
+            start = time.perf_counter()
+            identifier.identify(rgb, timings=timings, is_rgb=True)
+            if "cache" in timings and "encode" not in timings:
+                hit_ms.append((time.perf_counter() - start) * 1000.0)
+
+    # landmarks + encoding on a fixed central box, so they are timed even without a real face
+    rgb = decoded[0]
+    h, w = rgb.shape[:2]
+    side = min(h, w) // 2
+    box = ((h - side) // 2, (w + side) // 2, (h + side) // 2, (w - side) // 2)
+    shapes_ms, encode_ms = [], []
+    for _ in range(max(3, repeat)):
+        start = time.perf_counter()
+        shapes = identifier.encoder.shapes(rgb, [box], with_landmarks=True)
+        mid = time.perf_counter()
+        identifier.encoder.encode(rgb, shapes)
+        shapes_ms.append((mid - start) * 1000.0)
+        encode_ms.append((time.perf_counter() - mid) * 1000.0)
+    return {
+        "frames": len(frames),
+        "frame_shape": list(decoded[0].shape),
+        "gallery_size": gallery_size,
+        "total": _ms_summary(totals),
+        "stages": {stage: _ms_summary(v) for stage, v in stages.items()},
+        "outcomes": outcomes,
+        "cache_hit": _ms_summary(hit_ms) if hit_ms else None,
+        "box_landmarks": _ms_summary(shapes_ms),
+        "box_encode": _ms_summary(encode_ms),
+    }
+
+
+def bench_matcher(sizes, n_queries: int, nprobe: int) -> list:
+    from bench_matcher import synthetic_gallery
+    from face_auth.matcher import ExactMatcher, IVFMatcher
+
+    results = []
+    for n in sizes:
+        gallery, queries, truth = synthetic_gallery(n, n_queries)
+        row = {"gallery_size": n, "queries": len(queries)}
+        for kind, matcher in (("exact", ExactMatcher()), ("ivf", IVFMatcher(nprobe=nprobe))):
+            if kind == "ivf" and n < 1000:
+                continue
+            fit_ms = _timed_ms(lambda: matcher.fit(gallery))
+            single_ms = _timed_ms(lambda: [matcher.search(q, 2) for q in queries])
+            batch_ms = _timed_ms(lambda: matcher.search_batch(queries, 2))
+            best = np.array([m.best_index for m in matcher.search_batch(queries, 2)])
+            row[kind] = {
+                "fit_ms": round(fit_ms, 2),
+                "queries_per_s": round(len(queries) / (single_ms / 1000.0), 1),
+                "batch_queries_per_s": round(len(queries) / (batch_ms / 1000.0), 1),
+                "recall_at_1": float(np.mean(best == truth)),
+            }
+        results.append(row)
+    return results
+
+
+def bench_attendance(workdir: Path, writers: int, punches: int, repeat: int) -> dict:
+    from face_auth.attendance import AttendanceDB
+
+    db = AttendanceDB(workdir / "bench_attendance.db")
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(w: int) -> None:
+        mine = []
+        for i in range(punches):
+            record = db.punch_in if i % 2 == 0 else db.punch_out
+            mine.append(_timed_ms(lambda: record(f"user{w:05d}", f"User {w}")))
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(writers) as pool:
+        list(pool.map(writer, range(writers)))
+    elapsed = time.perf_counter() - start
+    summary = [_timed_ms(db.get_today_summary) for _ in range(repeat)]
+    page = [_timed_ms(lambda: db.get_records_page(limit=100)) for _ in range(repeat)]
+    result = {
+        "writers": writers,
+        "punches": writers * punches,
+        "punches_per_s": round(writers * punches / elapsed, 1),
+        "punch": _ms_summary(latencies),
+        "today_summary": _ms_summary(summary),
+        "history_page": _ms_summary(page),
+        "writer": db.stats(),
+    }
+    db.close()
+    return result
+
+
+def bench_http(frames: list, gallery_size: int, requests: int, concurrency: int) -> dict:
+    import app as web
+
+    client = web.create_app().test_client()
+    _seed_registry(web.registry, gallery_size)
+    cases = {
+        "identify": lambda i: client.post("/api/identify", data=frames[i % len(frames)], content_type="image/jpeg"),
+        "attendance_page": lambda i: client.get("/api/attendance?limit=50"),
+        "stats": lambda i: client.get("/api/stats"),
+    }
+    results = {}
+    for name, call in cases.items():
+        call(0)  # warm up
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+
+        def one(i: int) -> None:
+            start = time.perf_counter()
+            status = call(i).status_code
+            ms = (time.perf_counter() - start) * 1000.0
+            with lock:
+                latencies.append(ms)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - start
+        results[name] = dict(
+            _ms_summary(latencies),
+            requests_per_s=round(requests / elapsed, 1),
+            statuses={str(k): v for k, v in statuses.items()},
+        )
+    results["concurrency"] = concurrency
+    web.attendance_db.close()
+    web.inference.shutdown()
+    return results
+
+
+def _metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _flatten(value, prefix: str = "") -> dict:
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+        return out
+    if isinstance(value, list):
+        out = {}
+        for i, v in enumerate(value):
+            key = v.get("gallery_size", i) if isinstance(v, dict) else i
+            out.update(_flatten(v, f"{prefix}[{key}]"))
+        return out
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(old_path: Path, new_path: Path) -> int:
+    """Print every numeric result present in both runs with the new/old ratio."""
+    old = json.loads(old_path.read_text(encoding="utf-8"))
+    new = json.loads(new_path.read_text(encoding="utf-8"))
+    changed = {k: (old["config"].get(k), v) for k, v in new["config"].items() if old["config"].get(k) != v}
+    print(f"{old_path} ({old['meta'].get('commit')}) -> {new_path} ({new['meta'].get('commit')})")
+    for key, (a, b) in changed.items():
+        print(f"  config {key}: {a} -> {b}")
+    a, b = _flatten(old["results"]), _flatten(new["results"])
+    for key in sorted(set(a) & set(b)):
+        ratio = f"{b[key] / a[key]:6.2f}x" if a[key] else "     -"
+        print(f"  {key:<60} {a[key]:>12.3f} {b[key]:>12.3f} {ratio}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--quick", action="store_true", help="Small sizes and few repeats (smoke run)")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=None)
+    parser.add_argument("--matcher-sizes", type=int, nargs="+", default=None)
+    parser.add_argument("--faces", type=Path, default=None, help="Directory of face photos to use as fixture frames")
+    parser.add_argument("--frames", type=int, default=8, help="Synthetic fixture frames")
+    parser.add_argument("--repeat", type=int, default=None)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--punches", type=int, default=50, help="Punches per writer thread")
+    parser.add_argument("--requests", type=int, default=None, help="HTTP requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    args = parser.parse_args(argv)
+    if args.compare:
+        return compare(*args.compare)
+
+    quick = args.quick
+    gallery_sizes = args.gallery_sizes or ([1000, 10000] if quick else [1000, 10000, 100000])
+    matcher_sizes = args.matcher_sizes or ([1000, 10000] if quick else [1000, 10000, 100000])
+    repeat = args.repeat or (3 if quick else 10)
+    requests = args.requests or (20 if quick else 200)
+    if quick:
+        args.writers, args.punches, args.frames = min(args.writers, 4), min(args.punches, 10), min(args.frames, 2)
+
+    with tempfile.TemporaryDirectory(prefix="face_auth_bench_") as tmp:
+        workdir = Path(tmp)
+        _isolate(workdir)
+        frames = fixture_frames(args.frames, args.faces)
+        results = {}
+        if "gallery" in args.sections:
+            results["gallery"] = bench_gallery(workdir, gallery_sizes, repeat)
+        if "identify" in args.sections:
+            results["identify"] = bench_identify(workdir, frames, gallery_sizes[0], repeat)
+        if "matcher" in args.sections:
+            results["matcher"] = bench_matcher(matcher_sizes, 200, config.IVF_NPROBE)
+        if "attendance" in args.sections:
+            results["attendance"] = bench_attendance(workdir, args.writers, args.punches, repeat)
+        if "http" in args.sections:
+            results["http"] = bench_http(frames, gallery_sizes[0], requests, args.concurrency)
+
+    report = {
+        "meta": _metadata(),
+        "config": {k: getattr(config, k) for k in CONFIG_KEYS if hasattr(config, k)},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, default=str)
+    if args.json:
+        args.json.write_text(text, encoding="utf-8")
+        print(f"Wrote {args.json}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
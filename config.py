@@ -8,11 +8,61 @@ DATA_DIR = BASE_DIR / "data"
 EMBEDDINGS_DIR = DATA_DIR / "embeddings"
 DB_PATH = DATA_DIR / "attendance.db"
 
+# Embedding storage: "packed" (single memory-mapped file + sidecar) or
+# "files" (legacy one .npy/.json per user). A new packed store imports the
+# legacy files found in EMBEDDINGS_DIR on first start.
+EMBEDDING_STORE = "packed"
+
+# Embedding precision. New packed stores keep rows as EMBEDDING_DTYPE (an
+# existing store keeps its own until `python -m face_auth.embedding_store
+# convert --dtype ...`); the resident gallery is GALLERY_DTYPE. dlib
+# descriptors need far less than float32 precision, so float32 halves memory
+# and matching time with no change in results (benchmarks/bench_quantization.py).
+EMBEDDING_DTYPE = "float32"  # "float64", "float32" or "float16"
+GALLERY_DTYPE = "float32"  # "float64" or "float32"
+
 # Face recognition settings
 FACE_MATCH_THRESHOLD = 0.5  # Lower = stricter (default 0.6 in face_recognition)
 NUM_JITTERS = 1  # More jitters = more accurate but slower
 MODEL = "hog"  # "hog" (faster) or "cnn" (more accurate, needs GPU)
 
+# Detection pipeline: detect on a frame scaled by DETECTION_SCALE with
+# DETECTION_UPSAMPLE pyramid steps, then encode at full resolution. If no face
+# is found, retry at each DETECTION_FALLBACK_SCALES entry in order.
+# (scale 1.0, upsample 1, no fallback = the original full-frame detector.)
+DETECTION_SCALE = 0.5
+DETECTION_UPSAMPLE = 1
+DETECTION_FALLBACK_SCALES = (1.0,)
+
+# Image ingestion: JPEG uploads whose long side is at least 2x this are decoded
+# at 1/2, 1/4 or 1/8 scale (never below this size); 0 = always decode full size
+INGEST_MAX_SIDE = 1280
+
+# Gallery matching: "exact" (brute force, one matmul) or "ivf" (approximate,
+# for galleries of 100k+ users; see benchmarks/bench_matcher.py to choose)
+MATCHER = "exact"
+MATCH_TOP_K = 2  # candidates returned per face (>= 2 gives margin to second best)
+IVF_NLIST = 0  # k-means cells; 0 = about 4 * sqrt(gallery size)
+IVF_NPROBE = 16  # cells scanned per query; higher = better recall, slower
+MATCH_QUANTIZATION = "none"  # "int8" (1/4 the scan memory of float32) or "float16": scan a quantized copy...
+MATCH_RERANK = 32  # ...and re-score this many best candidates exactly
+MAX_BATCH_FRAMES = 16  # frames accepted by one /api/identify/batch request
+
+# Templates per identity: each user keeps up to MAX_TEMPLATES_PER_USER
+# embeddings (registrations, plus confirmed punches that matched closely);
+# the most redundant is evicted beyond that. Matching short-lists
+# MATCH_CANDIDATES users by centroid, then compares their templates.
+MAX_TEMPLATES_PER_USER = 5
+MATCH_CANDIDATES = 8
+TEMPLATE_ADAPT_DISTANCE = 0.4  # a punch matched at most this far may become a template...
+TEMPLATE_MIN_NOVELTY = 0.15  # ...if it is at least this far from every existing one
+
+# Bulk enrollment (python -m face_auth.enrollment, POST /api/enroll/bulk)
+ENROLL_WORKERS = 0  # encoder processes; 0 = one per CPU
+ENROLL_OUTLIER_DISTANCE = 0.5  # a user's image this far from the user's median encoding is left out
+ENROLL_ZIP_MAX_FILES = 10000  # an uploaded archive with more members is refused
+ENROLL_ZIP_MAX_BYTES = 512 * 1024 * 1024  # ...or one that would extract to more than this
+
 # Spoof prevention (blink requires multiple frames; single snapshot uses lighting only)
 REQUIRE_BLINK = False
 BLINK_EAR_THRESHOLD = 0.25  # Eye aspect ratio threshold for blink
@@ -20,11 +70,100 @@ BLINK_FRAMES_REQUIRED = 2
 MIN_BRIGHTNESS = 30  # Reject too-dark frames
 MAX_BRIGHTNESS = 220  # Reject overexposed
 
+# Pre-filters (face_auth/prefilter.py): cheap checks on a small grayscale
+# thumbnail that reject unusable frames before detection, in this order.
+# "lighting" uses MIN_BRIGHTNESS / MAX_BRIGHTNESS; "change" applies to
+# streamed frames only.
+PREFILTERS = ("lighting", "change", "blur")
+PREFILTER_THUMB_WIDTH = 160  # pixels; the frame is strided down to about this width
+MIN_SHARPNESS = 15.0  # variance of the thumbnail's Laplacian; below this the frame is too blurred
+MIN_FRAME_CHANGE = 2.0  # gray levels a thumbnail cell must move since the last analyzed frame
+PREFILTER_MAX_UNCHANGED = 5  # unchanged frames skipped in a row at most, then one is analyzed anyway
+
+# Encoding cache (face_auth/encoding_cache.py): a face detected in a resent or
+# near-identical single-shot frame reuses the encoding computed for the same
+# face crop and is only matched against the gallery again (not used with
+# REQUIRE_BLINK)
+ENCODING_CACHE_ENABLED = True
+ENCODING_CACHE_MAX_BYTES = 4 * 1024 * 1024  # hard cap, about 1.3 KiB per entry
+ENCODING_CACHE_TTL = 30  # seconds an entry may be reused
+ENCODING_CACHE_MAX_DISTANCE = 16  # bits of the 256-bit face-crop hash that may differ on a hit
+ENCODING_CACHE_MIN_IOU = 0.6  # overlap the cached and detected face boxes need on a hit
+
+# Liveness sessions (a client streams frames to one session until a blink is seen)
+LIVENESS_SESSION_TTL = 30  # seconds after the last frame before a session expires
+LIVENESS_MAX_SESSIONS = 256  # least recently used sessions are dropped beyond this
+LIVENESS_HISTORY = 30  # EAR values kept per session (ring buffer)
+LIVENESS_MIN_IOU = 0.3  # face box overlap between frames; below this it is a different face (new track)
+LIVENESS_FACE_LOST_SECONDS = 1.0  # no face for this long and the session restarts
+
+# Face tracking within a session (face_auth/tracker.py): frames between full
+# detections search only around the last face, and a matched identity is
+# reused until it is re-checked
+TRACK_FULL_DETECT_EVERY = 10  # frames; every Nth frame runs the full-frame detector
+TRACK_ROI_MARGIN = 0.5  # search region = last box grown by this fraction of its size per side
+TRACK_ROI_FACE_PX = 100  # the region is scaled so the face is about this many pixels wide
+TRACK_IDENTITY_TTL = 3.0  # seconds a track's identity is reused before it is matched again
+TRACK_RETRY_INTERVAL = 0.5  # seconds between identity attempts for an unmatched face
+TRACK_MAX_MISSES = 3  # frames a track survives without a matching detection
+
+# Frame streaming (attend page uploads raw JPEG frames, results come back over SSE)
+STREAM_CONSUMERS = 2  # threads that process streamed frames (shared by all streams)
+STREAM_MAX_FRAME_AGE = 0.5  # seconds; older frames are dropped instead of processed
+STREAM_RESULT_BUFFER = 8  # results kept per stream for a slow event reader
+
+# Serving
+FLASK_DEBUG = False  # debug reloader forks a second process; keep off for kiosks
+INFERENCE_WORKERS = 0  # recognition worker processes; 0 = run in the request thread
+INFERENCE_QUEUE_SIZE = 8  # requests allowed to wait for a worker before 429
+
+# Async serving (python asgi.py): the same app behind an asyncio server.
+# Uploads are received without holding a thread; each endpoint group runs its
+# handlers in its own thread pool, at most (concurrent, waiting) requests,
+# beyond which it answers 429. Recognition load cannot delay the other groups.
+ASGI_HOST = "0.0.0.0"
+ASGI_PORT = 5000
+ASGI_LIMITS = {
+    "recognition": (8, 16),  # identify, punch, liveness / stream frames, registration, bulk enroll
+    "events": (64, 0),  # open server-sent event streams (one thread each while open)
+    "export": (2, 4),  # attendance exports
+    "default": (16, 64),  # pages, users, attendance, stats, metrics, ready
+}
+
+# Metrics (GET /metrics in the Prometheus text format)
+METRICS_ENABLED = True  # False: no per-request timings are collected and /metrics answers 404
+METRICS_SERVER_TIMING = False  # True: every response carries a Server-Timing header with stage ms
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # seconds
+
+# Startup: the dlib models load on first use, not at import. With
+# WARMUP_ON_START a background thread loads them (in every inference worker)
+# plus the gallery and runs one dummy inference; GET /ready answers 503 until
+# that is done, so a load balancer only sends warm traffic.
+WARMUP_ON_START = True
+
+# Attendance database (WAL; one writer thread group-commits punches)
+ATTENDANCE_READ_POOL = 4  # pooled read connections
+ATTENDANCE_COMMIT_WINDOW = 0.005  # seconds a batch stays open for more punches
+ATTENDANCE_MAX_BATCH = 256  # punches per transaction at most
+ATTENDANCE_PAGE_MAX = 1000  # largest page /api/attendance returns
+EXPORT_CHUNK_ROWS = 5000  # rows per keyset query / output chunk in exports
+# History is partitioned by month; `python -m face_auth.attendance archive`
+# moves closed months into read-only files here
+ATTENDANCE_ARCHIVE_DIR = DATA_DIR / "archive"
+ATTENDANCE_MAX_ATTACHED = 8  # archive files kept attached per read connection
+
+# Punch de-duplication (in memory, per process; warmed from daily_presence)
+PUNCH_DEDUPE_WINDOW = 60  # seconds: a repeat of the same punch within this is coalesced
+PUNCH_STATE_TTL = 16 * 3600  # seconds a user's last punch is remembered
+PUNCH_REJECT_OUT_OF_ORDER = False  # True: refuse punch-out with no punch-in (and vice versa); False: warn
+
 # Camera
 CAMERA_INDEX = 0
 FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
 
-# Ensure directories exist
-DATA_DIR.mkdir(exist_ok=True)
-EMBEDDINGS_DIR.mkdir(exist_ok=True)
+
+def ensure_data_dirs() -> None:
+    """Create the data directories (the app calls this at startup; importing config has no side effects)."""
+    DATA_DIR.mkdir(exist_ok=True)
+    EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
@@ -1,7 +1,28 @@
-"""Face Authentication Attendance System - core modules."""
-from .face_registry import FaceRegistry
-from .face_identifier import FaceIdentifier
-from .spoof_detection import SpoofDetector
-from .attendance import AttendanceDB
+"""Face Authentication Attendance System - core modules.
+
+The classes below are imported on first access, so `import face_auth` (or a
+submodule such as face_auth.ingest) does not pull in the whole pipeline.
+"""
+import importlib
+
+_EXPORTS = {
+    "FaceRegistry": ".face_registry",
+    "FaceIdentifier": ".face_identifier",
+    "SpoofDetector": ".spoof_detection",
+    "AttendanceDB": ".attendance",
+}
 
 __all__ = ["FaceRegistry", "FaceIdentifier", "SpoofDetector", "AttendanceDB"]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,462 @@
+"""
+Asynchronous serving of the WSGI (Flask) app: an ASGI wrapper and a small
+asyncio HTTP/1.1 server.
+
+Under app.run every request holds a server thread from the first byte of
+its upload to the last byte of its response, so slow uploads and busy
+recognition can leave no thread for /api/users or /attendance. AsyncApp
+changes where the waiting happens:
+
+- the request body is received on the event loop, so a slow upload holds
+  no thread;
+- the route's endpoint picks a group (recognition, events, export,
+  default). Each group has its own thread pool, where the Flask handler
+  runs (image decoding, recognition, SQLite), and its own limits: at most
+  `concurrency` requests run and `waiting` more queue. Beyond that the
+  request is answered 429 without entering Flask, so recognition load can
+  never take the threads that serve light endpoints;
+- a response without Content-Length (server-sent events, exports) is pulled
+  from the WSGI iterable one chunk at a time in the group's pool, and the
+  iterable is closed when the client goes away.
+
+Routes, JSON contracts and the app's own hooks (metrics, 429 on a full
+inference pool) are unchanged: it is the same Flask app.
+
+serve() runs any ASGI app on asyncio alone (no extra dependencies); where
+uvicorn or hypercorn is installed, `uvicorn asgi:application` works too.
+"""
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import unquote
+
+_END = object()
+_BUSY_BODY = b'{"message":"Server is busy. Please retry in a moment.","success":false}'
+
+
+class _Group:
+    """One endpoint group: its thread pool, admission limit and counters."""
+
+    def __init__(self, name: str, concurrency: int, waiting: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.capacity = concurrency + waiting
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"asgi-{name}")
+        self.pending = 0  # running + waiting; only touched on the event loop
+        self.completed = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "capacity": self.capacity,
+            "pending": self.pending,
+            "waiting": max(0, self.pending - self.concurrency),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+def _environ(scope: dict, body: bytes) -> dict:
+    """PEP 3333 environ for an ASGI http scope whose body has been received."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client")
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0] if client else "",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").lower()
+        value = raw_value.decode("latin-1")
+        if name == "content-length":
+            continue  # the received body is authoritative
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+            continue
+        key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _start_wsgi(wsgi_app, environ: dict):
+    """
+    Call the WSGI app up to its first body chunk (start_response may be
+    deferred until then). Returns (status, headers, result, its iterator,
+    first chunk or _END, whole body or None). A response with Content-Length
+    is drained here in one go; only unsized ones are streamed.
+    """
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+        return lambda data: None  # the legacy write() callable; Flask does not use it
+
+    result = wsgi_app(environ, start_response)
+    iterator = iter(result)
+    first = next(iterator, _END)
+    sized = any(name.lower() == "content-length" for name, _ in started["headers"])
+    whole = None
+    if sized:
+        chunks = [] if first is _END else [first]
+        chunks.extend(iterator)
+        whole = b"".join(chunks)
+        _close(result)
+    return started["status"], started["headers"], result, iterator, first, whole
+
+
+def _close(result) -> None:
+    close = getattr(result, "close", None)
+    if close is not None:
+        close()
+
+
+class AsyncApp:
+    """
+    ASGI application running a WSGI app with per-group thread pools.
+    `limits` maps group -> (concurrency, waiting) and must include "default";
+    `groups` maps WSGI endpoint names to groups (unlisted ones are "default");
+    `route` resolves (method, path) to an endpoint name or None.
+    `startup`, if given, builds what the WSGI app needs; it runs once, on
+    lifespan startup or before the first request, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        wsgi_app,
+        limits: Dict[str, Tuple[int, int]],
+        groups: Dict[str, str],
+        route: Callable[[str, str], Optional[str]],
+        max_body: Optional[int] = None,
+        on_reject: Optional[Callable[[str], None]] = None,
+        startup: Optional[Callable[[], None]] = None,
+    ):
+        self.wsgi_app = wsgi_app
+        self.groups = {name: _Group(name, c, w) for name, (c, w) in limits.items()}
+        self.endpoint_groups = dict(groups)
+        self.route = route
+        self.max_body = max_body
+        self.on_reject = on_reject
+        self._startup = startup
+        self._started = startup is None
+        self._startup_lock = threading.Lock()
+
+    def startup(self) -> None:
+        """Run the startup hook unless it already ran (safe to call from any thread)."""
+        with self._startup_lock:
+            if not self._started:
+                self._startup()
+                self._started = True
+
+    def group_for(self, method: str, path: str) -> _Group:
+        endpoint = self.route(method, path)
+        return self.groups[self.endpoint_groups.get(endpoint, "default")]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if not self._started:
+            await asyncio.get_running_loop().run_in_executor(None, self.startup)
+        group = self.group_for(scope["method"], scope["path"])
+        if group.pending >= group.capacity:
+            group.rejected += 1
+            if self.on_reject is not None:
+                self.on_reject(group.name)
+            await _send_simple(send, 429, _BUSY_BODY, [(b"retry-after", b"1")])
+            return
+        group.pending += 1
+        try:
+            await self._handle(group, scope, receive, send)
+            group.completed += 1
+        finally:
+            group.pending -= 1
+
+    async def _handle(self, group: _Group, scope, receive, send):
+        body = await self._receive_body(receive)
+        if body is None:
+            await _send_simple(send, 413, b'{"message":"Request body too large.","success":false}')
+            return
+        loop = asyncio.get_running_loop()
+        environ = _environ(scope, body)
+        status, headers, result, iterator, first, whole = await loop.run_in_executor(
+            group.executor, _start_wsgi, self.wsgi_app, environ
+        )
+        raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        if whole is not None:
+            await send({"type": "http.response.body", "body": whole, "more_body": False})
+            return
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+        try:
+            chunk = first
+            while chunk is not _END and not disconnected.is_set():
+                if chunk:
+                    await send({"type": "http.response.body", "body": _as_bytes(chunk), "more_body": True})
+                chunk = await loop.run_in_executor(group.executor, next, iterator, _END)
+            if not disconnected.is_set():
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+            await loop.run_in_executor(group.executor, _close, result)
+
+    async def _receive_body(self, receive) -> Optional[bytes]:
+        """The whole request body (joined once at the end), or None if it exceeds max_body."""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            if chunk:
+                chunks.append(chunk)
+                size += len(chunk)
+            if self.max_body is not None and size > self.max_body:
+                return None
+            if not message.get("more_body", False):
+                break
+        return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.startup)
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def stats(self) -> dict:
+        """Per group: limits, requests running or waiting, completed and rejected."""
+        return {name: group.stats() for name, group in self.groups.items()}
+
+    def close(self) -> None:
+        for group in self.groups.values():
+            group.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _as_bytes(chunk) -> bytes:
+    return chunk.encode("utf-8") if isinstance(chunk, str) else bytes(chunk)
+
+
+async def _watch_disconnect(receive, disconnected: asyncio.Event) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnected.set()
+            return
+
+
+async def _send_simple(send, status: int, body: bytes, headers=()) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+# ---------- minimal HTTP/1.1 server ----------
+
+_MAX_HEAD = 64 * 1024
+
+
+class _Connection:
+    """One keep-alive connection: parses requests and frames ASGI responses."""
+
+    def __init__(self, app, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.app = app
+        self.reader = reader
+        self.writer = writer
+        self.server = writer.get_extra_info("sockname")[:2]
+        peer = writer.get_extra_info("peername")
+        self.client = peer[:2] if peer else None
+
+    async def run(self) -> None:
+        try:
+            while await self._one_request():
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.writer.close()
+
+    async def _one_request(self) -> bool:
+        """Serve one request; True if the connection may be reused."""
+        try:
+            head = await self.reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return False
+        if len(head) > _MAX_HEAD:
+            return False
+        lines = head[:-4].decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            return False
+        headers = []
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+        fields = {k: v for k, v in headers}
+        if b"chunked" in fields.get(b"transfer-encoding", b"").lower():
+            await self._write_simple(411, b"Length Required")
+            return False
+        remaining = int(fields.get(b"content-length", b"0") or 0)
+        http_version = version[5:] if version.startswith("HTTP/") else "1.0"
+        connection = fields.get(b"connection", b"").lower()
+        keep_alive = connection != b"close" and (http_version != "1.0" or connection == b"keep-alive")
+        path, _, query = target.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": http_version,
+            "method": method.upper(),
+            "scheme": "http",
+            "path": unquote(path),
+            "raw_path": path.encode("latin-1"),
+            "query_string": query.encode("latin-1"),
+            "root_path": "",
+            "headers": headers,
+            "client": self.client,
+            "server": self.server,
+        }
+        closed = asyncio.Event()
+        state = {"started": False, "done": False, "chunked": False}
+
+        async def receive():
+            nonlocal remaining
+            if remaining > 0:
+                chunk = await self.reader.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    closed.set()
+                    return {"type": "http.disconnect"}
+                remaining -= len(chunk)
+                state["body_sent"] = remaining == 0
+                return {"type": "http.request", "body": chunk, "more_body": remaining > 0}
+            if not state.get("body_sent"):
+                state["body_sent"] = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            while not closed.is_set() and not self.reader.at_eof():  # EOF arrives even while not reading
+                try:
+                    await asyncio.wait_for(closed.wait(), 0.5)
+                except asyncio.TimeoutError:
+                    pass
+            closed.set()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if closed.is_set():
+                return
+            try:
+                if message["type"] == "http.response.start":
+                    self._start_response(message, keep_alive, http_version, state)
+                elif message["type"] == "http.response.body":
+                    body = message.get("body", b"")
+                    more = message.get("more_body", False)
+                    if state["chunked"]:
+                        if body:
+                            self.writer.write(b"%x\r\n%s\r\n" % (len(body), body))
+                        if not more:
+                            self.writer.write(b"0\r\n\r\n")
+                    elif body:
+                        self.writer.write(body)
+                    if not more:
+                        state["done"] = True
+                    await self.writer.drain()
+            except ConnectionError:
+                closed.set()
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            if not state["started"]:
+                await self._write_simple(500, b"Internal Server Error")
+            return False
+        finally:
+            closed.set()  # ends any disconnect watcher still waiting on receive()
+        if not state["done"]:
+            return False
+        if remaining > 0:  # body the app did not read
+            await self.reader.readexactly(remaining)
+        return keep_alive and not state.get("close")
+
+    def _start_response(self, message: dict, keep_alive: bool, http_version: str, state: dict) -> None:
+        status = message["status"]
+        headers = list(message.get("headers", []))
+        names = {k.lower() for k, _ in headers}
+        if b"content-length" not in names:
+            if http_version == "1.1":
+                headers.append((b"transfer-encoding", b"chunked"))
+                state["chunked"] = True
+            else:
+                state["close"] = True
+        if not keep_alive or state.get("close"):
+            headers.append((b"connection", b"close"))
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ""
+        lines = [f"HTTP/1.1 {status} {reason}".encode("latin-1")]
+        lines.extend(k + b": " + v for k, v in headers)
+        self.writer.write(b"\r\n".join(lines) + b"\r\n\r\n")
+        state["started"] = True
+
+    async def _write_simple(self, status: int, body: bytes) -> None:
+        reason = HTTPStatus(status).phrase
+        self.writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await self.writer.drain()
+
+
+async def serve_async(app, host: str, port: int, ready: Optional[asyncio.Event] = None) -> None:
+    server = await asyncio.start_server(
+        lambda r, w: _Connection(app, r, w).run(), host, port, limit=_MAX_HEAD, backlog=1024
+    )
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def serve(app, host: str, port: int) -> None:
+    """Run an ASGI app until interrupted (uvicorn is preferable where installed)."""
+    try:
+        asyncio.run(serve_async(app, host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close = getattr(app, "close", None)
+        if close is not None:
+            close()
@@ -1,107 +1,763 @@
-"""Attendance database: punch-in and punch-out records."""
+"""
+Attendance database: punch-in and punch-out records.
+
+The database runs in WAL mode, so readers (the /attendance page, exports) do
+not block the writer and the writer does not block them. Reads use a small
+pool of long-lived connections. All writes go through one background writer
+thread that group-commits: punches arriving within ATTENDANCE_COMMIT_WINDOW of
+each other share a transaction, and so a single WAL sync. punch_in/punch_out
+still return only after their own transaction has committed with
+synchronous=FULL, so an acknowledged punch is durable.
+
+History is partitioned by month (see partitions.py): the current month's
+table stays small however many years of history exist, and closed months can
+be moved to read-only archive files, which readers attach on demand. Queries
+that span months are routed partition by partition in time order.
+
+daily_presence keeps one row per (day, user) with the first/last punch-in,
+last punch-out and punch count. It is upserted in the same transaction as each
+punch, so today's summary reads only today's rows however long the history is.
+
+History is paged by keyset on (timestamp, id) rather than OFFSET, and exports
+walk the range in fixed-size keyset chunks, each a short read, so memory stays
+flat and long exports do not hold a read transaction open.
+
+Maintenance:
+
+    python -m face_auth.attendance backfill [--db PATH]   # rebuild daily_presence
+    python -m face_auth.attendance archive [--before YYYYMM]
+    python -m face_auth.attendance partitions
+"""
+import argparse
+import base64
+import queue
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-import sys
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from config import DB_PATH
+from config import (
+    ATTENDANCE_ARCHIVE_DIR,
+    ATTENDANCE_COMMIT_WINDOW,
+    ATTENDANCE_MAX_ATTACHED,
+    ATTENDANCE_MAX_BATCH,
+    ATTENDANCE_READ_POOL,
+    DB_PATH,
+    EXPORT_CHUNK_ROWS,
+)
+from .partitions import (
+    ACTION_CODES,
+    ACTIONS,
+    CATALOG_DDL,
+    create_partition,
+    day_of,
+    iso_from_ms,
+    month_bounds,
+    month_of,
+    ms_from_iso,
+    now_ms,
+    readonly_uri,
+    table_name,
+    write_archive,
+)
+
+# Applied to every connection. journal_mode=WAL is persistent in the file;
+# the rest are per connection.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=10000",
+    "PRAGMA cache_size=-16000",  # KiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+_STOP = object()
+
+RECORD_COLUMNS = ("id", "user_id", "name", "action", "timestamp")
+
+_PRESENCE_DDL = """
+    CREATE TABLE IF NOT EXISTS daily_presence (
+        day TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        first_in INTEGER,
+        last_in INTEGER,
+        last_out INTEGER,
+        punches INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, user_id)
+    ) WITHOUT ROWID
+"""
+
+_PRESENCE_UPSERT = """
+    INSERT INTO daily_presence (day, user_id, name, first_in, last_in, last_out, punches)
+    VALUES (?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (day, user_id) DO UPDATE SET
+        name = CASE
+            WHEN coalesce(excluded.last_in, excluded.last_out) >= max(coalesce(last_in, 0), coalesce(last_out, 0))
+            THEN excluded.name ELSE name END,
+        first_in = min(coalesce(first_in, excluded.first_in), coalesce(excluded.first_in, first_in)),
+        last_in = max(coalesce(last_in, excluded.last_in), coalesce(excluded.last_in, last_in)),
+        last_out = max(coalesce(last_out, excluded.last_out), coalesce(excluded.last_out, last_out)),
+        punches = punches + 1
+"""
+
+# daily_presence rows for one partition ({table} is a schema-qualified table).
+# The bare `name` column takes its value from the row holding MAX(ts), i.e.
+# the latest name that day.
+_PRESENCE_FROM_PARTITION = """
+    SELECT d.day, d.user_id, d.name, p.first_in, p.last_in, p.last_out, p.punches
+    FROM (
+        SELECT strftime('%Y-%m-%d', ts / 1000, 'unixepoch') AS day, user_id, name, MAX(ts)
+        FROM {table} GROUP BY day, user_id
+    ) AS d
+    JOIN (
+        SELECT strftime('%Y-%m-%d', ts / 1000, 'unixepoch') AS day, user_id,
+               MIN(CASE WHEN action = 0 THEN ts END) AS first_in,
+               MAX(CASE WHEN action = 0 THEN ts END) AS last_in,
+               MAX(CASE WHEN action = 1 THEN ts END) AS last_out,
+               COUNT(*) AS punches
+        FROM {table} GROUP BY day, user_id
+    ) AS p ON p.day = d.day AND p.user_id = d.user_id
+"""
+
+
+def encode_cursor(ts: int, row_id: int) -> str:
+    """Opaque page cursor for the position after (timestamp in ms, id)."""
+    return base64.urlsafe_b64encode(f"{ts}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Inverse of encode_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.split("|")
+        return int(ts), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+
+def day_range(start_day: Optional[str], end_day: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    'YYYY-MM-DD' bounds (both inclusive, either optional) to epoch-ms bounds
+    (start inclusive, end exclusive). Raises ValueError for bad dates.
+    """
+    start = ms_from_iso(date.fromisoformat(start_day).isoformat()) if start_day else None
+    end = ms_from_iso((date.fromisoformat(end_day) + timedelta(days=1)).isoformat()) if end_day else None
+    return start, end
+
+
+def _record_filters(
+    user_id: Optional[str], start: Optional[int], end: Optional[int]
+) -> Tuple[List[str], list]:
+    where, params = [], []
+    if user_id:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("ts < ?")
+        params.append(end)
+    return where, params
+
+
+def _record(row) -> dict:
+    return {
+        "id": row[0],
+        "user_id": row[1],
+        "name": row[2],
+        "action": ACTIONS[row[3]],
+        "timestamp": iso_from_ms(row[4]),
+    }
 
 
-def get_connection(db_path: Optional[Path] = None):
+def get_connection(db_path: Optional[Path] = None, check_same_thread: bool = True):
     path = db_path or DB_PATH
-    path = Path(path)
+    path = Path(path).resolve()
     path.parent.mkdir(parents=True, exist_ok=True)
-    return sqlite3.connect(str(path), timeout=10.0)
+    # URI filenames so read-only archives can be ATTACHed with ?mode=ro
+    conn = sqlite3.connect(path.as_uri(), uri=True, timeout=10.0, check_same_thread=check_same_thread)
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Up to `size` reusable read connections; callers beyond that wait for one.
+    Archive files are attached to a connection on first use and kept, least
+    recently used detached beyond `max_attached`.
+    """
+
+    def __init__(self, db_path: Path, size: int = ATTENDANCE_READ_POOL, max_attached: int = ATTENDANCE_MAX_ATTACHED):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.max_attached = max(1, max_attached)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._all: List[sqlite3.Connection] = []
+        self._attached: Dict[int, "OrderedDict[str, None]"] = {}
+
+    def _create(self) -> sqlite3.Connection:
+        conn = get_connection(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._all) < self.size:
+                    conn = self._create()
+                    self._all.append(conn)
+                    self._attached[id(conn)] = OrderedDict()
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def attach(self, conn: sqlite3.Connection, alias: str, path: Path) -> None:
+        """
+        Attach an archive read-only as `alias` (no-op if already attached).
+        Evicting an alias that the open read transaction has used requires
+        ending it; archives never change, so the caller's keyset position
+        stays valid and the transaction is simply begun again.
+        """
+        attached = self._attached[id(conn)]
+        if alias in attached:
+            attached.move_to_end(alias)
+            return
+        restart = False
+        while len(attached) >= self.max_attached:
+            old, _ = attached.popitem(last=False)
+            if conn.in_transaction:
+                conn.rollback()
+                restart = True
+            conn.execute(f"DETACH {old}")
+        conn.execute(f"ATTACH ? AS {alias}", (readonly_uri(path),))
+        attached[alias] = None
+        if restart:
+            conn.execute("BEGIN")
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._all = self._all, []
+            self._attached.clear()
+        for conn in conns:
+            conn.close()
+
+
+class AttendanceWriter:
+    """
+    Single writer thread with group commit. `submit(op)` queues a callable
+    that receives the writer's connection; it runs inside a savepoint of the
+    current batch transaction (a failing op is rolled back alone). The returned
+    Future resolves with op's result once the batch has committed.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        window: float = ATTENDANCE_COMMIT_WINDOW,
+        max_batch: int = ATTENDANCE_MAX_BATCH,
+    ):
+        self.db_path = db_path
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.batches = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, op: Callable[[sqlite3.Connection], object]) -> Future:
+        if not self._thread.is_alive():
+            raise RuntimeError("Attendance writer is not running.")
+        future: Future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def _next_batch(self, first) -> tuple:
+        """Collect ops queued within the commit window after `first`. Returns (batch, stop)."""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        conn = get_connection(self.db_path)
+        conn.isolation_level = None  # explicit BEGIN/COMMIT below
+        conn.execute("PRAGMA synchronous=FULL")  # durable once COMMIT returns
+        try:
+            stop = False
+            while not stop:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch, stop = self._next_batch(item)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list) -> None:
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, _ in batch:
+                conn.execute("SAVEPOINT punch")
+                try:
+                    results.append((op(conn), None))
+                    conn.execute("RELEASE punch")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO punch")
+                    conn.execute("RELEASE punch")
+                    results.append((None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._lock:
+                self.failed += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.batches += 1
+            self.writes += sum(1 for _, err in results if err is None)
+            self.failed += sum(1 for _, err in results if err is not None)
+        for (_, future), (result, err) in zip(batch, results):
+            if err is None:
+                future.set_result(result)
+            else:
+                future.set_exception(err)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "writes": self.writes,
+                "batches": self.batches,
+                "failed": self.failed,
+                "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0.0,
+                "queued": self._queue.qsize(),
+            }
+
+    def close(self) -> None:
+        """Commit what is queued, then stop the thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
 
 
 class AttendanceDB:
-    """SQLite-backed attendance (punch-in / punch-out)."""
+    """SQLite-backed attendance (punch-in / punch-out), partitioned by month."""
 
-    def __init__(self, db_path: Optional[Path] = None):
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        read_pool: int = ATTENDANCE_READ_POOL,
+        archive_dir: Optional[Path] = None,
+    ):
         self.db_path = db_path or DB_PATH
+        self.archive_dir = Path(archive_dir) if archive_dir else (
+            ATTENDANCE_ARCHIVE_DIR if db_path is None else Path(self.db_path).parent / "archive"
+        )
         self._init_schema()
+        self._pool = ConnectionPool(self.db_path, read_pool)
+        self._writer = AttendanceWriter(self.db_path)
 
     def _init_schema(self) -> None:
-        with get_connection(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS attendance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    action TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_attendance_user_id ON attendance(user_id)"
-            )
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance(timestamp)"
-            )
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute(CATALOG_DDL)
+            legacy = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'attendance'"
+            ).fetchone()
+            if legacy:
+                self._migrate_legacy(conn)
+            created = not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_presence'"
+            ).fetchone()
+            conn.execute(_PRESENCE_DDL)
+            if created:
+                # first start with this table: derive it from existing history
+                for month, archive in conn.execute(
+                    "SELECT month, archive FROM attendance_partitions WHERE archive IS NULL"
+                ).fetchall():
+                    rows = conn.execute(_PRESENCE_FROM_PARTITION.format(table=table_name(month))).fetchall()
+                    conn.executemany("INSERT INTO daily_presence VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            create_partition(conn, month_of(now_ms()))
             conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _migrate_legacy(conn: sqlite3.Connection, chunk: int = 10000) -> None:
+        """
+        Move rows of the original single `attendance` table (ISO-string
+        timestamps) into monthly partitions, then drop it. daily_presence is
+        dropped too and rebuilt from the partitions.
+        """
+        last = None
+        while True:
+            sql = "SELECT id, user_id, name, action, timestamp FROM attendance"
+            args: list = []
+            if last is not None:
+                sql += " WHERE (timestamp, id) > (?, ?)"
+                args = list(last)
+            rows = conn.execute(sql + " ORDER BY timestamp, id LIMIT ?", args + [chunk]).fetchall()
+            if not rows:
+                break
+            by_month: Dict[int, list] = {}
+            for _, user_id, name, action, timestamp in rows:
+                ts = ms_from_iso(timestamp)
+                by_month.setdefault(month_of(ts), []).append((user_id, name, ACTION_CODES[action], ts))
+            for month, values in by_month.items():
+                create_partition(conn, month)
+                conn.executemany(
+                    f"INSERT INTO {table_name(month)} (user_id, name, action, ts) VALUES (?, ?, ?, ?)", values
+                )
+            last = (rows[-1][4], rows[-1][0])
+        conn.execute("DROP TABLE attendance")
+        conn.execute("DROP TABLE IF EXISTS daily_presence")
+
+    # ---------- partition routing ----------
+
+    @staticmethod
+    def _months(
+        conn: sqlite3.Connection, start: Optional[int], end: Optional[int], descending: bool = False
+    ) -> List[int]:
+        """Catalog months overlapping [start, end), in time order."""
+        months = [r[0] for r in conn.execute("SELECT month FROM attendance_partitions ORDER BY month")]
+        out = []
+        for month in months:
+            lo, hi = month_bounds(month)
+            if (start is not None and hi <= start) or (end is not None and lo >= end):
+                continue
+            out.append(month)
+        return out[::-1] if descending else out
+
+    def _table(self, conn: sqlite3.Connection, month: int) -> str:
+        """Schema-qualified table for a month, attaching its archive if needed."""
+        row = conn.execute("SELECT archive FROM attendance_partitions WHERE month = ?", (month,)).fetchone()
+        if row is None or row[0] is None:
+            return f"main.{table_name(month)}"
+        alias = f"archive_{month}"
+        self._pool.attach(conn, alias, self.archive_dir / row[0])
+        return f"{alias}.{table_name(month)}"
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """Pooled connection inside one read transaction (a consistent catalog + hot data snapshot)."""
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN")
+            yield conn
+
+    # ---------- writes ----------
+
+    def _record(self, user_id: str, name: str, action: str) -> bool:
+        ts = now_ms()
+        month = month_of(ts)
+        punch_in = ts if action == "punch_in" else None
+        punch_out = ts if action == "punch_out" else None
+
+        def insert(conn: sqlite3.Connection) -> int:
+            create_partition(conn, month)  # no-op except on the first punch of a month
+            row_id = conn.execute(
+                f"INSERT INTO {table_name(month)} (user_id, name, action, ts) VALUES (?, ?, ?, ?)",
+                (user_id, name, ACTION_CODES[action], ts),
+            ).lastrowid
+            conn.execute(_PRESENCE_UPSERT, (day_of(ts), user_id, name, punch_in, punch_in, punch_out))
+            return row_id
+
+        self._writer.submit(insert).result()  # returns once committed
+        return True
 
     def punch_in(self, user_id: str, name: str) -> bool:
         """Record punch-in. Returns True if recorded."""
-        now = datetime.utcnow().isoformat() + "Z"
-        with get_connection(self.db_path) as conn:
-            conn.execute(
-                "INSERT INTO attendance (user_id, name, action, timestamp, created_at) VALUES (?, ?, 'punch_in', ?, ?)",
-                (user_id, name, now, now),
-            )
-            conn.commit()
-        return True
+        return self._record(user_id, name, "punch_in")
 
     def punch_out(self, user_id: str, name: str) -> bool:
         """Record punch-out."""
-        now = datetime.utcnow().isoformat() + "Z"
-        with get_connection(self.db_path) as conn:
+        return self._record(user_id, name, "punch_out")
+
+    def backfill_presence(self) -> int:
+        """Rebuild daily_presence from all partitions (archives included). Returns rows written."""
+        rows = []
+        with self._read() as conn:
+            for month in self._months(conn, None, None):
+                table = self._table(conn, month)
+                rows.extend(conn.execute(_PRESENCE_FROM_PARTITION.format(table=table)).fetchall())
+        rows = [tuple(r) for r in rows]
+
+        def rebuild(conn: sqlite3.Connection) -> int:
+            conn.execute("DELETE FROM daily_presence")
+            conn.executemany("INSERT INTO daily_presence VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            return len(rows)
+
+        return self._writer.submit(rebuild).result()
+
+    def archive_month(self, month: int) -> int:
+        """
+        Move a closed month to a read-only archive file (compacted copy), then
+        point the catalog at it and drop the hot table. Returns rows archived.
+        """
+        if month >= month_of(now_ms()):
+            raise ValueError(f"{month} is not a closed month.")
+        with self._read() as conn:
+            row = conn.execute("SELECT archive FROM attendance_partitions WHERE month = ?", (month,)).fetchone()
+        if row is None:
+            raise ValueError(f"No partition for {month}.")
+        if row[0] is not None:
+            return 0
+        path, rows = write_archive(self.db_path, self.archive_dir, month)
+
+        def switch(conn: sqlite3.Connection) -> int:
             conn.execute(
-                "INSERT INTO attendance (user_id, name, action, timestamp, created_at) VALUES (?, ?, 'punch_out', ?, ?)",
-                (user_id, name, now, now),
+                "UPDATE attendance_partitions SET archive = ?, rows = ? WHERE month = ?", (path.name, rows, month)
             )
-            conn.commit()
-        return True
+            conn.execute(f"DROP TABLE main.{table_name(month)}")
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table_name(month),))
+            return rows
+
+        return self._writer.submit(switch).result()
+
+    def archive_closed(self, before: Optional[int] = None) -> Dict[int, int]:
+        """Archive every hot month before `before` (default: the current month)."""
+        before = min(before or month_of(now_ms()), month_of(now_ms()))
+        with self._read() as conn:
+            months = [r[0] for r in conn.execute(
+                "SELECT month FROM attendance_partitions WHERE archive IS NULL AND month < ? ORDER BY month",
+                (before,),
+            )]
+        return {month: self.archive_month(month) for month in months}
+
+    def partitions(self) -> List[dict]:
+        """Catalog: one dict per month {month, archive, rows}."""
+        out = []
+        with self._read() as conn:
+            for month, archive, rows in conn.execute(
+                "SELECT month, archive, rows FROM attendance_partitions ORDER BY month"
+            ).fetchall():
+                if archive is None:
+                    rows = conn.execute(f"SELECT COUNT(*) FROM main.{table_name(month)}").fetchone()[0]
+                out.append({"month": month, "archive": archive, "rows": rows})
+        return out
+
+    # ---------- reads ----------
+
+    def _fetch_desc(
+        self,
+        user_id: Optional[str],
+        count: int,
+        cursor: Optional[Tuple[int, int]],
+        start: Optional[int],
+        end: Optional[int],
+    ) -> list:
+        where, params = _record_filters(user_id, start, end)
+        if cursor:
+            where.append("(ts, id) < (?, ?)")
+            params.extend(cursor)
+        clause = (" WHERE " + " AND ".join(where)) if where else ""
+        upper = end if cursor is None else (cursor[0] + 1 if end is None else min(end, cursor[0] + 1))
+        rows: list = []
+        with self._read() as conn:
+            for month in self._months(conn, start, upper, descending=True):
+                table = self._table(conn, month)
+                rows.extend(conn.execute(
+                    f"SELECT id, user_id, name, action, ts FROM {table}{clause} "
+                    "ORDER BY ts DESC, id DESC LIMIT ?",
+                    params + [count - len(rows)],
+                ).fetchall())
+                if len(rows) >= count:
+                    break
+        return rows
 
     def get_records(
         self,
         user_id: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
+        cursor: Optional[str] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
     ) -> List[dict]:
-        """Get attendance records, optionally filtered by user_id."""
-        with get_connection(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            if user_id:
-                cur = conn.execute(
-                    "SELECT id, user_id, name, action, timestamp FROM attendance WHERE user_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?",
-                    (user_id, limit, offset),
-                )
-            else:
-                cur = conn.execute(
-                    "SELECT id, user_id, name, action, timestamp FROM attendance ORDER BY timestamp DESC LIMIT ? OFFSET ?",
-                    (limit, offset),
-                )
-            rows = cur.fetchall()
-        return [dict(r) for r in rows]
+        """
+        Get attendance records, newest first, optionally filtered by user_id
+        and epoch-ms range [start, end) (see day_range). Pass `cursor` (from
+        get_records_page) to continue after a previous page; `offset` still
+        works but costs O(offset).
+        """
+        after = decode_cursor(cursor) if cursor else None
+        rows = self._fetch_desc(user_id, limit + offset, after, start, end)
+        return [_record(r) for r in rows[offset:offset + limit]]
+
+    def get_records_page(
+        self,
+        user_id: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """One keyset page: (records, next_cursor); next_cursor is None on the last page."""
+        records = self.get_records(user_id, limit, cursor=cursor, start=start, end=end)
+        next_cursor = None
+        if len(records) == limit:
+            next_cursor = encode_cursor(ms_from_iso(records[-1]["timestamp"]), records[-1]["id"])
+        return records, next_cursor
+
+    def iter_records(
+        self,
+        user_id: Optional[str] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        chunk_size: int = EXPORT_CHUNK_ROWS,
+    ) -> Iterator[List[tuple]]:
+        """
+        Yield records oldest first as lists of (id, user_id, name, action,
+        timestamp) tuples of at most chunk_size. Each chunk is a separate
+        keyset read across as many monthly partitions as it needs, so the
+        pool connection is only held per chunk.
+        """
+        where, params = _record_filters(user_id, start, end)
+        after: Optional[Tuple[int, int]] = None
+        while True:
+            clauses, args = list(where), list(params)
+            if after is not None:
+                clauses.append("(ts, id) > (?, ?)")
+                args.extend(after)
+            clause = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+            lower = start if after is None else max(start or 0, after[0])
+            rows: list = []
+            with self._read() as conn:
+                for month in self._months(conn, lower, end):
+                    table = self._table(conn, month)
+                    rows.extend(conn.execute(
+                        f"SELECT id, user_id, name, action, ts FROM {table}{clause} ORDER BY ts, id LIMIT ?",
+                        args + [chunk_size - len(rows)],
+                    ).fetchall())
+                    if len(rows) >= chunk_size:
+                        break
+            if not rows:
+                return
+            yield [(r[0], r[1], r[2], ACTIONS[r[3]], iso_from_ms(r[4])) for r in rows]
+            if len(rows) < chunk_size:
+                return
+            after = (rows[-1][4], rows[-1][0])
 
     def get_today_summary(self) -> List[dict]:
-        """Get today's punch-in/out summary per user (last punch_in and last punch_out)."""
-        with get_connection(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        """
+        Get today's punch-in/out summary per user (first and last punch_in,
+        last punch_out, punch count), read from daily_presence.
+        """
+        with self._pool.connection() as conn:
             today = datetime.utcnow().strftime("%Y-%m-%d")
-            cur = conn.execute(
+            rows = conn.execute(
                 """
-                SELECT user_id, name,
-                       MAX(CASE WHEN action = 'punch_in' THEN timestamp END) AS last_punch_in,
-                       MAX(CASE WHEN action = 'punch_out' THEN timestamp END) AS last_punch_out
-                FROM attendance
-                WHERE date(timestamp) = date(?)
-                GROUP BY user_id, name
+                SELECT user_id, name, first_in, last_in, last_out, punches
+                FROM daily_presence
+                WHERE day = ?
+                ORDER BY user_id
                 """,
                 (today,),
-            )
-            rows = cur.fetchall()
-        return [dict(r) for r in rows]
+            ).fetchall()
+        return [
+            {
+                "user_id": r["user_id"],
+                "name": r["name"],
+                "first_punch_in": iso_from_ms(r["first_in"]) if r["first_in"] is not None else None,
+                "last_punch_in": iso_from_ms(r["last_in"]) if r["last_in"] is not None else None,
+                "last_punch_out": iso_from_ms(r["last_out"]) if r["last_out"] is not None else None,
+                "punches": r["punches"],
+            }
+            for r in rows
+        ]
+
+    def latest_punches(self, since: int) -> Dict[str, Tuple[str, int, str]]:
+        """
+        Each user's last punch at or after epoch ms `since`, from
+        daily_presence: {user_id: (action, ts, name)}.
+        """
+        latest: Dict[str, Tuple[str, int, str]] = {}
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT user_id, name, last_in, last_out FROM daily_presence WHERE day >= ? ORDER BY day",
+                (day_of(since),),
+            ).fetchall()
+        for r in rows:
+            last_in, last_out = r["last_in"] or 0, r["last_out"] or 0
+            action, ts = ("punch_out", last_out) if last_out > last_in else ("punch_in", last_in)
+            if ts >= since:
+                latest[r["user_id"]] = (action, ts, r["name"])
+        return latest
+
+    def stats(self) -> dict:
+        """Writer group-commit counters and partition counts."""
+        stats = self._writer.stats()
+        with self._pool.connection() as conn:
+            hot, archived = conn.execute(
+                "SELECT SUM(archive IS NULL), SUM(archive IS NOT NULL) FROM attendance_partitions"
+            ).fetchone()
+        stats.update({"hot_partitions": hot or 0, "archived_partitions": archived or 0})
+        return stats
+
+    def close(self) -> None:
+        """Flush pending punches and close all connections."""
+        self._writer.close()
+        self._pool.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Attendance database maintenance")
+    parser.add_argument("command", choices=["backfill", "archive", "partitions"])
+    parser.add_argument("--db", type=Path, default=None, help="Database file (default: config DB_PATH)")
+    parser.add_argument("--archive-dir", type=Path, default=None, help="Archive directory")
+    parser.add_argument("--before", type=int, default=None, help="archive: months before YYYYMM (default: current)")
+    args = parser.parse_args(argv)
+
+    db = AttendanceDB(args.db, archive_dir=args.archive_dir)
+    try:
+        start = time.perf_counter()
+        if args.command == "backfill":
+            rows = db.backfill_presence()
+            print(f"daily_presence rebuilt: {rows} rows in {time.perf_counter() - start:.2f}s")
+        elif args.command == "archive":
+            archived = db.archive_closed(args.before)
+            for month, rows in archived.items():
+                print(f"{month}: {rows} rows -> {db.archive_dir}")
+            print(f"archived {len(archived)} month(s) in {time.perf_counter() - start:.2f}s")
+        else:
+            for p in db.partitions():
+                print(f"{p['month']}  {p['rows'] or 0:>10} rows  {p['archive'] or 'hot'}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Multi-scale face detection: detect on a downscaled copy, report full-resolution boxes."""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (
+    DETECTION_FALLBACK_SCALES,
+    DETECTION_SCALE,
+    DETECTION_UPSAMPLE,
+    MODEL,
+    TRACK_ROI_FACE_PX,
+    TRACK_ROI_MARGIN,
+)
+from . import models
+from .timing import StageTimer
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left), face_recognition order
+_SAME_FACE_IOU = 0.3  # boxes from two scales overlapping this much are one face
+
+
+class FaceDetector:
+    """
+    Run the HOG/CNN detector on a copy of the frame scaled by `scale`, with
+    `upsample` pyramid steps, and map boxes back to the full frame so landmarks
+    and encodings use full resolution. If nothing is found, retry at each of
+    `fallback_scales` in turn (finer first-pass misses, e.g. small faces).
+
+    With scale=0.5, upsample=1 the first pass searches the half-scale frame
+    upsampled 2x, i.e. as many pixels as the frame itself: a quarter of what
+    the original full-frame single-upsample pass searched, so the smallest
+    face it finds is twice as large. Smaller faces are found only by the 1.0
+    fallback, which does not run once a larger face has been found; callers
+    that must see every face (the one-face check at registration) pass
+    all_scales=True.
+    """
+
+    def __init__(
+        self,
+        model: str = MODEL,
+        scale: float = DETECTION_SCALE,
+        upsample: int = DETECTION_UPSAMPLE,
+        fallback_scales: Sequence[float] = DETECTION_FALLBACK_SCALES,
+    ):
+        self.model = model
+        self.scale = scale
+        self.upsample = upsample
+        self.fallback_scales = tuple(fallback_scales)
+
+    def detect(
+        self, rgb: np.ndarray, timings: Optional[Dict[str, float]] = None, all_scales: bool = False
+    ) -> List[Box]:
+        """
+        Detect faces in an RGB frame. Returns full-resolution boxes.
+        If `timings` is given, adds detect_resize / detect ms, the scale that
+        produced the result and the number of passes. With all_scales=True
+        every scale is searched and the boxes merged, so a small face next
+        to a larger one is not missed.
+        """
+        return self._detect_at(rgb, (self.scale,) + self.fallback_scales, timings, all_scales)
+
+    def detect_roi(
+        self,
+        rgb: np.ndarray,
+        near: Box,
+        timings: Optional[Dict[str, float]] = None,
+        margin: float = TRACK_ROI_MARGIN,
+        face_px: int = TRACK_ROI_FACE_PX,
+    ) -> List[Box]:
+        """
+        Detect only around a known face box (see tracker.py): the box grown
+        by `margin` of its size on each side, scaled so the face is about
+        `face_px` wide and searched without upsampling. Returns
+        full-resolution boxes, or [] if the face has left the region.
+        """
+        timer = StageTimer(timings)
+        h, w = rgb.shape[:2]
+        top, right, bottom, left = near
+        side = max(bottom - top, right - left, 1)
+        pad = int(side * margin)
+        y0, y1 = max(0, top - pad), min(h, bottom + pad)
+        x0, x1 = max(0, left - pad), min(w, right + pad)
+        if y1 <= y0 or x1 <= x0:
+            return []
+        scale = min(1.0, face_px / side)
+        with timer.stage("detect_resize"):
+            region = _resize(rgb[y0:y1, x0:x1], scale)
+            region = np.ascontiguousarray(region)
+        with timer.stage("detect"):
+            found = _face_locations(region, self.model, 0)
+        if timings is not None:
+            timings["detect_scale"] = scale
+            timings["detect_passes"] = 1
+        boxes = []
+        for box in found:
+            t, r, b, l = _rescale_box(box, scale, y1 - y0, x1 - x0)
+            boxes.append((t + y0, r + x0, b + y0, l + x0))
+        return boxes
+
+    def _detect_at(
+        self,
+        rgb: np.ndarray,
+        scales: Sequence[float],
+        timings: Optional[Dict[str, float]] = None,
+        all_scales: bool = False,
+    ) -> List[Box]:
+        """Try each scale in order until a face is found (or all of them, merging boxes of the same face)."""
+        timer = StageTimer(timings)
+        h, w = rgb.shape[:2]
+        passes = 0
+        scale = None
+        locations: List[Box] = []
+        for scale in scales:
+            passes += 1
+            with timer.stage("detect_resize"):
+                small = _resize(rgb, scale)
+            with timer.stage("detect"):
+                found = _face_locations(small, self.model, self.upsample)
+            if not all_scales:
+                if found:
+                    locations = [_rescale_box(box, scale, h, w) for box in found]
+                    break
+                continue
+            for box in found:
+                box = _rescale_box(box, scale, h, w)
+                if all(box_iou(box, seen) < _SAME_FACE_IOU for seen in locations):
+                    locations.append(box)
+        if timings is not None:
+            timings["detect_scale"] = scale
+            timings["detect_passes"] = passes
+        return locations
+
+    def detect_batch(self, rgb_frames: Sequence[np.ndarray]) -> List[List[Box]]:
+        """Detect in several frames; CNN frames go through dlib's batch detector."""
+        if self.model != "cnn":
+            return [self.detect(rgb) for rgb in rgb_frames]
+        smalls = [_resize(rgb, self.scale) for rgb in rgb_frames]
+        if len({s.shape for s in smalls}) != 1:
+            return [self.detect(rgb) for rgb in rgb_frames]
+        h, w = smalls[0].shape[:2]
+        batch = [
+            [_trim(d.rect, h, w) for d in found]
+            for found in models.cnn_detector()(smalls, self.upsample, batch_size=128)
+        ]
+        results = []
+        for rgb, found in zip(rgb_frames, batch):
+            if found:
+                h, w = rgb.shape[:2]
+                results.append([_rescale_box(box, self.scale, h, w) for box in found])
+            else:
+                results.append(self._detect_at(rgb, self.fallback_scales))
+        return results
+
+
+def _face_locations(image: np.ndarray, model: str, upsample: int) -> List[Box]:
+    """Boxes found by this thread's detector (see models.py), clipped to the image."""
+    h, w = image.shape[:2]
+    if model == "cnn":
+        rects = [d.rect for d in models.cnn_detector()(image, upsample)]
+    else:
+        rects = models.hog_detector()(image, upsample)
+    return [_trim(rect, h, w) for rect in rects]
+
+
+def _trim(rect, h: int, w: int) -> Box:
+    return max(rect.top(), 0), min(rect.right(), w), min(rect.bottom(), h), max(rect.left(), 0)
+
+
+def _resize(rgb: np.ndarray, scale: float) -> np.ndarray:
+    if scale == 1.0:
+        return rgb
+    import cv2
+
+    return cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def _rescale_box(box: Box, scale: float, h: int, w: int) -> Box:
+    top, right, bottom, left = box
+    if scale != 1.0:
+        top, right, bottom, left = (int(round(v / scale)) for v in (top, right, bottom, left))
+    return max(top, 0), min(right, w), min(bottom, h), max(left, 0)
+
+
+def box_iou(a: Box, b: Box) -> float:
+    """Intersection-over-union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = max(0, a[2] - a[0]) * max(0, a[1] - a[3])
+    area_b = max(0, b[2] - b[0]) * max(0, b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
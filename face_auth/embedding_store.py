@@ -0,0 +1,494 @@
+"""
+Storage backends for face embeddings.
+
+- FileEmbeddingStore: original layout, one `<id>.npy` + `<id>.json` per user
+  and an `index.json` rewritten on every change.
+- PackedEmbeddingStore: one append-only file of fixed-size float records that
+  is loaded with a single np.memmap, plus an append-only id/name sidecar.
+  Deletes and re-registrations append tombstones; `compact` rewrites both files
+  offline to drop dead records. Rows are float64, float32 or float16 (new
+  stores use EMBEDDING_DTYPE; `convert` rewrites an existing store).
+
+A user may hold several templates. put() replaces a user's whole template set
+(one embedding or a (k, dim) stack); load() returns one row per template, the
+rows of a user adjacent and sharing its user_id.
+
+Command line (run from the project root):
+    python -m face_auth.embedding_store migrate   # per-user files -> packed store
+    python -m face_auth.embedding_store compact   # drop tombstoned records
+    python -m face_auth.embedding_store convert --dtype float32  # compact + change row dtype
+    python -m face_auth.embedding_store stats
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import EMBEDDING_DTYPE, EMBEDDINGS_DIR
+from .gallery import EMBEDDING_DIM, group_rows
+
+Loaded = Tuple[np.ndarray, List[str], List[str]]
+STORE_DTYPES = ("float64", "float32", "float16")
+
+
+def _safe_id(user_id: str) -> str:
+    return "".join(c if c.isalnum() or c in "_-" else "_" for c in user_id)
+
+
+def _stat_stamp(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class FileEmbeddingStore:
+    """Legacy per-user .npy/.json files with an index.json."""
+
+    def __init__(self, directory: Optional[Path] = None, dim: int = EMBEDDING_DIM):
+        self.directory = Path(directory or EMBEDDINGS_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._index_path = self.directory / "index.json"
+
+    def _load_index(self) -> dict:
+        """Load user_id -> filename mapping."""
+        if self._index_path.exists():
+            with open(self._index_path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def _save_index(self, index: dict) -> None:
+        with open(self._index_path, "w") as f:
+            json.dump(index, f, indent=2)
+
+    def exists(self) -> bool:
+        return self._index_path.exists()
+
+    def stamp(self):
+        """Version stamp of index.json; changes whenever any process rewrites it."""
+        return _stat_stamp(self._index_path)
+
+    def put(self, user_id: str, name: str, embedding: np.ndarray) -> None:
+        safe_id = _safe_id(user_id)
+        emb_path = self.directory / f"{safe_id}.npy"
+        meta_path = self.directory / f"{safe_id}.json"
+        np.save(emb_path, embedding)
+        with open(meta_path, "w") as f:
+            json.dump({"user_id": user_id, "name": name}, f, indent=2)
+        index = self._load_index()
+        index[user_id] = {"file": f"{safe_id}.npy", "name": name}
+        self._save_index(index)
+
+    def put_many(self, entries: List[Tuple[str, str, np.ndarray]]) -> None:
+        """Write several users' files, then index.json once."""
+        if not entries:
+            return
+        index = self._load_index()
+        for user_id, name, embedding in entries:
+            safe_id = _safe_id(user_id)
+            np.save(self.directory / f"{safe_id}.npy", embedding)
+            with open(self.directory / f"{safe_id}.json", "w") as f:
+                json.dump({"user_id": user_id, "name": name}, f, indent=2)
+            index[user_id] = {"file": f"{safe_id}.npy", "name": name}
+        self._save_index(index)
+
+    def delete(self, user_id: str) -> bool:
+        index = self._load_index()
+        if user_id not in index:
+            return False
+        info = index[user_id]
+        emb_path = self.directory / info["file"]
+        if emb_path.exists():
+            emb_path.unlink()
+        meta = self.directory / f"{emb_path.stem}.json"
+        if meta.exists():
+            meta.unlink()
+        del index[user_id]
+        self._save_index(index)
+        return True
+
+    def load(self) -> Loaded:
+        index = self._load_index()
+        encodings = []
+        user_ids = []
+        names = []
+        for uid, info in index.items():
+            emb_file = self.directory / info["file"]
+            if not emb_file.exists():
+                continue
+            rows = np.atleast_2d(np.load(emb_file))
+            encodings.append(rows)
+            user_ids.extend([uid] * len(rows))
+            names.extend([info.get("name", uid)] * len(rows))
+        if encodings:
+            matrix = np.vstack(encodings)
+        else:
+            matrix = np.empty((0, self.dim))
+        return matrix, user_ids, names
+
+    def get(self, user_id: str) -> Optional[np.ndarray]:
+        """(k, dim) templates of one user, or None."""
+        info = self._load_index().get(user_id)
+        if info is None or not (self.directory / info["file"]).exists():
+            return None
+        return np.atleast_2d(np.load(self.directory / info["file"]))
+
+    def list_users(self) -> List[dict]:
+        index = self._load_index()
+        return [{"user_id": uid, "name": info.get("name", uid)} for uid, info in index.items()]
+
+
+class PackedEmbeddingStore:
+    """
+    Single-file packed embedding store.
+
+    Layout inside `directory`:
+      store.json                 {"format": 1, "dim", "dtype", "generation"}
+      embeddings-<gen>.bin       N fixed-size records, row i = slot i
+      records-<gen>.jsonl        one line per change: {"slot", "id", "name"}
+                                 ("n": k for k templates in slots slot..slot+k-1)
+                                 or a tombstone {"id", "deleted": true}
+
+    Registering appends one record and one sidecar line (O(1)); the last line
+    for an id wins. Loading replays the sidecar and reads the live slots from
+    one memmap. Compaction writes a new generation and switches store.json
+    atomically, so a crash leaves either the old or the new generation intact.
+    Writes are serialized within a process; use a single writer process.
+    """
+
+    FORMAT = 1
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        dim: int = EMBEDDING_DIM,
+        dtype: str = EMBEDDING_DTYPE,
+    ):
+        self.directory = Path(directory or EMBEDDINGS_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._meta_path = self.directory / "store.json"
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._live: Dict[str, Tuple[range, str]] = {}
+        self._replayed = (-1, 0)  # (generation, bytes of the records file already applied)
+        meta = self._read_meta()
+        if meta is None:
+            meta = {"format": self.FORMAT, "dim": dim, "dtype": np.dtype(dtype).name, "generation": 0}
+            self._write_meta(meta)
+        self._meta = meta
+        self._meta_stamp = _stat_stamp(self._meta_path)
+
+    # ---------- files ----------
+
+    def _read_meta(self) -> Optional[dict]:
+        if not self._meta_path.exists():
+            return None
+        with open(self._meta_path, "r") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: dict) -> None:
+        tmp = self._meta_path.with_suffix(f".json.{os.getpid()}.tmp")  # workers may start together
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._meta_path)
+
+    def _refresh_meta(self) -> dict:
+        """Re-read store.json only if another process compacted the store."""
+        stamp = _stat_stamp(self._meta_path)
+        if stamp != self._meta_stamp:
+            self._meta = self._read_meta() or self._meta
+            self._meta_stamp = stamp
+        return self._meta
+
+    @property
+    def dim(self) -> int:
+        return int(self._meta["dim"])
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self._meta["dtype"])
+
+    def _data_path(self, generation: Optional[int] = None) -> Path:
+        gen = self._meta["generation"] if generation is None else generation
+        return self.directory / f"embeddings-{gen}.bin"
+
+    def _records_path(self, generation: Optional[int] = None) -> Path:
+        gen = self._meta["generation"] if generation is None else generation
+        return self.directory / f"records-{gen}.jsonl"
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def exists(self) -> bool:
+        return self._records_path().exists()
+
+    def stamp(self):
+        """Changes on every append (sidecar grows) and on compaction (new generation)."""
+        meta = self._refresh_meta()
+        return (meta["generation"], _stat_stamp(self._records_path()))
+
+    def _replay(self) -> Dict[str, Tuple[range, str]]:
+        """
+        user_id -> (template slots, name) for live entries, in registration order.
+
+        The result is cached per generation together with the byte offset it
+        covers, so each call parses only the lines appended since the last one.
+        """
+        generation = self._meta["generation"]
+        path = self._records_path(generation)
+        with self._replay_lock:
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                self._live, self._replayed = {}, (generation, 0)
+                return {}
+            cached_generation, offset = self._replayed
+            if cached_generation != generation or size < offset:
+                self._live, offset = {}, 0
+            if size > offset:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(size - offset)
+                # a final line without its newline is still being written; parse it next time
+                end = data.rfind(b"\n") + 1
+                for line in data[:end].splitlines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        # torn line from an interrupted write
+                        continue
+                    uid = rec["id"]
+                    self._live.pop(uid, None)
+                    if not rec.get("deleted"):
+                        slot = int(rec["slot"])
+                        self._live[uid] = (range(slot, slot + int(rec.get("n", 1))), rec.get("name", uid))
+                offset += end
+            self._replayed = (generation, offset)
+            return dict(self._live)
+
+    def _append_record(self, rec: dict) -> None:
+        with open(self._records_path(), "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append_rows(self, rows: np.ndarray) -> int:
+        """Append rows to the data file; returns the first slot written."""
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape(-1, self.dim)
+        path = self._data_path()
+        with open(path, "ab") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end % self._row_bytes:
+                # drop a torn record left by an interrupted append
+                end -= end % self._row_bytes
+                f.truncate(end)
+                f.seek(end)
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return end // self._row_bytes
+
+    def _memmap(self) -> Optional[np.memmap]:
+        path = self._data_path()
+        if not path.exists():
+            return None
+        n = path.stat().st_size // self._row_bytes
+        if n == 0:
+            return None
+        return np.memmap(path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+
+    # ---------- store API ----------
+
+    @staticmethod
+    def _record(slot: int, count: int, user_id: str, name: str) -> dict:
+        rec = {"slot": slot, "id": user_id, "name": name}
+        if count != 1:
+            rec["n"] = count
+        return rec
+
+    def put(self, user_id: str, name: str, embedding: np.ndarray) -> None:
+        """Set a user's templates: one embedding or a (k, dim) stack."""
+        rows = np.atleast_2d(embedding)
+        with self._lock:
+            self._refresh_meta()
+            slot = self._append_rows(rows)
+            self._append_record(self._record(slot, len(rows), user_id, name))
+
+    def put_many(self, entries: List[Tuple[str, str, np.ndarray]]) -> None:
+        """Append several registrations with one write per file."""
+        if not entries:
+            return
+        with self._lock:
+            self._refresh_meta()
+            stacks = [np.atleast_2d(e[2]) for e in entries]
+            slot = self._append_rows(np.vstack(stacks))
+            lines = []
+            for (uid, name, _), rows in zip(entries, stacks):
+                rec = self._record(slot, len(rows), uid, name)
+                lines.append(json.dumps(rec, separators=(",", ":")) + "\n")
+                slot += len(rows)
+            lines = "".join(lines)
+            with open(self._records_path(), "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def delete(self, user_id: str) -> bool:
+        with self._lock:
+            self._refresh_meta()
+            if user_id not in self._replay():
+                return False
+            self._append_record({"id": user_id, "deleted": True})
+            return True
+
+    def load(self) -> Loaded:
+        meta = self._refresh_meta()
+        live = self._replay()
+        mm = self._memmap()
+        if mm is None or not live:
+            return np.empty((0, int(meta["dim"])), dtype=self.dtype), [], []
+        user_ids = []
+        names = []
+        slots = []
+        for uid, (user_slots, name) in live.items():
+            if user_slots.stop > len(mm):
+                continue
+            user_ids.extend([uid] * len(user_slots))
+            names.extend([name] * len(user_slots))
+            slots.extend(user_slots)
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(slots) == len(mm) and np.array_equal(slots, np.arange(len(mm))):
+            # compact store: hand out the read-only map itself, so processes
+            # sharing the store share its pages instead of private copies
+            return mm, user_ids, names
+        return np.ascontiguousarray(mm[slots]), user_ids, names
+
+    def get(self, user_id: str) -> Optional[np.ndarray]:
+        """(k, dim) templates of one user, or None."""
+        self._refresh_meta()
+        entry = self._replay().get(user_id)
+        mm = self._memmap()
+        if entry is None or mm is None or entry[0].stop > len(mm):
+            return None
+        return np.array(mm[entry[0].start:entry[0].stop])
+
+    def list_users(self) -> List[dict]:
+        self._refresh_meta()
+        return [
+            {"user_id": uid, "name": name, "templates": len(slots)}
+            for uid, (slots, name) in self._replay().items()
+        ]
+
+    def stats(self) -> dict:
+        self._refresh_meta()
+        live = self._replay()
+        path = self._data_path()
+        records = path.stat().st_size // self._row_bytes if path.exists() else 0
+        templates = sum(len(slots) for slots, _ in live.values())
+        return {
+            "generation": self._meta["generation"],
+            "dtype": self.dtype.name,
+            "live": len(live),
+            "templates": templates,
+            "records": records,
+            "dead": max(0, records - templates),
+        }
+
+    def compact(self, dtype: Optional[str] = None) -> dict:
+        """
+        Rewrite live records into a new generation and drop tombstones,
+        converting the rows to `dtype` if given ("float64", "float32" or
+        "float16"). Offline operation: stop writers first.
+        """
+        if dtype is not None and np.dtype(dtype).name not in STORE_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {dtype!r} (use one of {', '.join(STORE_DTYPES)})")
+        with self._lock:
+            matrix, user_ids, names = self.load()
+            new_dtype = np.dtype(dtype or self.dtype)
+            old_gen = self._meta["generation"]
+            new_gen = old_gen + 1
+            with open(self._data_path(new_gen), "wb") as f:
+                f.write(np.ascontiguousarray(matrix, dtype=new_dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            unique, groups = group_rows(user_ids)
+            with open(self._records_path(new_gen), "w", encoding="utf-8") as f:
+                for uid, rows in zip(unique, groups):
+                    # load() keeps a user's rows adjacent, so they stay contiguous slots
+                    rec = self._record(rows[0], len(rows), uid, names[rows[0]])
+                    f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            meta = dict(self._meta, generation=new_gen, dtype=new_dtype.name)
+            self._write_meta(meta)
+            self._meta = meta
+            self._meta_stamp = _stat_stamp(self._meta_path)
+            for old in (self._data_path(old_gen), self._records_path(old_gen)):
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        return self.stats()
+
+    def migrate_from(self, legacy: "FileEmbeddingStore") -> int:
+        """One-shot import of the per-user file layout. Returns users imported."""
+        matrix, user_ids, names = legacy.load()
+        unique, groups = group_rows(user_ids)
+        self.put_many([(uid, names[rows[0]], matrix[rows]) for uid, rows in zip(unique, groups)])
+        return len(unique)
+
+
+def open_store(kind: str, directory: Optional[Path] = None):
+    """Create the configured store; a new packed store imports legacy files once."""
+    if kind == "files":
+        return FileEmbeddingStore(directory)
+    if kind != "packed":
+        raise ValueError(f"Unknown embedding store: {kind!r}")
+    store = PackedEmbeddingStore(directory)
+    if not store.exists():
+        legacy = FileEmbeddingStore(directory)
+        if legacy.exists():
+            store.migrate_from(legacy)
+    return store
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the packed face embedding store.")
+    parser.add_argument("command", choices=["migrate", "compact", "convert", "stats"])
+    parser.add_argument("--dir", type=Path, default=EMBEDDINGS_DIR, help="Embeddings directory")
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default=EMBEDDING_DTYPE, help="Row dtype for convert")
+    args = parser.parse_args(argv)
+
+    store = PackedEmbeddingStore(args.dir)
+    if args.command == "migrate":
+        if store.exists() and store.stats()["live"]:
+            print("Packed store already has entries; nothing migrated.")
+            return 1
+        n = store.migrate_from(FileEmbeddingStore(args.dir))
+        print(f"Migrated {n} users into {args.dir}.")
+    elif args.command == "compact":
+        print(json.dumps(store.compact(), indent=2))
+    elif args.command == "convert":
+        before = store.dtype.name
+        stats = store.compact(dtype=args.dtype)
+        print(f"Converted {stats['templates']} templates from {before} to {stats['dtype']}.")
+    else:
+        print(json.dumps(store.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
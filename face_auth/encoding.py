@@ -0,0 +1,83 @@
+"""
+Face landmarks and 128-D encodings from a single shape-predictor pass.
+
+face_recognition.face_landmarks() and face_encodings() each run dlib's shape
+predictor internally. FaceEncoder runs it once per face and reuses the result:
+the 5-point model when only an encoding is needed, or the 68-point model when
+something downstream (blink/EAR) also needs eye landmarks. In the latter case
+the encoder is fed the 5 points that correspond to the 5-point model (eye
+corners + nose base), which keeps encodings close to the enrolled 5-point ones.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from config import NUM_JITTERS
+from . import models
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left)
+
+# 68-point indices matching the 5-point model's parts, in its order
+_FIVE_FROM_68 = (45, 42, 36, 39, 33)
+
+
+def _rect(box: Box) -> "dlib.rectangle":
+    import dlib
+
+    top, right, bottom, left = box
+    return dlib.rectangle(left, top, right, bottom)
+
+
+def landmarks_from_shape(shape: "dlib.full_object_detection") -> Dict[str, List[Tuple[int, int]]]:
+    """Same dict layout as face_recognition.face_landmarks(model="large")."""
+    pts = [(p.x, p.y) for p in shape.parts()]
+    if len(pts) != 68:
+        return {}
+    return {
+        "chin": pts[0:17],
+        "left_eyebrow": pts[17:22],
+        "right_eyebrow": pts[22:27],
+        "nose_bridge": pts[27:31],
+        "nose_tip": pts[31:36],
+        "left_eye": pts[36:42],
+        "right_eye": pts[42:48],
+        "top_lip": pts[48:55] + [pts[64]] + [pts[63]] + [pts[62]] + [pts[61]] + [pts[60]],
+        "bottom_lip": pts[54:60] + [pts[48]] + [pts[60]] + [pts[67]] + [pts[66]] + [pts[65]] + [pts[64]],
+    }
+
+
+class FaceEncoder:
+    """Shape prediction (once per face) and ResNet face descriptors."""
+
+    def __init__(self, num_jitters: int = NUM_JITTERS):
+        self.num_jitters = num_jitters
+
+    def shapes(
+        self, rgb: np.ndarray, boxes: Sequence[Box], with_landmarks: bool = False
+    ) -> List["dlib.full_object_detection"]:
+        """One predictor pass per face: 68-point if landmarks are needed, else 5-point."""
+        api = models.api()
+        predictor = api.pose_predictor_68_point if with_landmarks else api.pose_predictor_5_point
+        return [predictor(rgb, _rect(box)) for box in boxes]
+
+    def encode(
+        self, rgb: np.ndarray, shapes: Sequence["dlib.full_object_detection"]
+    ) -> List[np.ndarray]:
+        """128-D encodings for shapes from `shapes()` (5- or 68-point)."""
+        import dlib
+
+        face_encoder = models.api().face_encoder
+        encodings = []
+        for shape in shapes:
+            if shape.num_parts == 68:
+                shape = dlib.full_object_detection(
+                    shape.rect, [shape.part(i) for i in _FIVE_FROM_68]
+                )
+            encodings.append(
+                np.array(face_encoder.compute_face_descriptor(rgb, shape, self.num_jitters))
+            )
+        return encodings
+
+    def encode_boxes(self, rgb: np.ndarray, boxes: Sequence[Box]) -> List[np.ndarray]:
+        """Encodings when no landmarks are needed (5-point predictor only)."""
+        return self.encode(rgb, self.shapes(rgb, boxes))
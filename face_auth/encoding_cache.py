@@ -0,0 +1,157 @@
+"""
+Cache of face encodings keyed by a perceptual hash of the detected face.
+
+Kiosk clients resend identical or near-identical frames: a retry after a
+network error, punch-out right after punch-in, a double click. FaceIdentifier
+still detects the face in every frame, then looks the face crop up here; on
+a hit it reuses the cached 128-D encoding, skipping landmarks and the ResNet
+encoder, and only re-matches it against the current gallery, so new
+registrations are still seen.
+
+The key is a 256-bit difference hash (dHash) of a 17x16 grayscale thumbnail
+of the face crop: each bit says whether a cell is brighter than its right
+neighbour, which survives JPEG re-encoding, small exposure changes and
+sensor noise. Hashing the face rather than the whole frame means a different
+person standing in the same spot never gets someone else's encoding. A
+lookup takes the closest cached hash within `max_distance` differing bits (a
+vectorized Hamming scan; the cache is small) whose face box also overlaps
+the detected one by at least `min_iou`.
+
+Entries expire after `ttl` seconds. The total size is capped at `max_bytes`,
+evicting least recently used entries first.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    ENCODING_CACHE_MAX_BYTES,
+    ENCODING_CACHE_MAX_DISTANCE,
+    ENCODING_CACHE_MIN_IOU,
+    ENCODING_CACHE_TTL,
+)
+from .detection import box_iou
+
+HASH_SIZE = 16  # HASH_SIZE**2 bits
+_ENTRY_OVERHEAD = 256  # bytes per entry besides the arrays (dict slot, tuple, box, floats)
+
+
+def face_hash(rgb: np.ndarray, box: tuple) -> bytes:
+    """256-bit dHash of the (top, right, bottom, left) face crop of an RGB frame, as 32 bytes."""
+    import cv2
+
+    top, right, bottom, left = box
+    crop = rgb[max(top, 0):bottom, max(left, 0):right]
+    if crop.size == 0:
+        crop = rgb
+    step = max(1, crop.shape[1] // 64)
+    small = crop[::step, ::step]
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    thumb = cv2.resize(small, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return np.packbits(thumb[:, 1:] > thumb[:, :-1]).tobytes()
+
+
+class EncodingCache:
+    """Bounded LRU + TTL map from face hash to (encoding, face box)."""
+
+    def __init__(
+        self,
+        max_bytes: int = ENCODING_CACHE_MAX_BYTES,
+        ttl: float = ENCODING_CACHE_TTL,
+        max_distance: int = ENCODING_CACHE_MAX_DISTANCE,
+        min_iou: float = ENCODING_CACHE_MIN_IOU,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.min_iou = min_iou
+        self._entries: "OrderedDict[bytes, Tuple[np.ndarray, tuple, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def _size(encoding: np.ndarray) -> int:
+        return encoding.nbytes + HASH_SIZE * HASH_SIZE // 8 + _ENTRY_OVERHEAD
+
+    def _drop_locked(self, key: bytes) -> None:
+        encoding, _, _ = self._entries.pop(key)
+        self._bytes -= self._size(encoding)
+
+    def _candidates_locked(self, key: bytes) -> List[Tuple[int, bytes]]:
+        """(distance, key) of cached hashes within max_distance bits, nearest first."""
+        exact = [(0, key)] if key in self._entries else []
+        if self.max_distance <= 0 or not self._entries:
+            return exact
+        keys = list(self._entries)
+        table = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), -1)
+        distance = np.unpackbits(table ^ np.frombuffer(key, dtype=np.uint8), axis=1).sum(axis=1)
+        near = np.flatnonzero((distance > 0) & (distance <= self.max_distance))
+        return exact + sorted((int(distance[i]), keys[i]) for i in near)
+
+    def get(self, key: bytes, box: tuple, now: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Encoding cached for this face hash or a close one whose face box
+        overlaps `box` by at least min_iou, else None.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for distance, found in self._candidates_locked(key):
+                encoding, cached_box, stamp = self._entries[found]
+                if now - stamp > self.ttl:
+                    self._drop_locked(found)
+                    self.expired += 1
+                    continue
+                if box_iou(cached_box, box) < self.min_iou:
+                    continue
+                self._entries.move_to_end(found)
+                if distance == 0:
+                    self.hits += 1
+                else:
+                    self.near_hits += 1
+                return encoding
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, encoding: np.ndarray, box: tuple, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        size = self._size(encoding)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop_locked(key)
+            self._entries[key] = (encoding, tuple(box), now)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop_locked(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
@@ -0,0 +1,358 @@
+"""
+Bulk (offline) enrollment: register many users from a directory or a CSV
+manifest in one run.
+
+Sources:
+- a directory with one sub-directory per user (`<root>/<user_id>/*.jpg`; the
+  name is read from `name.txt` inside it, else the user_id) or one image per
+  user (`<root>/<user_id>.jpg`);
+- a CSV manifest with columns user_id,name,image_path (paths relative to the
+  manifest's directory). Several rows may share a user_id.
+
+Images are decoded, detected and encoded across a process pool (each worker
+owns its own detector and encoder). Images far from the rest of a user's
+images, usually someone else or a bad crop, are dropped; the remaining
+encodings become the user's templates (at most MAX_TEMPLATES_PER_USER, the
+most redundant left out). Each user's centroid is checked against the gallery
+and against the other new users: a match under FACE_MATCH_THRESHOLD with a
+different user_id is reported as a likely duplicate identity. All template
+sets are then written to the store in a single put_many (replacing those of
+users already registered), and the gallery reloads once.
+
+    python -m face_auth.enrollment PATH [--workers N] [--dry-run] [--skip-duplicates] [--report FILE]
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    ENROLL_OUTLIER_DISTANCE,
+    ENROLL_WORKERS,
+    ENROLL_ZIP_MAX_BYTES,
+    ENROLL_ZIP_MAX_FILES,
+    FACE_MATCH_THRESHOLD,
+    INGEST_MAX_SIDE,
+    MAX_TEMPLATES_PER_USER,
+)
+from .gallery import select_templates
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+Item = Tuple[str, str, str]  # (user_id, name, image path)
+
+_detector = None
+_encoder = None
+
+
+def scan_directory(root: Path) -> List[Item]:
+    """(user_id, name, path) for every image under a per-user directory layout."""
+    root = Path(root)
+    items: List[Item] = []
+    for entry in sorted(root.iterdir()):
+        if entry.is_dir():
+            name_file = entry / "name.txt"
+            name = name_file.read_text(encoding="utf-8").strip() if name_file.exists() else ""
+            for image in sorted(entry.iterdir()):
+                if image.suffix.lower() in IMAGE_SUFFIXES:
+                    items.append((entry.name, name or entry.name, str(image)))
+        elif entry.suffix.lower() in IMAGE_SUFFIXES:
+            items.append((entry.stem, entry.stem, str(entry)))
+    return items
+
+
+def read_manifest(path: Path, confine: bool = False) -> List[Item]:
+    """
+    (user_id, name, path) rows of a user_id,name,image_path CSV. Relative
+    image paths are taken from the manifest's directory. With confine=True
+    (an uploaded manifest) every image must stay inside that directory:
+    an absolute path, a '..' part or a path resolving elsewhere raises
+    ValueError, so the server never opens files outside the upload.
+    """
+    path = Path(path)
+    base = path.parent.resolve()
+    items: List[Item] = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            user_id = (row.get("user_id") or "").strip()
+            image = (row.get("image_path") or "").strip()
+            if not user_id or not image:
+                continue
+            name = (row.get("name") or "").strip() or user_id
+            image_path = Path(image)
+            if confine:
+                parts = image.replace("\\", "/").split("/")
+                if image.startswith(("/", "\\")) or ".." in parts or ":" in parts[0]:
+                    raise ValueError(f"Unsafe image path in manifest: {image!r}")
+            if not image_path.is_absolute():
+                image_path = path.parent / image_path
+            if confine and not image_path.resolve().is_relative_to(base):
+                raise ValueError(f"Unsafe image path in manifest: {image!r}")
+            items.append((user_id, name, str(image_path)))
+    return items
+
+
+def collect(source: Path, confine: bool = False) -> List[Item]:
+    """Items of a manifest, or of a directory (its manifest.csv, else its per-user folders)."""
+    source = Path(source)
+    if source.is_dir():
+        manifest = source / "manifest.csv"
+        return read_manifest(manifest, confine) if manifest.exists() else scan_directory(source)
+    return read_manifest(source, confine)
+
+
+def extract_archive(
+    zf: zipfile.ZipFile,
+    dest: Path,
+    max_files: int = ENROLL_ZIP_MAX_FILES,
+    max_bytes: int = ENROLL_ZIP_MAX_BYTES,
+) -> None:
+    """
+    Extract an uploaded zip under dest, refusing (ValueError) archives with
+    more than max_files members, absolute or '..' member paths, or more than
+    max_bytes of content. The declared sizes are checked up front and the
+    bytes actually written are counted too, since the header can lie.
+    """
+    members = zf.infolist()
+    if len(members) > max_files:
+        raise ValueError(f"Archive has {len(members)} entries (max {max_files}).")
+    for info in members:
+        parts = info.filename.replace("\\", "/").split("/")
+        if info.filename.startswith(("/", "\\")) or ".." in parts or (parts and ":" in parts[0]):
+            raise ValueError(f"Unsafe path in archive: {info.filename!r}")
+    if sum(info.file_size for info in members) > max_bytes:
+        raise ValueError(f"Archive expands to more than {max_bytes:,} bytes.")
+    dest = Path(dest)
+    budget = max_bytes
+    for info in members:
+        target = dest / info.filename
+        if info.is_dir():
+            target.mkdir(parents=True, exist_ok=True)
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with zf.open(info) as src, open(target, "wb") as out:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                budget -= len(chunk)
+                if budget < 0:
+                    raise ValueError(f"Archive expands to more than {max_bytes:,} bytes.")
+                out.write(chunk)
+
+
+def _init_worker() -> None:
+    global _detector, _encoder
+    from .detection import FaceDetector
+    from .encoding import FaceEncoder
+
+    _detector = FaceDetector()
+    _encoder = FaceEncoder()
+
+
+def encode_image(path: str, max_side: int = INGEST_MAX_SIDE) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Decode, detect and encode one image. Returns (encoding, None) or (None, reason)."""
+    from .ingest import decode_rgb
+
+    if _detector is None:
+        _init_worker()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return None, f"unreadable: {e.strerror or e}"
+    rgb, err = decode_rgb(data, max_side)
+    if err:
+        return None, "could not decode"
+    boxes = _detector.detect(rgb, all_scales=True)  # a small second face still counts
+    if not boxes:
+        return None, "no face"
+    if len(boxes) > 1:
+        return None, "multiple faces"
+    encodings = _encoder.encode_boxes(rgb, boxes)
+    if not encodings:
+        return None, "no encoding"
+    return encodings[0], None
+
+
+def _encode_all(paths: List[str], workers: int) -> List[Tuple[Optional[np.ndarray], Optional[str]]]:
+    if workers <= 1 or len(paths) < 2:
+        return [encode_image(p) for p in paths]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    ) as executor:
+        chunksize = max(1, min(32, len(paths) // (workers * 4)))
+        return list(executor.map(encode_image, paths, chunksize=chunksize))
+
+
+def combine(
+    encodings: List[np.ndarray],
+    outlier_distance: float = ENROLL_OUTLIER_DISTANCE,
+    max_templates: int = MAX_TEMPLATES_PER_USER,
+) -> Tuple[np.ndarray, List[int]]:
+    """
+    A user's templates from their encodings: those within outlier_distance
+    of the median encoding, at most max_templates of them.
+    Returns ((k, dim) templates, indices dropped as outliers).
+    """
+    stack = np.vstack(encodings)
+    dropped: List[int] = []
+    if len(stack) >= 3:
+        center = np.median(stack, axis=0)
+        dist = np.linalg.norm(stack - center, axis=1)
+        keep = dist <= outlier_distance
+        if not keep.any():
+            keep = dist == dist.min()
+        dropped = [int(i) for i in np.flatnonzero(~keep)]
+        stack = stack[keep]
+    return stack[select_templates(stack, max_templates)], dropped
+
+
+def find_duplicates(
+    centroids: np.ndarray,
+    user_ids: List[str],
+    gallery_view=None,
+    threshold: float = FACE_MATCH_THRESHOLD,
+    chunk: int = 512,
+) -> List[dict]:
+    """
+    Pairs of different user_ids that match: each new user's centroid against
+    the existing gallery (searcher, user_ids, names from
+    EmbeddingGallery.search_view()) and against the other new centroids.
+    """
+    from .matcher import ExactMatcher
+
+    found: List[dict] = []
+    seen = set()
+    batch = ExactMatcher().fit(centroids)
+    for lo in range(0, len(centroids), chunk):
+        queries = centroids[lo:lo + chunk]
+        for offset, match in enumerate(batch.search_batch(queries, k=2)):
+            i = lo + offset
+            for j, d in zip(match.indices, match.distances):
+                pair = (min(i, int(j)), max(i, int(j)))
+                if j != i and d <= threshold and user_ids[j] != user_ids[i] and pair not in seen:
+                    seen.add(pair)
+                    found.append({"user_id": user_ids[pair[1]], "matches": user_ids[pair[0]],
+                                  "distance": round(float(d), 4), "existing": False})
+        if gallery_view is not None:
+            matcher, gallery_ids, _ = gallery_view
+            if len(matcher):
+                for offset, match in enumerate(matcher.search_batch(queries, k=2)):
+                    i = lo + offset
+                    for j, d in zip(match.indices, match.distances):
+                        if d <= threshold and gallery_ids[int(j)] != user_ids[i]:
+                            found.append({"user_id": user_ids[i], "matches": gallery_ids[int(j)],
+                                          "distance": round(float(d), 4), "existing": True})
+                            break
+    return found
+
+
+def enroll(
+    items: List[Item],
+    registry=None,
+    workers: int = ENROLL_WORKERS,
+    dry_run: bool = False,
+    skip_duplicates: bool = False,
+) -> dict:
+    """
+    Encode every item, build each user's templates, check for duplicate
+    identities and (unless dry_run) register all users in one store write.
+    Returns a report dict.
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    results = _encode_all([path for _, _, path in items], workers)
+    encode_seconds = time.perf_counter() - start
+
+    skipped: List[dict] = []
+    per_user: Dict[str, dict] = {}
+    for (user_id, name, path), (encoding, reason) in zip(items, results):
+        if encoding is None:
+            skipped.append({"user_id": user_id, "image": path, "reason": reason})
+            continue
+        entry = per_user.setdefault(user_id, {"name": name, "encodings": [], "paths": []})
+        entry["encodings"].append(encoding)
+        entry["paths"].append(path)
+
+    user_ids: List[str] = []
+    names: List[str] = []
+    templates: List[np.ndarray] = []
+    for user_id, entry in per_user.items():
+        user_templates, dropped = combine(entry["encodings"])
+        for i in dropped:
+            skipped.append({"user_id": user_id, "image": entry["paths"][i], "reason": "inconsistent with other images"})
+        user_ids.append(user_id)
+        names.append(entry["name"])
+        templates.append(user_templates)
+
+    duplicates: List[dict] = []
+    if templates:
+        centroids = np.vstack([t.mean(axis=0) for t in templates])
+        view = registry.get_gallery().search_view() if registry is not None else None
+        duplicates = find_duplicates(centroids, user_ids, view)
+
+    flagged = {d["user_id"] for d in duplicates} if skip_duplicates else set()
+    entries = [
+        (uid, name, tpl) for uid, name, tpl in zip(user_ids, names, templates) if uid not in flagged
+    ]
+    if entries and registry is not None and not dry_run:
+        registry.register_many(entries)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "images": len(items),
+        "encoded": len(items) - sum(1 for r in results if r[0] is None),
+        "users": len(user_ids),
+        "enrolled": 0 if dry_run or registry is None else len(entries),
+        "skipped": skipped,
+        "duplicates": duplicates,
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "images_per_s": round(len(items) / encode_seconds, 2) if encode_seconds > 0 else None,
+        "dry_run": dry_run,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Enroll many users from a directory or CSV manifest.")
+    parser.add_argument("source", type=Path, help="Directory (per-user folders or manifest.csv) or a CSV manifest")
+    parser.add_argument("--workers", type=int, default=ENROLL_WORKERS, help="Encoder processes (0 = one per CPU)")
+    parser.add_argument("--dry-run", action="store_true", help="Encode and report without registering")
+    parser.add_argument("--skip-duplicates", action="store_true", help="Do not register users that match another identity")
+    parser.add_argument("--report", type=Path, default=None, help="Write the full JSON report here")
+    args = parser.parse_args(argv)
+
+    from .face_registry import FaceRegistry
+
+    items = collect(args.source)
+    if not items:
+        print(f"No images found in {args.source}.")
+        return 1
+    report = enroll(items, FaceRegistry(), args.workers, args.dry_run, args.skip_duplicates)
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(
+        f"{report['images']} images, {report['users']} users, {report['enrolled']} enrolled "
+        f"in {report['seconds']}s ({report['images_per_s']} images/s, {report['workers']} workers)"
+    )
+    print(f"skipped images: {len(report['skipped'])}, possible duplicate identities: {len(report['duplicates'])}")
+    for d in report["duplicates"][:20]:
+        where = "registered" if d["existing"] else "in this batch"
+        print(f"  {d['user_id']} ~ {d['matches']} ({where}, distance {d['distance']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Streaming attendance exports.
+
+Each function takes the row chunks from AttendanceDB.iter_records() and yields
+encoded output chunk by chunk, so a response can stream millions of rows with
+memory bounded by one chunk. CSV needs only the standard library; Parquet and
+Arrow IPC need the optional pyarrow package.
+"""
+import csv
+import importlib.util
+import io
+from typing import Iterable, Iterator, List
+
+from .attendance import RECORD_COLUMNS
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+def available_formats() -> List[str]:
+    has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    return [f for f in FORMATS if f == "csv" or has_pyarrow]
+
+
+def csv_chunks(chunks: Iterable[List[tuple]]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(RECORD_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def _schema(pa):
+    return pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.string()),
+        ("name", pa.string()),
+        ("action", pa.string()),
+        ("timestamp", pa.string()),
+    ])
+
+
+def _table(pa, rows: List[tuple], schema):
+    columns = list(zip(*rows))
+    return pa.Table.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+    )
+
+
+def arrow_chunks(chunks: Iterable[List[tuple]], fmt: str = "parquet") -> Iterator[bytes]:
+    """Parquet (one row group per chunk) or Arrow IPC stream (one batch per chunk)."""
+    try:  # optional dependency, imported only when an export needs it
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet/Arrow export requires pyarrow (pip install pyarrow).") from None
+    schema = _schema(pa)
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for rows in chunks:
+            writer.write_table(_table(pa, rows, schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
@@ -1,16 +1,16 @@
 """Identify a face from camera frame against registered users."""
-from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
-import cv2
-import face_recognition
 import numpy as np
 
-import sys
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from config import FACE_MATCH_THRESHOLD, NUM_JITTERS, MODEL
+from config import ENCODING_CACHE_ENABLED, FACE_MATCH_THRESHOLD, MATCH_TOP_K
+from . import models
+from .detection import FaceDetector
+from .encoding import FaceEncoder, landmarks_from_shape
+from .encoding_cache import EncodingCache, face_hash
 from .face_registry import FaceRegistry
-from .spoof_detection import SpoofDetector
+from .spoof_detection import BlinkState, SpoofDetector, combined_ear
+from .timing import StageTimer
 
 
 class FaceIdentifier:
@@ -21,38 +21,90 @@ class FaceIdentifier:
         registry: Optional[FaceRegistry] = None,
         spoof_detector: Optional[SpoofDetector] = None,
         match_threshold: float = FACE_MATCH_THRESHOLD,
+        detector: Optional[FaceDetector] = None,
+        encoder: Optional[FaceEncoder] = None,
+        encoding_cache: Optional[EncodingCache] = None,
     ):
         self.registry = registry or FaceRegistry()
         self.spoof = spoof_detector or SpoofDetector()
+        self.detector = detector or self.registry.detector
+        self.encoder = encoder or self.registry.encoder
         self.match_threshold = match_threshold
-        self._encodings: List[np.ndarray] = []
-        self._user_ids: List[str] = []
-        self._names: List[str] = []
-        self._refresh_encodings()
+        self.gallery = None  # loaded on first use (or by warm_up)
+        if encoding_cache is None and ENCODING_CACHE_ENABLED:
+            encoding_cache = EncodingCache()
+        self.encoding_cache = encoding_cache  # per process: each inference worker has its own
 
     def _refresh_encodings(self) -> None:
-        """Reload encodings from registry."""
-        self._encodings, self._user_ids, self._names = self.registry.get_all_encodings()
+        """Pick up the registry's resident gallery (reloads only if it changed on disk)."""
+        self.gallery = self.registry.get_gallery()
+
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Load the dlib models and the gallery, then run one inference on a
+        blank frame (detector, 68-point predictor, encoder, matcher), so the
+        first real request does not pay for any of it.
+        Returns milliseconds per step.
+        """
+        timings: Dict[str, float] = {}
+        timer = StageTimer(timings)
+        with timer.stage("models"):
+            models.api()
+        with timer.stage("gallery"):
+            self._refresh_encodings()
+            matcher, user_ids, _ = self.gallery.search_view()
+        frame = np.full((240, 320, 3), 128, dtype=np.uint8)
+        with timer.stage("inference"):
+            self.detector.detect(frame)
+            shapes = self.encoder.shapes(frame, [(60, 220, 180, 100)], with_landmarks=True)
+            encoding = self.encoder.encode(frame, shapes)[0]
+            if user_ids:
+                matcher.search(encoding, k=MATCH_TOP_K)
+        return timings
+
+    @staticmethod
+    def _as_rgb(frame: np.ndarray, is_rgb: bool, timer: Optional[StageTimer] = None) -> np.ndarray:
+        """The frame itself if it is already RGB, else an RGB copy of the BGR frame."""
+        if is_rgb:
+            return frame
+        import cv2
+
+        if timer is None:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with timer.stage("convert"):
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
     def identify(
         self,
-        frame_bgr: np.ndarray,
+        frame: np.ndarray,
         run_spoof_check: bool = True,
         require_liveness: bool = True,
+        timings: Optional[Dict[str, float]] = None,
+        is_rgb: bool = False,
+        lighting_checked: bool = False,
     ) -> Tuple[Optional[str], Optional[str], str, Optional[Tuple]]:
         """
-        Identify the face in frame (BGR from OpenCV).
+        Identify the face in frame (BGR from OpenCV, or RGB with is_rgb=True,
+        which is used as-is by detection, spoof and encoding without a copy).
         Returns (user_id, name, message, face_box).
         face_box = (top, right, bottom, left) or None.
+        If `timings` is given, per-stage milliseconds are added to it.
+        lighting_checked=True skips the lighting check (the caller ran a
+        FramePrefilter on the frame).
+        A face found in the encoding cache (same face crop, overlapping box)
+        skips landmarks and encoding and is only matched; with blink
+        liveness the landmarks are needed, so the cache is not used.
         """
-        self._refresh_encodings()
-        if not self._encodings:
+        timer = StageTimer(timings)
+        with timer.stage("gallery"):
+            self._refresh_encodings()
+            matcher, user_ids, names = self.gallery.search_view()
+        if not user_ids:
             return None, None, "No users registered. Please register first.", None
 
-        rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(
-            rgb, model=MODEL, number_of_times_to_upsample=1
-        )
+        need_landmarks = run_spoof_check and self.spoof.require_blink
+        rgb = self._as_rgb(frame, is_rgb, timer)
+        face_locations = self.detector.detect(rgb, timer.timings)
         if not face_locations:
             return None, None, "No face detected. Look at the camera.", None
 
@@ -60,39 +112,217 @@ class FaceIdentifier:
             return None, None, "Only one person should be in frame.", None
 
         face_loc = face_locations[0]
-        face_landmarks_list = face_recognition.face_landmarks(rgb, face_locations)
-        face_landmarks = face_landmarks_list[0] if face_landmarks_list else None
+        cache_key = None
+        encoding = None
+        if self.encoding_cache is not None and not need_landmarks:
+            with timer.stage("cache"):
+                cache_key = face_hash(rgb, face_loc)
+                encoding = self.encoding_cache.get(cache_key, face_loc)
+        if encoding is None:
+            # one shape-predictor pass, shared by the blink check and the encoder
+            with timer.stage("landmarks"):
+                shapes = self.encoder.shapes(rgb, face_locations, with_landmarks=need_landmarks)
+        face_landmarks = landmarks_from_shape(shapes[0]) if need_landmarks else None
 
         if run_spoof_check:
-            if require_liveness:
-                self.spoof.reset_blink_state()
-            passed, msg = self.spoof.verify_frame(frame_bgr, face_loc, face_landmarks)
-            if not passed and require_liveness and self.spoof.require_blink:
-                passed, msg = self.spoof.verify_frame(frame_bgr, face_loc, face_landmarks)
+            with timer.stage("spoof"):
+                # fresh per-call state: concurrent requests never share blink history
+                state = BlinkState()
+                lighting = not lighting_checked
+                passed, msg = self.spoof.verify_frame(frame, face_loc, face_landmarks, state, is_rgb, lighting)
+                if not passed and require_liveness and self.spoof.require_blink:
+                    passed, msg = self.spoof.verify_frame(frame, face_loc, face_landmarks, state, is_rgb, lighting)
             if not passed:
                 return None, None, msg, face_loc
 
-        encodings = face_recognition.face_encodings(
-            rgb, face_locations, num_jitters=NUM_JITTERS, model="small"
-        )
-        if not encodings:
-            return None, None, "Could not encode face.", face_loc
+        if encoding is None:
+            with timer.stage("encode"):
+                encodings = self.encoder.encode(rgb, shapes)
+            if not encodings:
+                return None, None, "Could not encode face.", face_loc
+            encoding = encodings[0]
+            if cache_key is not None:
+                self.encoding_cache.put(cache_key, encoding, face_loc)
+        return self._match_one(matcher, user_ids, names, encoding, face_loc, timer)
 
-        encoding = encodings[0]
-        distances = face_recognition.face_distance(self._encodings, encoding)
-        best_idx = int(np.argmin(distances))
-        best_dist = float(distances[best_idx])
+    def _match_one(
+        self,
+        matcher,
+        user_ids: List[str],
+        names: List[str],
+        encoding: np.ndarray,
+        face_loc: Tuple,
+        timer: StageTimer,
+    ) -> Tuple[Optional[str], Optional[str], str, Optional[Tuple]]:
+        with timer.stage("match"):
+            match = matcher.search(encoding, k=MATCH_TOP_K)
+        best_idx = match.best_index
+        best_dist = match.best_distance
 
         if best_dist > self.match_threshold:
             return None, None, f"No match (distance {best_dist:.2f}). Register or try again.", face_loc
 
         return (
-            self._user_ids[best_idx],
-            self._names[best_idx],
+            user_ids[best_idx],
+            names[best_idx],
             "Match found.",
             face_loc,
         )
 
+    def analyze_frame(
+        self,
+        frame: np.ndarray,
+        want_identity: bool = True,
+        want_ear: bool = True,
+        timings: Optional[Dict[str, float]] = None,
+        is_rgb: bool = False,
+        roi: Optional[Tuple[int, int, int, int]] = None,
+        lighting_checked: bool = False,
+    ) -> dict:
+        """
+        Stateless per-frame analysis for liveness sessions: lighting check,
+        the face box, the eye aspect ratio (if want_ear) and, only if
+        want_identity, the encoding + gallery match. The caller keeps the
+        per-session blink state, so this can run in any worker. Frames are
+        BGR, or RGB with is_rgb=True. With `roi` (the last face box from a
+        FaceTracker) detection searches only around it, falling back to the
+        full frame if the face is not there. lighting_checked=True skips the
+        lighting check (done by the caller's FramePrefilter).
+        Returns {ok, message, face_box, lighting_ok, ear, user_id, name,
+        distance, encoding, detect} where detect is "roi" or "full".
+        """
+        timer = StageTimer(timings)
+        result = {"ok": False, "message": "", "face_box": None, "lighting_ok": False,
+                  "ear": None, "user_id": None, "name": None, "distance": None, "encoding": None,
+                  "detect": "full"}
+        rgb = self._as_rgb(frame, is_rgb, timer)
+        face_locations = []
+        if roi is not None:
+            face_locations = self.detector.detect_roi(rgb, roi, timer.timings)
+            if face_locations:
+                result["detect"] = "roi"
+        if not face_locations:
+            face_locations = self.detector.detect(rgb, timer.timings)
+        if not face_locations:
+            result["message"] = "No face detected. Look at the camera."
+            return result
+        if len(face_locations) > 1:
+            result["message"] = "Only one person should be in frame."
+            return result
+        face_loc = face_locations[0]
+        result["face_box"] = list(face_loc)
+
+        if not lighting_checked:
+            with timer.stage("spoof"):
+                passed, msg = self.spoof.check_lighting(frame, is_rgb)
+            if not passed:
+                result["message"] = msg
+                return result
+        result["lighting_ok"] = True
+
+        with timer.stage("landmarks"):
+            shapes = self.encoder.shapes(rgb, face_locations, with_landmarks=want_ear)
+        if want_ear:
+            result["ear"] = combined_ear(landmarks_from_shape(shapes[0]))
+
+        if want_identity:
+            with timer.stage("gallery"):
+                self._refresh_encodings()
+                matcher, user_ids, names = self.gallery.search_view()
+            if not user_ids:
+                result["message"] = "No users registered. Please register first."
+                return result
+            with timer.stage("encode"):
+                encoding = self.encoder.encode(rgb, shapes)[0]
+            with timer.stage("match"):
+                match = matcher.search(encoding, k=MATCH_TOP_K)
+            result["distance"] = match.best_distance
+            if match.best_distance > self.match_threshold:
+                result["message"] = f"No match (distance {match.best_distance:.2f}). Register or try again."
+                return result
+            result["user_id"] = user_ids[match.best_index]
+            result["name"] = names[match.best_index]
+            result["encoding"] = encoding  # lets a confirmed punch refresh the user's templates
+        result["ok"] = True
+        return result
+
+    def identify_batch(
+        self,
+        frames: Sequence[np.ndarray],
+        run_spoof_check: bool = True,
+        is_rgb: bool = False,
+        lighting_checked: bool = False,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[dict]:
+        """
+        Identify every face in every frame (BGR, or RGB with is_rgb=True).
+        Faces from all frames are matched against the gallery in one matrix
+        operation.
+        Returns one dict per face (or per frame without a usable face):
+        {frame, user_id, name, message, face_box, distance}.
+        Spoof check is lighting only (skipped if lighting_checked); blink
+        liveness needs a frame session.
+        """
+        timer = StageTimer(timings)
+        with timer.stage("gallery"):
+            self._refresh_encodings()
+            matcher, user_ids, names = self.gallery.search_view()
+        if not user_ids:
+            return [
+                _batch_result(i, None, "No users registered. Please register first.")
+                for i in range(len(frames))
+            ]
+
+        rgb_frames = [self._as_rgb(f, is_rgb, timer) for f in frames]
+        with timer.stage("detect"):
+            all_locations = self.detector.detect_batch(rgb_frames)
+
+        results: List[dict] = []
+        pending: List[dict] = []
+        embeddings: List[np.ndarray] = []
+        for i, (frame, rgb, locations) in enumerate(zip(frames, rgb_frames, all_locations)):
+            if not locations:
+                results.append(_batch_result(i, None, "No face detected. Look at the camera."))
+                continue
+            if run_spoof_check and not lighting_checked:
+                with timer.stage("spoof"):
+                    passed, msg = self.spoof.check_lighting(frame, is_rgb)
+                if not passed:
+                    results.extend(_batch_result(i, loc, msg) for loc in locations)
+                    continue
+            with timer.stage("encode"):
+                encodings = self.encoder.encode_boxes(rgb, locations)
+            for loc, encoding in zip(locations, encodings):
+                result = _batch_result(i, loc, "")
+                results.append(result)
+                pending.append(result)
+                embeddings.append(encoding)
+
+        if embeddings:
+            with timer.stage("match"):
+                matches = matcher.search_batch(np.vstack(embeddings), k=MATCH_TOP_K)
+            for result, match in zip(pending, matches):
+                dist = match.best_distance
+                result["distance"] = dist
+                if dist > self.match_threshold:
+                    result["message"] = f"No match (distance {dist:.2f}). Register or try again."
+                else:
+                    result["user_id"] = user_ids[match.best_index]
+                    result["name"] = names[match.best_index]
+                    result["message"] = "Match found."
+        return results
+
     def identify_without_spoof(self, frame_bgr: np.ndarray) -> Tuple[Optional[str], Optional[str], str, Optional[Tuple]]:
         """Identify without spoof/liveness check (e.g. for demo or relaxed mode)."""
         return self.identify(frame_bgr, run_spoof_check=False, require_liveness=False)
+
+
+def _batch_result(frame_idx: int, face_box: Optional[Tuple], message: str) -> dict:
+    return {
+        "frame": frame_idx,
+        "user_id": None,
+        "name": None,
+        "message": message,
+        "face_box": list(face_box) if face_box else None,
+        "distance": None,
+    }
@@ -1,121 +1,227 @@
-"""Register users by storing face embeddings."""
-import json
+"""
+Register users by storing face embeddings.
+
+Each user holds up to MAX_TEMPLATES_PER_USER templates. Registering an
+existing user adds a template rather than overwriting (pass replace=True to
+start over), and adapt() adds the encoding of a confirmed, closely matched
+punch. Beyond the cap the most redundant template is evicted; the first one
+(the original enrollment) is kept.
+"""
+import threading
 from pathlib import Path
 from typing import List, Optional, Tuple
 
-import face_recognition
 import numpy as np
 
-import sys
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from config import EMBEDDINGS_DIR, FACE_MATCH_THRESHOLD, NUM_JITTERS, MODEL
+from config import (
+    EMBEDDINGS_DIR,
+    EMBEDDING_STORE,
+    FACE_MATCH_THRESHOLD,
+    GALLERY_DTYPE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    MATCH_CANDIDATES,
+    MATCH_QUANTIZATION,
+    MATCH_RERANK,
+    MATCHER,
+    MAX_TEMPLATES_PER_USER,
+    TEMPLATE_ADAPT_DISTANCE,
+    TEMPLATE_MIN_NOVELTY,
+)
+from . import models
+from .detection import FaceDetector
+from .embedding_store import open_store
+from .encoding import FaceEncoder
+from .gallery import EmbeddingGallery, select_templates
 
 
 class FaceRegistry:
     """Register faces and store 128-D embeddings for later identification."""
 
-    def __init__(self, embeddings_dir: Optional[Path] = None):
+    def __init__(
+        self,
+        embeddings_dir: Optional[Path] = None,
+        store_kind: str = EMBEDDING_STORE,
+        detector: Optional[FaceDetector] = None,
+        encoder: Optional[FaceEncoder] = None,
+        max_templates: int = MAX_TEMPLATES_PER_USER,
+    ):
         self.embeddings_dir = Path(embeddings_dir or EMBEDDINGS_DIR)
         self.embeddings_dir.mkdir(parents=True, exist_ok=True)
-        self._index_path = self.embeddings_dir / "index.json"
-
-    def _load_index(self) -> dict:
-        """Load user_id -> filename mapping."""
-        if self._index_path.exists():
-            with open(self._index_path, "r") as f:
-                return json.load(f)
-        return {}
-
-    def _save_index(self, index: dict) -> None:
-        with open(self._index_path, "w") as f:
-            json.dump(index, f, indent=2)
+        self.store = open_store(store_kind, self.embeddings_dir)
+        self.detector = detector or FaceDetector()
+        self.encoder = encoder or FaceEncoder()
+        self._gallery: Optional[EmbeddingGallery] = None
+        self._gallery_lock = threading.Lock()
+        self._template_lock = threading.Lock()
+        self.max_templates = max(1, max_templates)
+        self.adapted = 0
 
     def register_from_image(
-        self, image: np.ndarray, user_id: str, name: str
+        self, image: np.ndarray, user_id: str, name: str, is_rgb: bool = False, replace: bool = False
     ) -> Tuple[bool, str]:
         """
-        Register a user from a single face image.
+        Register a user from a single face image (BGR, or RGB with is_rgb=True,
+        e.g. from face_auth.ingest). An existing user gains a template unless
+        replace=True.
         Returns (success, message).
         """
         import cv2
         if isinstance(image, (str, Path)):
-            rgb = face_recognition.load_image_file(str(image))
+            rgb = models.api().load_image_file(str(image))
         elif len(image.shape) == 2:
             rgb = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        elif is_rgb:
+            rgb = image
         else:
             # Assume BGR from OpenCV (e.g. cv2.imdecode)
             rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        face_locations = face_recognition.face_locations(
-            rgb, model=MODEL, number_of_times_to_upsample=1
-        )
+        face_locations = self.detector.detect(rgb, all_scales=True)  # a small second face still counts
         if not face_locations:
             return False, "No face detected in image. Ensure good lighting and a clear view."
 
         if len(face_locations) > 1:
             return False, "Multiple faces detected. Please use an image with only one face."
 
-        encodings = face_recognition.face_encodings(
-            rgb, face_locations, num_jitters=NUM_JITTERS, model="small"
-        )
+        encodings = self.encoder.encode_boxes(rgb, face_locations)
         if not encodings:
             return False, "Could not compute face encoding."
 
-        embedding = encodings[0]
-        safe_id = "".join(c if c.isalnum() or c in "_-" else "_" for c in user_id)
-        emb_path = self.embeddings_dir / f"{safe_id}.npy"
-        meta_path = self.embeddings_dir / f"{safe_id}.json"
+        count = self.add_template(user_id, name, encodings[0], replace=replace)
+        suffix = f", {count} templates" if count > 1 else ""
+        return True, f"Registered successfully: {name} ({user_id}{suffix})"
 
-        np.save(emb_path, embedding)
-        with open(meta_path, "w") as f:
-            json.dump({"user_id": user_id, "name": name}, f, indent=2)
+    def _put_templates(self, user_id: str, name: str, templates: np.ndarray) -> None:
+        before = self.store.stamp()
+        self.store.put(user_id, name, templates)
+        gallery = self._gallery_for_update(before)
+        if gallery is not None:
+            gallery.upsert(user_id, name, templates, stamp=self.store.stamp())
 
-        index = self._load_index()
-        index[user_id] = {"file": f"{safe_id}.npy", "name": name}
-        self._save_index(index)
-        return True, f"Registered successfully: {name} ({user_id})"
+    def add_template(self, user_id: str, name: str, embedding: np.ndarray, replace: bool = False) -> int:
+        """
+        Add one embedding to a user's templates (or make it the only one with
+        replace=True), evicting the most redundant beyond the cap. Returns the
+        user's template count.
+        """
+        return self._add_template(user_id, name, embedding, replace)[0]
+
+    def _add_template(self, user_id: str, name: str, embedding: np.ndarray, replace: bool) -> Tuple[int, bool]:
+        """(template count, whether the embedding was stored)."""
+        embedding = np.asarray(embedding).reshape(1, -1)
+        with self._template_lock:
+            gallery = self.get_gallery()
+            existing = None if replace else gallery.templates_of(user_id)
+            if existing is None:
+                self._put_templates(user_id, name, embedding)
+                return 1, True
+            stack = np.vstack([existing, embedding])
+            keep = select_templates(stack, self.max_templates)
+            if keep[-1] != len(stack) - 1:
+                # the new one was the most redundant: keep the set, but take a new name
+                if name != gallery.names[gallery.index_of(user_id)]:
+                    self._put_templates(user_id, name, existing)
+                return len(existing), False
+            self._put_templates(user_id, name, stack[keep])
+            return len(keep), True
+
+    def adapt(self, user_id: str, name: str, embedding: np.ndarray, distance: Optional[float]) -> bool:
+        """
+        Add the encoding of a confirmed punch as a template if it matched
+        within TEMPLATE_ADAPT_DISTANCE and differs from every existing
+        template by at least TEMPLATE_MIN_NOVELTY. Returns True if added.
+        """
+        if embedding is None or distance is None or distance > TEMPLATE_ADAPT_DISTANCE:
+            return False
+        embedding = np.asarray(embedding, dtype=np.float64)
+        existing = self.get_gallery().templates_of(user_id)
+        if existing is None:
+            return False
+        if np.linalg.norm(existing - embedding, axis=1).min() < TEMPLATE_MIN_NOVELTY:
+            return False
+        _, added = self._add_template(user_id, name, embedding, replace=False)
+        self.adapted += added
+        return added
+
+    def register_many(self, entries: List[Tuple[str, str, np.ndarray]]) -> int:
+        """
+        Store precomputed (user_id, name, embedding or (k, dim) templates)
+        entries in one write (see face_auth.enrollment). The gallery reloads
+        once on next use.
+        Returns the number stored.
+        """
+        if not entries:
+            return 0
+        self.store.put_many(entries)
+        with self._gallery_lock:
+            if self._gallery is not None:
+                self._gallery.invalidate()
+        return len(entries)
 
     def register_from_file(self, filepath: str, user_id: str, name: str) -> Tuple[bool, str]:
         """Register from image file path."""
         path = Path(filepath)
         if not path.exists():
             return False, f"File not found: {filepath}"
-        image = face_recognition.load_image_file(str(path))
+        image = models.api().load_image_file(str(path))
         return self.register_from_image(image, user_id, name)
 
     def get_all_encodings(self) -> Tuple[List[np.ndarray], List[str], List[str]]:
         """Return (encodings, user_ids, names)."""
-        index = self._load_index()
-        encodings = []
-        user_ids = []
-        names = []
-        for uid, info in index.items():
-            emb_file = self.embeddings_dir / info["file"]
-            if not emb_file.exists():
-                continue
-            encodings.append(np.load(emb_file))
-            user_ids.append(uid)
-            names.append(info.get("name", uid))
-        return encodings, user_ids, names
+        matrix, user_ids, names = self.store.load()
+        return list(matrix), user_ids, names
+
+    def _gallery_for_update(self, before) -> Optional[EmbeddingGallery]:
+        """
+        Return the gallery if it can be patched incrementally, i.e. it was in
+        sync with the store just before our write. Otherwise mark it stale so
+        the next get_gallery() does a full reload.
+        """
+        gallery = self._gallery
+        if gallery is None:
+            return None
+        if gallery.stamp != before:
+            gallery.invalidate()
+            return None
+        return gallery
+
+    def get_gallery(self) -> EmbeddingGallery:
+        """
+        Return the resident gallery, reloading it only if the store changed
+        on disk since it was last loaded (e.g. edited by another process).
+        """
+        stamp = self.store.stamp()
+        with self._gallery_lock:
+            gallery = self._gallery
+            if gallery is None:
+                opts = {"nlist": IVF_NLIST, "nprobe": IVF_NPROBE} if MATCHER == "ivf" else {}
+                gallery = EmbeddingGallery(
+                    dtype=GALLERY_DTYPE,
+                    matcher=MATCHER,
+                    candidates=MATCH_CANDIDATES,
+                    quantization=MATCH_QUANTIZATION,
+                    rerank=MATCH_RERANK,
+                    **opts,
+                )
+                gallery.load(*self.store.load(), stamp=stamp)
+                self._gallery = gallery
+            elif gallery.stamp != stamp:
+                gallery.load(*self.store.load(), stamp=stamp)
+            else:
+                gallery.hits += 1
+        return gallery
 
     def delete_user(self, user_id: str) -> bool:
         """Remove a user from the registry."""
-        index = self._load_index()
-        if user_id not in index:
+        before = self.store.stamp()
+        if not self.store.delete(user_id):
             return False
-        info = index[user_id]
-        emb_path = self.embeddings_dir / info["file"]
-        if emb_path.exists():
-            emb_path.unlink()
-        base = emb_path.stem
-        meta = self.embeddings_dir / f"{base}.json"
-        if meta.exists():
-            meta.unlink()
-        del index[user_id]
-        self._save_index(index)
+        gallery = self._gallery_for_update(before)
+        if gallery is not None:
+            gallery.remove(user_id, stamp=self.store.stamp())
         return True
 
     def list_users(self) -> List[dict]:
         """List all registered users."""
-        index = self._load_index()
-        return [{"user_id": uid, "name": info.get("name", uid)} for uid, info in index.items()]
+        return self.store.list_users()
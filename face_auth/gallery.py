@@ -0,0 +1,290 @@
+"""Resident in-memory gallery of registered face embeddings."""
+import copy
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .matcher import MatchResult, make_matcher
+
+EMBEDDING_DIM = 128
+_STALE = object()
+
+
+def group_rows(user_ids: Sequence[str]) -> Tuple[List[str], List[List[int]]]:
+    """Unique user_ids in first-seen order and the row indices of each (its templates)."""
+    rows: Dict[str, List[int]] = {}
+    for i, uid in enumerate(user_ids):
+        rows.setdefault(uid, []).append(i)
+    return list(rows), list(rows.values())
+
+
+def select_templates(templates: np.ndarray, cap: int, pinned: int = 1) -> List[int]:
+    """
+    Indices of at most `cap` templates to keep, in order. While over the cap,
+    drop the most redundant one (closest to another kept template); the first
+    `pinned` (the original enrollment) are never dropped.
+    """
+    keep = list(range(len(templates)))
+    while len(keep) > max(cap, pinned):
+        sub = templates[keep]
+        d = np.linalg.norm(sub[:, None, :] - sub[None, :, :], axis=2)
+        np.fill_diagonal(d, np.inf)
+        nearest = d.min(axis=1)
+        nearest[:pinned] = np.inf
+        keep.pop(int(np.argmin(nearest)))
+    return keep
+
+
+class TemplateSearch:
+    """
+    Two-stage search over multi-template identities: the matcher short-lists
+    `candidates` users by centroid, then each candidate's distance is the
+    minimum over its own templates. Users with a single template need no
+    re-rank (their centroid is the template). Same interface as the matchers;
+    indices are gallery (user) rows.
+    """
+
+    def __init__(self, matcher, templates: List[Optional[np.ndarray]], multi: int, candidates: int):
+        self.matcher = matcher
+        self.kind = matcher.kind
+        self._templates = templates
+        self._multi = multi
+        self.candidates = candidates
+
+    def __len__(self) -> int:
+        return len(self.matcher)
+
+    def search_batch(self, queries: np.ndarray, k: int = 2) -> List[MatchResult]:
+        queries = np.atleast_2d(queries)
+        if not self._multi:
+            return self.matcher.search_batch(queries, k)
+        results = []
+        for query, first in zip(queries, self.matcher.search_batch(queries, max(k, self.candidates))):
+            dists = first.distances.copy()
+            for j, row in enumerate(first.indices):
+                tpl = self._templates[row]
+                if tpl is not None:
+                    dists[j] = np.sqrt(((tpl - query) ** 2).sum(axis=1).min())
+            order = np.argsort(dists, kind="stable")[:k]
+            results.append(MatchResult(first.indices[order], dists[order]))
+        return results
+
+    def search(self, query: np.ndarray, k: int = 2) -> MatchResult:
+        return self.search_batch(query, k)[0]
+
+
+class EmbeddingGallery:
+    """
+    Contiguous (N, 128) matrix with one row per user, parallel user_id / name
+    lists, and each user's templates.
+
+    A user may hold several templates (registrations, confident punches). The
+    row is their centroid, which the matcher indexes for a fast first pass;
+    search_view() re-ranks the short-listed users over their templates. A
+    single-template user stores no separate copy: the row is the template.
+
+    The registry keeps one gallery resident and updates it in place on
+    register/delete, so identification does not touch the disk. `stamp` records
+    the on-disk version the gallery reflects; the registry compares it against
+    the current one to pick up edits made by other processes.
+
+    Appends write past the end of the current rows, so a matrix handed out by
+    `snapshot()` stays valid; overwrites and removals copy the buffer first.
+    """
+
+    def __init__(
+        self,
+        dim: int = EMBEDDING_DIM,
+        dtype=np.float64,
+        matcher: str = "exact",
+        candidates: int = 8,
+        **matcher_opts,
+    ):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.candidates = candidates
+        self._buf = np.empty((0, dim), dtype=self.dtype)
+        self._size = 0
+        self._user_ids: List[str] = []
+        self._names: List[str] = []
+        self._templates: List[Optional[np.ndarray]] = []  # None: the row itself is the only template
+        self._multi = 0  # users with more than one template
+        self._row_of: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._matcher = make_matcher(matcher, **matcher_opts)
+        self._version = 0
+        self._matcher_version = -1
+        self.stamp = None
+        self.hits = 0
+        self.refreshes = 0
+        self.updates = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._buf[: self._size]
+
+    @property
+    def user_ids(self) -> List[str]:
+        return self._user_ids
+
+    @property
+    def names(self) -> List[str]:
+        return self._names
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str], List[str]]:
+        """Return a consistent (centroid matrix, user_ids, names) view."""
+        with self._lock:
+            return self.matrix, list(self._user_ids), list(self._names)
+
+    def search_view(self):
+        """
+        Return (searcher, user_ids, names) fitted to the current contents.
+        The matcher is rebuilt lazily, only after the gallery changed, into a
+        fresh copy so searches already holding the previous one are unaffected.
+        """
+        with self._lock:
+            if self._matcher_version != self._version:
+                self._matcher = copy.copy(self._matcher).fit(self.matrix)
+                self._matcher_version = self._version
+            search = TemplateSearch(self._matcher, self._templates, self._multi, self.candidates)
+            return search, list(self._user_ids), list(self._names)
+
+    def templates_of(self, user_id: str) -> Optional[np.ndarray]:
+        """(k, dim) templates of a user, or None if unknown."""
+        with self._lock:
+            row = self._row_of.get(user_id)
+            if row is None:
+                return None
+            tpl = self._templates[row]
+            return self._buf[row : row + 1].copy() if tpl is None else tpl
+
+    def _split(self, templates: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(centroid row, stored templates or None for a single one)."""
+        templates = np.asarray(templates, dtype=self.dtype).reshape(-1, self.dim)
+        if len(templates) == 1:
+            return templates[0], None
+        return templates.mean(axis=0), np.ascontiguousarray(templates)
+
+    def load(
+        self,
+        encodings: Iterable[np.ndarray],
+        user_ids: List[str],
+        names: List[str],
+        stamp=None,
+    ) -> None:
+        """
+        Replace the gallery contents (full refresh from storage). Rows that
+        share a user_id are that user's templates.
+        """
+        if isinstance(encodings, np.ndarray):
+            buf = np.ascontiguousarray(encodings, dtype=self.dtype).reshape(-1, self.dim)
+        else:
+            encodings = list(encodings)
+            if encodings:
+                buf = np.ascontiguousarray(np.vstack(encodings), dtype=self.dtype)
+            else:
+                buf = np.empty((0, self.dim), dtype=self.dtype)
+        unique, groups = group_rows(user_ids)
+        templates: List[Optional[np.ndarray]] = [None] * len(unique)
+        multi = 0
+        if len(unique) != len(user_ids):
+            centroids = np.empty((len(unique), self.dim), dtype=self.dtype)
+            user_names = []
+            for i, rows in enumerate(groups):
+                centroids[i], templates[i] = self._split(buf[rows])
+                multi += templates[i] is not None
+                user_names.append(names[rows[-1]])
+            buf, names = centroids, user_names
+        with self._lock:
+            self._buf = buf
+            self._size = len(buf)
+            self._user_ids = unique
+            self._names = list(names)
+            self._templates = templates
+            self._multi = multi
+            self._row_of = {uid: i for i, uid in enumerate(self._user_ids)}
+            self.stamp = stamp
+            self._version += 1
+            self.refreshes += 1
+
+    def upsert(self, user_id: str, name: str, embedding: np.ndarray, stamp=None) -> None:
+        """Add a user or replace their templates (one embedding or a (k, dim) stack)."""
+        vec, tpl = self._split(embedding)
+        with self._lock:
+            row = self._row_of.get(user_id)
+            if row is not None:
+                buf = self._buf.copy()
+                buf[row] = vec
+                self._buf = buf
+                self._user_ids = list(self._user_ids)
+                self._names = list(self._names)
+                self._names[row] = name
+                self._templates = list(self._templates)
+                self._multi -= self._templates[row] is not None
+                self._templates[row] = tpl
+            else:
+                if self._size == len(self._buf):
+                    capacity = max(16, 2 * len(self._buf))
+                    buf = np.empty((capacity, self.dim), dtype=self.dtype)
+                    buf[: self._size] = self._buf[: self._size]
+                    self._buf = buf
+                self._buf[self._size] = vec
+                self._row_of[user_id] = self._size
+                self._user_ids = self._user_ids + [user_id]
+                self._names = self._names + [name]
+                self._templates = self._templates + [tpl]
+                self._size += 1
+            self._multi += tpl is not None
+            self.stamp = stamp
+            self._version += 1
+            self.updates += 1
+
+    def remove(self, user_id: str, stamp=None) -> bool:
+        """Drop one user. Returns False if not present."""
+        with self._lock:
+            row = self._row_of.pop(user_id, None)
+            if row is None:
+                self.stamp = stamp
+                return False
+            keep = np.ones(self._size, dtype=bool)
+            keep[row] = False
+            self._buf = np.ascontiguousarray(self._buf[: self._size][keep])
+            self._size -= 1
+            self._user_ids = [u for i, u in enumerate(self._user_ids) if i != row]
+            self._names = [n for i, n in enumerate(self._names) if i != row]
+            self._multi -= self._templates[row] is not None
+            self._templates = [t for i, t in enumerate(self._templates) if i != row]
+            self._row_of = {uid: i for i, uid in enumerate(self._user_ids)}
+            self.stamp = stamp
+            self._version += 1
+            self.updates += 1
+            return True
+
+    def invalidate(self) -> None:
+        """Force the next registry lookup to reload from storage."""
+        self.stamp = _STALE
+
+    def index_of(self, user_id: str) -> Optional[int]:
+        return self._row_of.get(user_id)
+
+    def stats(self) -> dict:
+        """Counters for checking that the gallery stays warm."""
+        with self._lock:
+            templates = self._size - self._multi + sum(len(t) for t in self._templates if t is not None)
+        return {
+            "size": self._size,
+            "templates": templates,
+            "multi_template_users": self._multi,
+            "dtype": self.dtype.name,
+            "matrix_bytes": self.matrix.nbytes,
+            "matcher": self._matcher.kind,
+            "quantization": self._matcher.quantization,
+            "scan_bytes": self._matcher.scan_bytes,
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "updates": self.updates,
+        }
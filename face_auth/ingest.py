@@ -0,0 +1,162 @@
+"""
+Request image ingestion with as few copies as possible.
+
+The old path was body -> base64 str -> bytes -> np.frombuffer -> imdecode (BGR)
+-> cvtColor (a second full-size RGB copy). Here a raw image body is read with
+readinto() into a pooled, reusable buffer; imdecode reads straight from a numpy
+view of that buffer; the BGR result is swapped to RGB in place. Large JPEGs are
+decoded at 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling, IMREAD_REDUCED_COLOR_n)
+when the reduced image still has a long side of at least INGEST_MAX_SIDE, which
+is cheaper than decoding at full size and resizing later.
+
+The resulting RGB array is what FaceIdentifier / FaceRegistry take with rgb=True.
+"""
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import INGEST_MAX_SIDE
+
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# JPEG start-of-frame markers (baseline, extended, progressive, lossless, ...)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_READ_CHUNK = 64 * 1024
+
+
+class BufferPool:
+    """Reusable byte buffers for request bodies (grown on demand, never shrunk)."""
+
+    def __init__(self, max_free: int = 8):
+        self.max_free = max_free
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, size: int) -> bytearray:
+        with self._lock:
+            for i, buf in enumerate(self._free):
+                if len(buf) >= size:
+                    self.reused += 1
+                    return self._free.pop(i)
+            if self._free:
+                self._free.pop(0)  # too small; replace it with a bigger one
+            self.allocated += 1
+        return bytearray(max(size, _READ_CHUNK))
+
+    def release(self, buf: bytearray) -> None:
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buf)
+
+
+_pool = BufferPool()
+
+
+def _read_into(stream: BinaryIO, buf: bytearray, offset: int, limit: int) -> int:
+    """Fill buf[offset:limit] from stream; returns the number of bytes read."""
+    view = memoryview(buf)
+    n = offset
+    readinto = getattr(stream, "readinto", None)
+    while n < limit:
+        if readinto is not None:
+            got = readinto(view[n:limit])
+        else:
+            chunk = stream.read(limit - n)
+            got = len(chunk)
+            view[n:n + got] = chunk
+        if not got:
+            break
+        n += got
+    return n - offset
+
+
+@contextmanager
+def request_body(stream: BinaryIO, length: Optional[int], pool: BufferPool = _pool) -> Iterator[memoryview]:
+    """
+    Read a request body into a pooled buffer and yield a memoryview of it.
+    The view is only valid inside the `with` block; copy (bytes(view)) to keep it.
+    """
+    size = length if length else _READ_CHUNK
+    buf = pool.acquire(size)
+    try:
+        n = _read_into(stream, buf, 0, len(buf) if length is None else length)
+        while length is None and n == len(buf):  # unknown length: grow and keep reading
+            bigger = bytearray(len(buf) * 2)
+            bigger[:n] = buf
+            buf = bigger
+            n += _read_into(stream, buf, n, len(buf))
+        view = memoryview(buf)[:n]
+        try:
+            yield view
+        finally:
+            view.release()
+    finally:
+        pool.release(buf)
+
+
+def jpeg_size(data) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG header, or None if this is not a JPEG."""
+    mv = memoryview(data)
+    if len(mv) < 4 or mv[0] != 0xFF or mv[1] != 0xD8:
+        return None
+    i = 2
+    end = len(mv)
+    while i + 4 <= end:
+        if mv[i] != 0xFF:
+            return None
+        marker = mv[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # no length field
+            i += 2
+            continue
+        seg_len = (mv[i + 2] << 8) | mv[i + 3]
+        if marker in _SOF_MARKERS:
+            if i + 9 > end:
+                return None
+            height = (mv[i + 5] << 8) | mv[i + 6]
+            width = (mv[i + 7] << 8) | mv[i + 8]
+            return width, height
+        i += 2 + seg_len
+    return None
+
+
+def reduce_factor(width: int, height: int, max_side: int = INGEST_MAX_SIDE) -> int:
+    """Largest of 1/2/4/8 that keeps the long side >= max_side (0 = never reduce)."""
+    if max_side <= 0:
+        return 1
+    long_side = max(width, height)
+    factor = 1
+    while factor < 8 and long_side // (factor * 2) >= max_side:
+        factor *= 2
+    return factor
+
+
+def decode_rgb(data, max_side: int = INGEST_MAX_SIDE) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Decode encoded image bytes (bytes, bytearray or memoryview) to one RGB
+    array. Returns (rgb, None) or (None, error message).
+    """
+    flags = cv2.IMREAD_COLOR
+    size = jpeg_size(data)
+    if size is not None:
+        factor = reduce_factor(size[0], size[1], max_side)
+        flags = _REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    if img is None:
+        return None, "Could not decode image."
+    cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)  # in place: no second full-size array
+    return img, None
+
+
+def stats() -> dict:
+    return {"buffers_allocated": _pool.allocated, "buffers_reused": _pool.reused}
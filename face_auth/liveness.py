@@ -0,0 +1,220 @@
+"""
+Session-keyed liveness: blink detection across a stream of frames.
+
+A client opens a session and posts frames to it. Each session keeps its own
+EAR ring buffer (BlinkState) and a FaceTracker (tracker.py) that follows the
+face: frames between periodic full detections only search around the last
+box, and the identity matched on one frame is reused (and re-checked every
+TRACK_IDENTITY_TTL seconds) rather than encoded per frame. If a different
+face shows up (no IoU overlap with the tracked one) the blink starts over, so
+an identity cannot be borrowed from one face and the blink from another. The
+session starts over completely when no face has been seen for `face_lost`
+seconds, so a continuous stream does not hand one person's identity to the
+next one in front of the camera.
+
+Sessions expire `ttl` seconds after their last frame; the store also caps the
+number of open sessions and drops the least recently used beyond it.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import (
+    LIVENESS_FACE_LOST_SECONDS,
+    LIVENESS_HISTORY,
+    LIVENESS_MAX_SESSIONS,
+    LIVENESS_SESSION_TTL,
+)
+from .spoof_detection import BlinkState, SpoofDetector
+from .tracker import FaceTracker, TrackerStats
+
+
+class LivenessSession:
+    """Blink state and identity for one client's frame sequence."""
+
+    def __init__(
+        self, session_id: str, history: int = LIVENESS_HISTORY, tracker_stats: Optional[TrackerStats] = None
+    ):
+        self.id = session_id
+        self.created = self.last_seen = self.face_seen = time.monotonic()
+        self.blink = BlinkState(history)
+        self.tracker = FaceTracker(stats=tracker_stats)
+        self.lock = threading.Lock()  # frames of one session are applied in order
+        self.frames = 0
+        self.signature = None  # FramePrefilter signature of the last analyzed frame
+        self.unchanged = 0  # frames skipped since then as unchanged
+        self.message = ""
+        self._reset_subject()
+
+    def _reset_subject(self) -> None:
+        self.blink.reset()
+        self.tracker.reset()
+        self.face_box = None
+        self.live = False
+
+    # identity of the tracked face
+    @property
+    def user_id(self) -> Optional[str]:
+        return self.tracker.primary.user_id if self.tracker.primary else None
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.tracker.primary.name if self.tracker.primary else None
+
+    @property
+    def distance(self) -> Optional[float]:
+        return self.tracker.primary.distance if self.tracker.primary else None
+
+    @property
+    def encoding(self):
+        return self.tracker.primary.encoding if self.tracker.primary else None
+
+    def plan(self):
+        """(roi, want_identity) for the next frame; see FaceTracker.plan."""
+        return self.tracker.plan()
+
+    @property
+    def identified(self) -> bool:
+        return self.user_id is not None
+
+    @property
+    def confirmed(self) -> bool:
+        """Live and identified: a punch can use this session."""
+        return self.live and self.identified
+
+    def apply(
+        self,
+        analysis: dict,
+        spoof: SpoofDetector,
+        face_lost: float = LIVENESS_FACE_LOST_SECONDS,
+    ) -> dict:
+        """Fold one FaceIdentifier.analyze_frame() result into the session."""
+        self.frames += 1
+        now = self.last_seen = time.monotonic()
+        box = analysis["face_box"]
+        full = analysis.get("detect", "full") == "full"
+        if box is None:
+            self.tracker.update([], full, now)
+            if self.face_box is not None and now - self.face_seen > face_lost:
+                self._reset_subject()
+            return self.status(analysis["message"])
+        self.face_seen = now
+        box = tuple(box)
+        previous = self.tracker.primary
+        track = self.tracker.update([box], full, now)
+        self.face_box = box
+        if previous is not None and track is not previous:
+            self.blink.reset()
+            self.live = False
+            return self.status("Face changed. Hold still and look at the camera.")
+        if not analysis["lighting_ok"]:
+            return self.status(analysis["message"])
+
+        if analysis["distance"] is not None:  # this frame was encoded and matched
+            kept = self.tracker.identity_checked(
+                track, analysis["user_id"], analysis["name"], analysis["distance"], analysis.get("encoding"), now
+            )
+            if not kept:
+                self.blink.reset()
+                self.live = False
+                return self.status("Face no longer matches. Hold still and look at the camera.")
+
+        message = "" if analysis["ok"] else analysis["message"]
+        if not self.live:
+            if spoof.require_blink:
+                live, msg = spoof.update_ear(analysis["ear"], self.blink)
+                self.live = live
+                message = message or msg
+            else:
+                self.live = True
+        if self.confirmed:
+            message = "Liveness confirmed." if spoof.require_blink else "Match found."
+        return self.status(message)
+
+    def skip(self, message: Optional[str] = None) -> dict:
+        """
+        Count a frame a pre-filter rejected before analysis. Without a message
+        (an unchanged frame) the previous status is repeated.
+        """
+        self.frames += 1
+        self.last_seen = time.monotonic()
+        return self.status(self.message if message is None else message)
+
+    def status(self, message: str = "") -> dict:
+        self.message = message
+        return {
+            "session_id": self.id,
+            "live": self.live,
+            "identified": self.identified,
+            "confirmed": self.confirmed,
+            "user_id": self.user_id,
+            "name": self.name,
+            "frames": self.frames,
+            "message": message,
+        }
+
+
+class LivenessSessionStore:
+    """In-memory sessions with TTL and LRU eviction."""
+
+    def __init__(
+        self,
+        ttl: float = LIVENESS_SESSION_TTL,
+        max_sessions: int = LIVENESS_MAX_SESSIONS,
+        history: int = LIVENESS_HISTORY,
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.history = history
+        self.tracking = TrackerStats()  # summed over all sessions
+        self._sessions: "OrderedDict[str, LivenessSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.expired = 0
+
+    def _evict_locked(self, now: float) -> None:
+        while self._sessions:
+            sid, session = next(iter(self._sessions.items()))
+            if now - session.last_seen > self.ttl or len(self._sessions) > self.max_sessions:
+                del self._sessions[sid]
+                self.expired += 1
+            else:
+                break
+
+    def open(self) -> LivenessSession:
+        session = LivenessSession(secrets.token_urlsafe(16), self.history, self.tracking)
+        with self._lock:
+            self._sessions[session.id] = session
+            self.opened += 1
+            self._evict_locked(time.monotonic())
+        return session
+
+    def get(self, session_id: str) -> Optional[LivenessSession]:
+        """Return a live session and mark it recently used, or None."""
+        with self._lock:
+            self._evict_locked(time.monotonic())
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_seen = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def contains(self, session_id: str) -> bool:
+        """True if the session is open, without counting as use (unlike get)."""
+        with self._lock:
+            self._evict_locked(time.monotonic())
+            return session_id in self._sessions
+
+    def pop(self, session_id: str) -> Optional[LivenessSession]:
+        with self._lock:
+            self._evict_locked(time.monotonic())
+            return self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict_locked(time.monotonic())
+            stats = {"open": len(self._sessions), "opened": self.opened, "expired": self.expired}
+        stats["tracking"] = self.tracking.snapshot()
+        return stats
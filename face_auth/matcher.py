@@ -0,0 +1,305 @@
+"""
+Nearest-neighbour matchers over the embedding gallery.
+
+- ExactMatcher: brute force with one matrix multiply per batch, using
+  |g - q|^2 = |g|^2 - 2 g.q + |q|^2 with the gallery norms precomputed.
+- IVFMatcher: inverted-file index (k-means coarse quantizer in NumPy). Only the
+  `nprobe` closest clusters are scanned exactly, which keeps latency flat for
+  galleries of 100k+ identities at a small recall cost.
+
+Both return top-k indices and Euclidean distances (same scale as
+face_recognition.face_distance) plus the margin to the second best.
+
+Either can scan a quantized copy of the gallery instead of the float matrix:
+"float16", or "int8" with one scale per row (max |x| / 127). The scan ranks
+by approximate distance, then the best `rerank` rows are re-scored exactly
+against the float matrix, so reported distances are exact. NumPy has no
+int8/float16 BLAS, so codes are widened to float32 a block at a time: int8
+is about as fast as float32 at a quarter of the memory, float16 is slower
+(see benchmarks/bench_quantization.py).
+"""
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+QUANTIZATIONS = ("none", "float16", "int8")
+_SCAN_BLOCK = 8192  # rows widened to float32 at a time when scanning codes
+
+
+class MatchResult(NamedTuple):
+    """Top-k gallery rows for one query, closest first."""
+
+    indices: np.ndarray
+    distances: np.ndarray
+
+    @property
+    def best_index(self) -> int:
+        return int(self.indices[0])
+
+    @property
+    def best_distance(self) -> float:
+        return float(self.distances[0])
+
+    @property
+    def margin(self) -> float:
+        """Distance gap between best and second-best (inf if only one candidate)."""
+        if len(self.distances) < 2:
+            return float("inf")
+        return float(self.distances[1] - self.distances[0])
+
+
+def _top_k(d2: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k smallest entries per row, sorted ascending."""
+    n = d2.shape[1]
+    k = min(k, n)
+    if k < n:
+        part = np.argpartition(d2, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n), (d2.shape[0], n))
+    order = np.take_along_axis(d2, part, axis=1).argsort(axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def quantize(matrix: np.ndarray, kind: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(codes, per-row scales or None) for "float16" or "int8"."""
+    if kind == "float16":
+        return np.ascontiguousarray(matrix, dtype=np.float16), None
+    if kind == "int8":
+        scales = (np.abs(matrix).max(axis=1) / 127.0).astype(np.float32)
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"Unknown quantization: {kind!r}")
+
+
+def _code_dots(codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+    """queries (Q, D) float32 . decoded rows of codes, as (Q, N) float32."""
+    out = np.empty((len(queries), len(codes)), dtype=np.float32)
+    block = np.empty((min(_SCAN_BLOCK, len(codes)), codes.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), _SCAN_BLOCK):
+        stop = min(start + _SCAN_BLOCK, len(codes))
+        rows = block[: stop - start]
+        np.copyto(rows, codes[start:stop], casting="unsafe")
+        np.matmul(queries, rows.T, out=out[:, start:stop])
+    if scales is not None:
+        out *= scales[None, :]
+    return out
+
+
+class ExactMatcher:
+    """Exact top-k search with a single BLAS matmul (or a quantized scan plus exact re-rank)."""
+
+    kind = "exact"
+
+    def __init__(self, quantization: str = "none", rerank: int = 32):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization!r}")
+        self.quantization = quantization
+        self.rerank = rerank
+        self._matrix: Optional[np.ndarray] = None
+        self._sq_norms: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return 0 if self._matrix is None else len(self._matrix)
+
+    def fit(self, matrix: np.ndarray) -> "ExactMatcher":
+        """Index a gallery matrix (kept by reference, not copied; codes are built from it)."""
+        self._matrix = np.ascontiguousarray(matrix)
+        self._sq_norms = np.einsum("ij,ij->i", self._matrix, self._matrix)
+        if self.quantization != "none":
+            self._codes, self._scales = quantize(self._matrix, self.quantization)
+        return self
+
+    @property
+    def scan_bytes(self) -> int:
+        """Bytes read by one full scan: the codes (and scales), or the float matrix."""
+        if self._matrix is None:
+            return 0
+        if self._codes is None:
+            return self._matrix.nbytes
+        return self._codes.nbytes + (0 if self._scales is None else self._scales.nbytes)
+
+    def _sq_distances(self, queries: np.ndarray) -> np.ndarray:
+        """Squared distances to every row; approximate when scanning codes."""
+        if self._codes is not None:
+            q = np.asarray(queries, dtype=np.float32)
+            d2 = _code_dots(self._codes, self._scales, q)
+        else:
+            q = np.asarray(queries, dtype=self._matrix.dtype)
+            d2 = q @ self._matrix.T
+        d2 *= -2.0
+        d2 += self._sq_norms[None, :]
+        d2 += np.einsum("ij,ij->i", q, q)[:, None]
+        np.maximum(d2, 0.0, out=d2)
+        return d2
+
+    def _exact(self, query: np.ndarray, rows: np.ndarray, k: int) -> MatchResult:
+        """Re-score candidate rows against the float matrix; top-k of them."""
+        diff = self._matrix[rows] - query
+        d2 = np.einsum("ij,ij->i", diff, diff)
+        top = _top_k(d2[None, :], k)[0]
+        return MatchResult(rows[top], np.sqrt(d2[top]))
+
+    def search_batch(self, queries: np.ndarray, k: int = 2) -> List[MatchResult]:
+        """Top-k for each row of queries (Q, D)."""
+        queries = np.atleast_2d(queries)
+        if not len(self):
+            empty = np.empty(0, dtype=np.int64)
+            return [MatchResult(empty, np.empty(0)) for _ in range(len(queries))]
+        d2 = self._sq_distances(queries)
+        if self._codes is not None:
+            cand = _top_k(d2, max(k, self.rerank))
+            return [self._exact(q, rows, k) for q, rows in zip(queries, cand)]
+        idx = _top_k(d2, k)
+        dist = np.sqrt(np.take_along_axis(d2, idx, axis=1))
+        return [MatchResult(idx[i], dist[i]) for i in range(len(queries))]
+
+    def search(self, query: np.ndarray, k: int = 2) -> MatchResult:
+        return self.search_batch(query, k)[0]
+
+
+class IVFMatcher(ExactMatcher):
+    """
+    Inverted-file approximate search. `nlist` k-means cells (default
+    ~4*sqrt(N)); each query scans the `nprobe` nearest cells exactly.
+    Refitting reuses the trained centroids and only reassigns rows, unless the
+    gallery has doubled or shrunk by half since training.
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        nlist: int = 0,
+        nprobe: int = 16,
+        train_iters: int = 10,
+        seed: int = 0,
+        quantization: str = "none",
+        rerank: int = 32,
+    ):
+        super().__init__(quantization, rerank)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        self._sorted: Optional[np.ndarray] = None  # the matrix rows (or their codes) cell by cell
+        self._sorted_scales: Optional[np.ndarray] = None
+        self._sorted_sq: Optional[np.ndarray] = None
+        self._bounds: Optional[np.ndarray] = None
+        self._order: Optional[np.ndarray] = None
+
+    def _train(self, matrix: np.ndarray) -> None:
+        n = len(matrix)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        sample = matrix
+        n_sample = min(n, max(16 * nlist, 10000))
+        if n > n_sample:
+            sample = matrix[self._rng.choice(n, n_sample, replace=False)]
+        centroids = sample[self._rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            labels = self._assign(sample, centroids)
+            order = np.argsort(labels, kind="stable")
+            present, starts = np.unique(labels[order], return_index=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            counts = np.diff(np.append(starts, len(order)))
+            centroids[present] = sums / counts[:, None]
+        self._centroids = centroids
+        self._trained_size = n
+
+    def fit(self, matrix: np.ndarray) -> "IVFMatcher":
+        super().fit(matrix)
+        n = len(self._matrix)
+        self._bounds = None
+        if n == 0:
+            return self
+        if (
+            self._centroids is None
+            or self._centroids.shape[1] != self._matrix.shape[1]
+            or n > 2 * self._trained_size
+            or 2 * n < self._trained_size
+        ):
+            self._train(self._matrix)
+        labels = self._assign(self._matrix)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(self._centroids) + 1))
+        # rows stored cell by cell so each probed cell is one contiguous block
+        if self._codes is not None:
+            self._sorted = self._codes[order]
+            self._sorted_scales = None if self._scales is None else self._scales[order]
+            self._codes = self._scales = None  # only the sorted copy is scanned
+        else:
+            self._sorted = self._matrix[order]
+        self._sorted_sq = self._sq_norms[order]
+        self._bounds = bounds
+        self._order = order
+        return self
+
+    @property
+    def n_cells(self) -> int:
+        return 0 if self._centroids is None else len(self._centroids)
+
+    def _centroid_sq_distances(self, rows: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Squared distances up to the per-row constant |row|^2 (enough for ranking)."""
+        d2 = rows @ centroids.T
+        d2 *= -2.0
+        d2 += np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        return d2
+
+    def _assign(self, rows: np.ndarray, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        c = self._centroids if centroids is None else centroids
+        return np.argmin(self._centroid_sq_distances(rows, c), axis=1)
+
+    def search_batch(self, queries: np.ndarray, k: int = 2) -> List[MatchResult]:
+        queries = np.atleast_2d(queries)
+        if not len(self):
+            return super().search_batch(queries, k)
+        quantized = self.quantization != "none"
+        queries = np.asarray(queries, dtype=np.float32 if quantized else self._matrix.dtype)
+        c = self._centroids
+        cd2 = self._centroid_sq_distances(queries, c)
+        nprobe = min(self.nprobe, len(c))
+        probes = np.argpartition(cd2, nprobe - 1, axis=1)[:, :nprobe]
+        q_sq = np.einsum("ij,ij->i", queries, queries)
+        results = []
+        for qi, q in enumerate(queries):
+            cells = [(self._bounds[ci], self._bounds[ci + 1]) for ci in probes[qi]]
+            cells = [(a, b) for a, b in cells if b > a]
+            if not cells:
+                results.append(MatchResult(np.empty(0, dtype=np.int64), np.empty(0)))
+                continue
+            d2 = np.concatenate([self._sorted_sq[a:b] - 2.0 * self._cell_dots(a, b, q) for a, b in cells])
+            d2 += q_sq[qi]
+            np.maximum(d2, 0.0, out=d2)
+            cand = np.concatenate([self._order[a:b] for a, b in cells])
+            if quantized:
+                results.append(self._exact(q, cand[_top_k(d2[None, :], max(k, self.rerank))[0]], k))
+                continue
+            top = _top_k(d2[None, :], k)[0]
+            results.append(MatchResult(cand[top], np.sqrt(d2[top])))
+        return results
+
+    def _cell_dots(self, a: int, b: int, q: np.ndarray) -> np.ndarray:
+        if self.quantization == "none":
+            return self._sorted[a:b] @ q
+        scales = None if self._sorted_scales is None else self._sorted_scales[a:b]
+        return _code_dots(self._sorted[a:b], scales, q[None, :])[0]
+
+    @property
+    def scan_bytes(self) -> int:
+        if self._sorted is None:
+            return super().scan_bytes
+        return self._sorted.nbytes + (0 if self._sorted_scales is None else self._sorted_scales.nbytes)
+
+
+def make_matcher(kind: str = "exact", **kwargs):
+    """Factory for the configured matcher backend ("exact" or "ivf")."""
+    if kind == "exact":
+        return ExactMatcher(**{k: v for k, v in kwargs.items() if k in ("quantization", "rerank")})
+    if kind == "ivf":
+        return IVFMatcher(**kwargs)
+    raise ValueError(f"Unknown matcher: {kind!r}")
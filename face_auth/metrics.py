@@ -0,0 +1,172 @@
+"""
+Latency histograms and counters, rendered in the Prometheus text format.
+
+The pipeline already reports per-stage milliseconds into a `timings` dict
+(see timing.StageTimer); Metrics folds such dicts into one histogram per
+stage, so instrumenting a request costs a dict and a few bisects. Counters
+that other components keep themselves (gallery, pool, streams, attendance
+writer, punch cache, pre-filters) are not duplicated here: collectors return
+those stats dicts and their numbers are rendered as gauges at scrape time.
+
+With enabled=False every method is a no-op and render() returns "".
+"""
+import re
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import METRICS_BUCKETS, METRICS_ENABLED
+
+PREFIX = "face_auth"
+# timings keys that are not durations
+NON_STAGE_KEYS = frozenset({"detect_scale", "detect_passes"})
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _name(*parts: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(p for p in parts if p))
+
+
+def _labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts are per bucket and cumulated on render."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Stage / request latency histograms, labelled counters and stats collectors."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[_name(PREFIX, name)] = help_text
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Add one duration (seconds) to histogram `name` with the given labels."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(_name(PREFIX, name), {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self.buckets)
+            hist.observe(seconds)
+
+    def observe_stages(self, timings: Optional[Dict[str, float]], name: str = "stage_seconds") -> None:
+        """Fold a StageTimer timings dict (milliseconds per stage) into per-stage histograms."""
+        if not self.enabled or not timings:
+            return
+        full = _name(PREFIX, name)
+        with self._lock:
+            series = self._histograms.setdefault(full, {})
+            for stage, ms in timings.items():
+                if stage in NON_STAGE_KEYS:
+                    continue
+                key = (("stage", stage),)
+                hist = series.get(key)
+                if hist is None:
+                    hist = series[key] = Histogram(self.buckets)
+                hist.observe(ms / 1000.0)
+
+    def inc(self, name: str, n: float = 1, **labels) -> None:
+        """Add n to counter `name` (rendered with a _total suffix)."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(_name(PREFIX, name, "total"), {})
+            series[key] = series.get(key, 0) + n
+
+    def add_collector(self, section: str, collect: Callable[[], dict]) -> None:
+        """Render the numbers of collect()'s (nested) dict as face_auth_<section>_<key> gauges."""
+        self._collectors.append((section, collect))
+
+    def _gauges(self, section: str, stats: dict, out: List[str]) -> None:
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                self._gauges(_name(section, key), value, out)
+            elif isinstance(value, bool):
+                out.append(f"{_name(PREFIX, section, key)} {int(value)}")
+            elif isinstance(value, (int, float)):
+                out.append(f"{_name(PREFIX, section, key)} {_number(value)}")
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format (version 0.0.4)."""
+        if not self.enabled:
+            return ""
+        lines: List[str] = []
+        with self._lock:
+            histograms = {
+                name: [(labels, list(h.counts), h.sum, h.count) for labels, h in series.items()]
+                for name, series in self._histograms.items()
+            }
+            counters = {name: list(series.items()) for name, series in self._counters.items()}
+        bounds = [_number(b) for b in self.buckets] + ["+Inf"]
+        for name in sorted(histograms):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, counts, total, count in sorted(histograms[name]):
+                cumulative = 0
+                for bound, c in zip(bounds, counts):
+                    cumulative += c
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name in sorted(counters):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(counters[name]):
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for section, collect in self._collectors:
+            gauges: List[str] = []
+            self._gauges(section, collect(), gauges)
+            for line in gauges:
+                lines.append(f"# TYPE {line.split(' ', 1)[0]} gauge")
+                lines.append(line)
+        return "\n".join(lines) + "\n"
+
+
+def server_timing(timings: Optional[Dict[str, float]], total_ms: Optional[float] = None) -> str:
+    """A Server-Timing header value ("detect;dur=12.3, encode;dur=4.1") from a timings dict."""
+    parts = [
+        f"{_name(stage)};dur={ms:.1f}"
+        for stage, ms in (timings or {}).items()
+        if stage not in NON_STAGE_KEYS
+    ]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,68 @@
+"""
+Deferred loading of the dlib models.
+
+Importing face_recognition loads dlib's HOG detector, both shape predictors
+and the ResNet encoder from disk, about 1.5 s. Modules that need them call
+api() when they run instead of importing face_recognition at the top, so
+importing face_auth (or starting the app) stays cheap. The first call loads
+everything once; warm_up() in face_identifier does it ahead of traffic.
+
+dlib's face detectors keep scratch state in the detector object, so two
+threads detecting with the same one (request threads, stream consumers, the
+warm-up thread) can corrupt the heap. hog_detector() and cnn_detector() give
+each thread its own, so detection runs in parallel without a lock; the
+shape predictors and the encoder are safe to share. Building the HOG
+detector takes about 0.5 s with the GIL held, so it is built once and each
+thread unpickles a copy (about 2 ms).
+"""
+import pickle
+import threading
+
+_lock = threading.Lock()
+_api = None
+_local = threading.local()
+_hog_pickle = None
+
+
+def api():
+    """The face_recognition.api module, importing (and so loading the models) on first use."""
+    global _api
+    if _api is None:
+        with _lock:
+            if _api is None:
+                import face_recognition.api as face_recognition_api
+
+                _api = face_recognition_api
+    return _api
+
+
+def loaded() -> bool:
+    return _api is not None
+
+
+def hog_detector():
+    """This thread's dlib HOG face detector, copied from the shared prototype on first use."""
+    global _hog_pickle
+    detector = getattr(_local, "hog", None)
+    if detector is None:
+        if _hog_pickle is None:
+            with _lock:
+                if _hog_pickle is None:
+                    import dlib
+
+                    _hog_pickle = pickle.dumps(dlib.get_frontal_face_detector())
+        detector = _local.hog = pickle.loads(_hog_pickle)
+    return detector
+
+
+def cnn_detector():
+    """This thread's dlib CNN (MMOD) face detector, loaded on first use."""
+    detector = getattr(_local, "cnn", None)
+    if detector is None:
+        import dlib
+        import face_recognition_models
+
+        detector = _local.cnn = dlib.cnn_face_detection_model_v1(
+            face_recognition_models.cnn_face_detector_model_location()
+        )
+    return detector
@@ -0,0 +1,155 @@
+"""
+Monthly partitions for attendance history.
+
+Punches for month YYYYMM live in table attendance_YYYYMM with integer epoch
+millisecond timestamps and small integer action codes. Ids come from the
+table's AUTOINCREMENT sequence seeded at YYYYMM * 10**8, so they are unique
+across partitions and increase with time. The attendance_partitions catalog
+records every month and where it lives: the main database (hot) or a
+read-only archive file attendance-YYYYMM.db (see write_archive and
+AttendanceDB.archive_month).
+"""
+import os
+import sqlite3
+import stat
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Tuple
+
+ACTIONS = ("punch_in", "punch_out")
+ACTION_CODES = {a: i for i, a in enumerate(ACTIONS)}
+ID_BASE = 10 ** 8  # ids of month YYYYMM start above YYYYMM * ID_BASE
+
+CATALOG_DDL = """
+    CREATE TABLE IF NOT EXISTS attendance_partitions (
+        month INTEGER PRIMARY KEY,
+        archive TEXT,
+        rows INTEGER
+    )
+"""
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def table_name(month: int) -> str:
+    return f"attendance_{int(month)}"
+
+
+def now_ms() -> int:
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+def month_of(ms: int) -> int:
+    t = _EPOCH + timedelta(milliseconds=ms)
+    return t.year * 100 + t.month
+
+
+def month_bounds(month: int) -> Tuple[int, int]:
+    """[start, end) epoch milliseconds of YYYYMM."""
+    year, mon = divmod(month, 100)
+    start = datetime(year, mon, 1)
+    end = datetime(year + mon // 12, mon % 12 + 1, 1)
+    return _to_ms(start), _to_ms(end)
+
+
+def _to_ms(t: datetime) -> int:
+    return (t - _EPOCH) // timedelta(milliseconds=1)
+
+
+def ms_from_iso(value: str) -> int:
+    """'2024-05-01T08:00:00.123456Z' (or a bare date) -> epoch milliseconds."""
+    return _to_ms(datetime.fromisoformat(value.rstrip("Z")))
+
+
+def iso_from_ms(ms: int) -> str:
+    t = _EPOCH + timedelta(milliseconds=ms)
+    return t.strftime("%Y-%m-%dT%H:%M:%S") + f".{ms % 1000:03d}Z"
+
+
+def day_of(ms: int) -> str:
+    return (_EPOCH + timedelta(milliseconds=ms)).strftime("%Y-%m-%d")
+
+
+def create_partition(conn: sqlite3.Connection, month: int, schema: str = "main") -> None:
+    """Create the month's table and indexes (idempotent) and seed its id sequence."""
+    table = table_name(month)
+    exists = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    if exists:
+        return
+    conn.execute(f"""
+        CREATE TABLE {schema}.{table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            action INTEGER NOT NULL,
+            ts INTEGER NOT NULL
+        )
+    """)
+    conn.execute(f"CREATE INDEX {schema}.idx_{table}_ts ON {table}(ts)")
+    conn.execute(f"CREATE INDEX {schema}.idx_{table}_user_ts ON {table}(user_id, ts)")
+    conn.execute(
+        f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES (?, ?)", (table, month * ID_BASE)
+    )
+    if schema == "main":
+        conn.execute(
+            "INSERT OR IGNORE INTO attendance_partitions (month, archive, rows) VALUES (?, NULL, NULL)",
+            (month,),
+        )
+
+
+def archive_path(archive_dir: Path, month: int) -> Path:
+    return Path(archive_dir) / f"attendance-{int(month)}.db"
+
+
+def readonly_uri(path: Path) -> str:
+    return Path(path).resolve().as_uri() + "?mode=ro"
+
+
+def write_archive(db_path: Path, archive_dir: Path, month: int) -> Tuple[Path, int]:
+    """
+    Copy a closed month from the main database into a fresh archive file
+    (rows in id order, indexes built after the copy, then VACUUM), and make
+    the file read-only. The main table is left for the caller to drop once
+    the catalog points at the archive. Returns (archive path, rows copied).
+    """
+    table = table_name(month)
+    final = archive_path(archive_dir, month)
+    tmp = final.with_name(final.name + ".tmp")
+    final.parent.mkdir(parents=True, exist_ok=True)
+    if tmp.exists():
+        tmp.unlink()
+    conn = sqlite3.connect(tmp.resolve().as_uri(), uri=True, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("ATTACH ? AS src", (readonly_uri(db_path),))
+        conn.execute("BEGIN")
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                action INTEGER NOT NULL,
+                ts INTEGER NOT NULL
+            )
+        """)
+        conn.execute(f"INSERT INTO {table} SELECT id, user_id, name, action, ts FROM src.{table} ORDER BY id")
+        conn.execute(f"CREATE INDEX idx_{table}_ts ON {table}(ts)")
+        conn.execute(f"CREATE INDEX idx_{table}_user_ts ON {table}(user_id, ts)")
+        conn.execute("COMMIT")
+        copied = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        source = conn.execute(f"SELECT COUNT(*) FROM src.{table}").fetchone()[0]
+        conn.execute("DETACH src")
+        if copied != source:
+            raise RuntimeError(f"Archive of {month} copied {copied} of {source} rows.")
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    os.replace(tmp, final)
+    return final, copied
+
@@ -0,0 +1,166 @@
+"""
+Cheap pre-filters that reject unusable frames before face detection.
+
+Detection, landmarks and encoding cost tens to hundreds of milliseconds per
+frame; a frame that is too dark, overexposed, blurred, or identical to the
+last analyzed one is rejected here instead, on a grayscale thumbnail about
+`thumb_width` pixels wide (strided, no interpolation), typically in a few
+hundred microseconds. Filters run in the order given and stop at the first
+rejection:
+
+- "lighting": mean gray level outside [min_brightness, max_brightness]
+  (the same thresholds and messages as SpoofDetector.check_lighting).
+- "blur": variance of the thumbnail's Laplacian below `min_sharpness`.
+- "change": streams only. The thumbnail is reduced to a grid of cell means
+  (its signature); if no cell moved by `min_change` gray levels since the
+  last analyzed frame, the frame adds nothing and is skipped. Cells are small
+  enough that a blink still counts as change.
+
+Per-filter counters (checked, rejected, milliseconds) are kept for /api/stats.
+"""
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from config import (
+    MAX_BRIGHTNESS,
+    MIN_BRIGHTNESS,
+    MIN_FRAME_CHANGE,
+    MIN_SHARPNESS,
+    PREFILTER_THUMB_WIDTH,
+    PREFILTERS,
+)
+
+FILTERS = ("lighting", "blur", "change")
+SIGNATURE_GRID = (16, 12)  # cells across, down
+
+
+class FramePrefilter:
+    """Ordered lighting / blur / no-change checks on a frame thumbnail."""
+
+    def __init__(
+        self,
+        filters: Sequence[str] = PREFILTERS,
+        min_brightness: float = MIN_BRIGHTNESS,
+        max_brightness: float = MAX_BRIGHTNESS,
+        min_sharpness: float = MIN_SHARPNESS,
+        min_change: float = MIN_FRAME_CHANGE,
+        thumb_width: int = PREFILTER_THUMB_WIDTH,
+    ):
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown pre-filter(s): {', '.join(sorted(unknown))}")
+        self.filters = tuple(filters)
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_sharpness = min_sharpness
+        self.min_change = min_change
+        self.thumb_width = thumb_width
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._passed = 0
+        self._thumb_ms = 0.0
+        self._counts = {name: {"checked": 0, "rejected": 0, "ms": 0.0} for name in FILTERS}
+
+    def thumbnail(self, frame: np.ndarray, is_rgb: bool = False) -> np.ndarray:
+        """Grayscale thumbnail of a BGR (or RGB) frame, by striding rather than resizing."""
+        step = max(1, frame.shape[1] // self.thumb_width) if self.thumb_width else 1
+        small = frame[::step, ::step]
+        if small.ndim == 3:
+            return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY if is_rgb else cv2.COLOR_BGR2GRAY)
+        return np.ascontiguousarray(small)
+
+    @staticmethod
+    def signature(thumb: np.ndarray) -> np.ndarray:
+        """Cell means of a thumbnail, compared between frames by the change filter."""
+        return cv2.resize(thumb, SIGNATURE_GRID, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _lighting(self, thumb: np.ndarray, previous) -> Optional[str]:
+        mean_val = cv2.mean(thumb)[0]
+        if mean_val < self.min_brightness:
+            return "Lighting too dark. Please improve lighting."
+        if mean_val > self.max_brightness:
+            return "Frame overexposed. Reduce glare or brightness."
+        return None
+
+    def _blur(self, thumb: np.ndarray, previous) -> Optional[str]:
+        std = cv2.meanStdDev(cv2.Laplacian(thumb, cv2.CV_16S))[1][0, 0]
+        if std * std < self.min_sharpness:
+            return "Image too blurry. Hold still."
+        return None
+
+    def _change(self, thumb: np.ndarray, previous) -> Optional[str]:
+        if previous is None:
+            return None
+        if float(np.abs(self.signature(thumb) - previous).max()) < self.min_change:
+            return "No change since the last frame."
+        return None
+
+    def check(
+        self,
+        frame: np.ndarray,
+        is_rgb: bool = False,
+        previous: Optional[np.ndarray] = None,
+        skip: Sequence[str] = (),
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Tuple[Optional[str], str, Optional[np.ndarray]]:
+        """
+        Run the configured filters (except those in `skip`) on a frame.
+        `previous` is the signature of the last analyzed frame of a stream;
+        without it the change filter passes.
+        Returns (rejecting filter or None, message, signature of this frame).
+        The signature is None if the frame was rejected.
+        """
+        start = time.perf_counter()
+        thumb = self.thumbnail(frame, is_rgb)
+        thumb_ms = (time.perf_counter() - start) * 1000.0
+        spent = {}
+        rejected_by, message = None, ""
+        for name in self.filters:
+            if name in skip:
+                continue
+            t0 = time.perf_counter()
+            message = getattr(self, "_" + name)(thumb, previous) or ""
+            spent[name] = (time.perf_counter() - t0) * 1000.0
+            if message:
+                rejected_by = name
+                break
+        with self._lock:
+            self._frames += 1
+            self._thumb_ms += thumb_ms
+            for name, ms in spent.items():
+                counts = self._counts[name]
+                counts["checked"] += 1
+                counts["ms"] += ms
+            if rejected_by:
+                self._counts[rejected_by]["rejected"] += 1
+            else:
+                self._passed += 1
+        if timings is not None:
+            timings["prefilter"] = timings.get("prefilter", 0.0) + thumb_ms + sum(spent.values())
+        if rejected_by:
+            return rejected_by, message, None
+        return None, "", self.signature(thumb)
+
+    def stats(self) -> dict:
+        """Frames seen and passed, and per filter: checked, rejected, mean ms per check."""
+        with self._lock:
+            frames = self._frames
+            filters = {
+                name: {
+                    "checked": c["checked"],
+                    "rejected": c["rejected"],
+                    "avg_ms": round(c["ms"] / c["checked"], 4) if c["checked"] else 0.0,
+                }
+                for name, c in self._counts.items()
+                if name in self.filters
+            }
+            return {
+                "frames": frames,
+                "passed": self._passed,
+                "thumbnail_avg_ms": round(self._thumb_ms / frames, 4) if frames else 0.0,
+                "filters": filters,
+            }
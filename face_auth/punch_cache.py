@@ -0,0 +1,150 @@
+"""
+In-memory punch state for duplicate suppression.
+
+Keeps each user's last punch (action, epoch ms, name) for `ttl` seconds,
+warmed from AttendanceDB.daily_presence at startup. Before a punch is written:
+
+- the same action again within `window` seconds is a duplicate: it is
+  coalesced into the punch already recorded and nothing is written;
+- a punch-out with no punch-in on record, or a punch-in after an earlier
+  punch-in with no punch-out, is out of order: recorded with a warning, or
+  refused when `reject_out_of_order` is set.
+
+Neither check reads the database. The check reserves the new state under a
+lock, so two concurrent taps cannot both be recorded; call rollback() if the
+write then fails.
+
+Sessions that were consumed by a punch are remembered for `window` seconds
+with their response, so a retried request for the same session is answered
+at once, without running recognition again.
+
+State is per process: with several server processes each keeps its own.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import PUNCH_DEDUPE_WINDOW, PUNCH_REJECT_OUT_OF_ORDER, PUNCH_STATE_TTL
+from .partitions import now_ms
+
+RECORD = "record"
+DUPLICATE = "duplicate"
+OUT_OF_ORDER = "out_of_order"
+
+
+class PunchCache:
+    """Last punch per user, with TTL, for duplicate and out-of-order checks."""
+
+    def __init__(
+        self,
+        window: float = PUNCH_DEDUPE_WINDOW,
+        ttl: float = PUNCH_STATE_TTL,
+        reject_out_of_order: bool = PUNCH_REJECT_OUT_OF_ORDER,
+    ):
+        self.window_ms = int(window * 1000)
+        self.ttl_ms = int(ttl * 1000)
+        self.reject_out_of_order = reject_out_of_order
+        self._lock = threading.Lock()
+        self._last: "OrderedDict[str, Tuple[str, int, str]]" = OrderedDict()  # oldest punch first
+        self._sessions: "OrderedDict[str, Tuple[float, str, dict]]" = OrderedDict()
+        self.recorded = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.rejected = 0
+        self.session_hits = 0
+
+    def warm(self, db) -> int:
+        """Load last punches within the TTL from the database. Returns users loaded."""
+        latest = db.latest_punches(now_ms() - self.ttl_ms)
+        with self._lock:
+            for user_id, state in sorted(latest.items(), key=lambda kv: kv[1][1]):
+                current = self._last.get(user_id)
+                if current is None or current[1] < state[1]:
+                    self._last[user_id] = state
+                    self._last.move_to_end(user_id)
+            return len(latest)
+
+    def _expire_locked(self, now: int) -> None:
+        while self._last:
+            user_id, (_, ts, _) = next(iter(self._last.items()))
+            if now - ts <= self.ttl_ms:
+                break
+            del self._last[user_id]
+        mono = time.monotonic()
+        while self._sessions:
+            session_id, (seen, _, _) = next(iter(self._sessions.items()))
+            if mono - seen <= self.window_ms / 1000.0:
+                break
+            del self._sessions[session_id]
+
+    def check(
+        self, user_id: str, name: str, action: str, now: Optional[int] = None
+    ) -> Tuple[str, Optional[Tuple[str, int, str]]]:
+        """
+        Decide a punch and, unless it is a duplicate or refused, reserve it as
+        the user's last punch. Returns (verdict, previous state or None);
+        verdict is RECORD, DUPLICATE or OUT_OF_ORDER. An OUT_OF_ORDER punch is
+        reserved (to be written) unless reject_out_of_order is set.
+        """
+        now = now_ms() if now is None else now
+        with self._lock:
+            self._expire_locked(now)
+            previous = self._last.get(user_id)
+            if previous is not None and previous[0] == action and now - previous[1] <= self.window_ms:
+                self.duplicates += 1
+                return DUPLICATE, previous
+            if action == "punch_out":
+                in_order = previous is not None and previous[0] == "punch_in"
+            else:
+                in_order = previous is None or previous[0] == "punch_out"
+            verdict = RECORD if in_order else OUT_OF_ORDER
+            if verdict == OUT_OF_ORDER:
+                self.out_of_order += 1
+                if self.reject_out_of_order:
+                    self.rejected += 1
+                    return verdict, previous
+            self._last[user_id] = (action, now, name)
+            self._last.move_to_end(user_id)
+            self.recorded += 1
+            return verdict, previous
+
+    def rollback(self, user_id: str, previous: Optional[Tuple[str, int, str]]) -> None:
+        """Undo check() after the database write failed."""
+        with self._lock:
+            self.recorded -= 1
+            if previous is None:
+                self._last.pop(user_id, None)
+            else:
+                # back to its place in TTL order
+                self._last[user_id] = previous
+                items = sorted(self._last.items(), key=lambda kv: kv[1][1])
+                self._last.clear()
+                self._last.update(items)
+
+    def remember_session(self, session_id: str, action: str, response: dict) -> None:
+        """Keep a consumed session's response for `window` seconds."""
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), action, response)
+            self._sessions.move_to_end(session_id)
+
+    def session_response(self, session_id: str, action: str) -> Optional[dict]:
+        """The response already given for this session and action, if still remembered."""
+        with self._lock:
+            self._expire_locked(now_ms())
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[1] != action:
+                return None
+            self.session_hits += 1
+            return entry[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._last),
+                "recorded": self.recorded,
+                "duplicates": self.duplicates,
+                "out_of_order": self.out_of_order,
+                "rejected": self.rejected,
+                "session_hits": self.session_hits,
+            }
@@ -1,11 +1,10 @@
 """Basic spoof prevention: liveness via blink and lighting checks."""
+from collections import deque
+
 import cv2
 import numpy as np
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional
 
-from pathlib import Path
-import sys
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from config import (
     BLINK_EAR_THRESHOLD,
     BLINK_FRAMES_REQUIRED,
@@ -29,11 +28,36 @@ def eye_aspect_ratio_from_landmarks(eye_dict: dict) -> float:
     return (v1 + v2) / (2.0 * h)
 
 
+def combined_ear(face_landmarks: Optional[dict]) -> Optional[float]:
+    """Mean EAR of both eyes from face_recognition face_landmarks. None if eyes missing."""
+    if not face_landmarks or "left_eye" not in face_landmarks or "right_eye" not in face_landmarks:
+        return None
+    left_ear = eye_aspect_ratio_from_landmarks(face_landmarks["left_eye"])
+    right_ear = eye_aspect_ratio_from_landmarks(face_landmarks["right_eye"])
+    return (left_ear + right_ear) / 2.0
+
+
+class BlinkState:
+    """EAR history and blink count for one subject / frame sequence."""
+
+    def __init__(self, history: int = 30):
+        self.ear_history = deque(maxlen=history)
+        self.blink_count = 0
+
+    def reset(self) -> None:
+        self.ear_history.clear()
+        self.blink_count = 0
+
+
 class SpoofDetector:
     """
     Basic anti-spoofing:
     - Reject too dark / overexposed frames (lighting check).
     - Optional: require blink (liveness) using face_recognition face_landmarks.
+
+    Thresholds are shared and read-only; blink state is passed in per caller
+    (a BlinkState) so one detector can serve concurrent requests. Without an
+    explicit state the detector's own default state is used.
     """
 
     def __init__(
@@ -50,12 +74,14 @@ class SpoofDetector:
         self.max_brightness = max_brightness
         self.require_blink = require_blink
 
-        self._ear_history: List[float] = []
-        self._blink_count = 0
+        self._state = BlinkState()
 
-    def check_lighting(self, frame: np.ndarray) -> Tuple[bool, str]:
-        """Reject very dark or overexposed frames."""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
+    def check_lighting(self, frame: np.ndarray, is_rgb: bool = False) -> Tuple[bool, str]:
+        """Reject very dark or overexposed frames (BGR, or RGB with is_rgb=True)."""
+        if len(frame.shape) == 3:
+            gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY if is_rgb else cv2.COLOR_BGR2GRAY)
+        else:
+            gray = frame
         mean_val = float(np.mean(gray))
         if mean_val < self.min_brightness:
             return False, "Lighting too dark. Please improve lighting."
@@ -65,58 +91,69 @@ class SpoofDetector:
 
     def _get_ear_from_landmarks(self, face_landmarks: Optional[dict]) -> Optional[float]:
         """Get combined EAR from face_recognition face_landmarks. Returns None if missing."""
-        if not face_landmarks or "left_eye" not in face_landmarks or "right_eye" not in face_landmarks:
-            return None
-        left_ear = eye_aspect_ratio_from_landmarks(face_landmarks["left_eye"])
-        right_ear = eye_aspect_ratio_from_landmarks(face_landmarks["right_eye"])
-        return (left_ear + right_ear) / 2.0
+        return combined_ear(face_landmarks)
 
     def update_blink_state(
-        self, frame: np.ndarray, face_location: Optional[Tuple], face_landmarks: Optional[dict] = None
+        self,
+        frame: np.ndarray,
+        face_location: Optional[Tuple],
+        face_landmarks: Optional[dict] = None,
+        state: Optional[BlinkState] = None,
     ) -> Tuple[bool, str]:
         """
-        Update internal blink state. face_landmarks from face_recognition.face_landmarks().
+        Update blink state. face_landmarks from face_recognition.face_landmarks().
         Returns (liveness_ok, message).
         """
         if not self.require_blink:
             return True, ""
-
         ear = self._get_ear_from_landmarks(face_landmarks) if face_landmarks else None
+        return self.update_ear(ear, state)
+
+    def update_ear(self, ear: Optional[float], state: Optional[BlinkState] = None) -> Tuple[bool, str]:
+        """
+        Feed one frame's EAR (None = eyes not found) into the blink state.
+        A blink is an open frame, `blink_frames_required` closed frames, then an
+        open frame. Returns (liveness_ok, message).
+        """
+        state = state if state is not None else self._state
         if ear is None:
             return False, "Could not detect eyes. Look at the camera."
 
-        self._ear_history.append(ear)
-        n = 30
-        if len(self._ear_history) > n:
-            self._ear_history = self._ear_history[-n:]
+        state.ear_history.append(ear)
 
-        if len(self._ear_history) >= self.blink_frames_required + 2:
-            recent = self._ear_history[-self.blink_frames_required - 2:]
-            low = all(r < self.ear_threshold for r in recent[: self.blink_frames_required])
+        if len(state.ear_history) >= self.blink_frames_required + 2:
+            recent = list(state.ear_history)[-self.blink_frames_required - 2:]
+            low = all(r < self.ear_threshold for r in recent[1:-1])
             high_before = recent[0] >= self.ear_threshold
             high_after = recent[-1] >= self.ear_threshold
             if high_before and low and high_after:
-                self._blink_count += 1
-                self._ear_history.clear()
+                state.blink_count += 1
+                state.ear_history.clear()
 
-        if self._blink_count >= 1:
+        if state.blink_count >= 1:
             return True, "Liveness confirmed (blink detected)."
         return False, "Please blink once to confirm you are live."
 
-    def reset_blink_state(self) -> None:
-        self._ear_history.clear()
-        self._blink_count = 0
+    def reset_blink_state(self, state: Optional[BlinkState] = None) -> None:
+        (state if state is not None else self._state).reset()
 
     def verify_frame(
         self,
         frame: np.ndarray,
         face_location: Optional[Tuple] = None,
         face_landmarks: Optional[dict] = None,
+        state: Optional[BlinkState] = None,
+        is_rgb: bool = False,
+        lighting: bool = True,
     ) -> Tuple[bool, str]:
-        """Run lighting check and optional blink check. Returns (passed, message)."""
-        ok, msg = self.check_lighting(frame)
-        if not ok:
-            return False, msg
+        """
+        Run lighting check (unless lighting=False, e.g. a pre-filter already
+        did) and optional blink check. Returns (passed, message).
+        """
+        if lighting:
+            ok, msg = self.check_lighting(frame, is_rgb)
+            if not ok:
+                return False, msg
         if self.require_blink:
-            return self.update_blink_state(frame, face_location, face_landmarks)
+            return self.update_blink_state(frame, face_location, face_landmarks, state)
         return True, ""
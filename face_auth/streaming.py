@@ -0,0 +1,201 @@
+"""
+Continuous frame streaming for kiosk clients.
+
+The client uploads raw JPEG frames (no base64/JSON) to a stream and receives
+results asynchronously over a server-sent event channel. Each stream has a
+single-slot mailbox: a new frame replaces one that has not been picked up yet,
+so when the server falls behind it skips stale frames instead of queueing them.
+A small fixed set of consumer threads serves all streams; a stream is
+scheduled at most once at a time, so its frames are processed in order.
+
+Streams ride on liveness sessions (same id), so a confirmed stream can be used
+directly for a punch.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, Optional
+
+from config import STREAM_CONSUMERS, STREAM_MAX_FRAME_AGE, STREAM_RESULT_BUFFER
+from .liveness import LivenessSession, LivenessSessionStore
+
+
+class FrameStream:
+    """Latest-frame mailbox plus a short buffer of results for one session."""
+
+    def __init__(self, session: LivenessSession, result_buffer: int = STREAM_RESULT_BUFFER):
+        self.session = session
+        self._cond = threading.Condition()
+        self._frame: Optional[bytes] = None
+        self._frame_time = 0.0
+        self._scheduled = False
+        self._results = deque(maxlen=result_buffer)
+        self._seq = 0
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+
+    def take_frame(self):
+        """(frame bytes, arrival time) or (None, 0) if the mailbox is empty."""
+        with self._cond:
+            frame, arrived = self._frame, self._frame_time
+            self._frame = None
+            return frame, arrived
+
+    def publish(self, result: dict) -> None:
+        with self._cond:
+            self._seq += 1
+            result["seq"] = self._seq
+            self._results.append(result)
+            self._cond.notify_all()
+
+    def events(self, keepalive: float = 15.0) -> Iterator[Optional[dict]]:
+        """Yield results as they are published; None every `keepalive` s when idle."""
+        seen = 0
+        while True:
+            with self._cond:
+                if not self.closed and (not self._results or self._results[-1]["seq"] <= seen):
+                    self._cond.wait(keepalive)
+                if self.closed:
+                    return
+                fresh = [r for r in self._results if r["seq"] > seen]
+            if not fresh:
+                yield None
+                continue
+            for result in fresh:
+                seen = result["seq"]
+                yield result
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class StreamHub:
+    """
+    Owns the streams and the consumer threads. `process(session, frame_bytes)`
+    does the actual recognition and returns the result dict to publish.
+    """
+
+    def __init__(
+        self,
+        sessions: LivenessSessionStore,
+        process: Callable[[LivenessSession, bytes], dict],
+        consumers: int = STREAM_CONSUMERS,
+        max_frame_age: float = STREAM_MAX_FRAME_AGE,
+    ):
+        self.sessions = sessions
+        self.process = process
+        self.max_frame_age = max_frame_age
+        self._streams: Dict[str, FrameStream] = {}
+        self._lock = threading.Lock()
+        self._ready = deque()
+        self._ready_cond = threading.Condition(self._lock)
+        self.stale_dropped = 0
+        self._closed_totals = [0, 0, 0]  # received, processed, dropped of closed streams
+        self._threads = [
+            threading.Thread(target=self._consume, name=f"frame-consumer-{i}", daemon=True)
+            for i in range(max(1, consumers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def open(self) -> FrameStream:
+        session = self.sessions.open()
+        stream = FrameStream(session)
+        with self._lock:
+            self._streams[session.id] = stream
+            ids = list(self._streams)
+        for stream_id in ids:  # streams whose session expired or was consumed
+            if not self.sessions.contains(stream_id):
+                self.close(stream_id)
+        return stream
+
+    def get(self, stream_id: str, touch: bool = True) -> Optional[FrameStream]:
+        """
+        The stream if its session is still open; closes it otherwise. With
+        touch=False the lookup does not extend the session's TTL.
+        """
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        if stream is None:
+            return None
+        alive = self.sessions.get(stream_id) is not None if touch else self.sessions.contains(stream_id)
+        if not alive:
+            self.close(stream_id)
+            return None
+        return stream
+
+    def close(self, stream_id: str) -> None:
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+            if stream is not None:
+                totals = self._closed_totals
+                totals[0] += stream.received
+                totals[1] += stream.processed
+                totals[2] += stream.dropped
+        if stream is not None:
+            stream.close()
+
+    def push(self, stream: FrameStream, frame: bytes) -> bool:
+        """Put a frame in the mailbox. Returns True if an unprocessed frame was replaced."""
+        with stream._cond:
+            replaced = stream._frame is not None
+            stream._frame = frame
+            stream._frame_time = time.monotonic()
+            stream.received += 1
+            if replaced:
+                stream.dropped += 1
+            schedule = not stream._scheduled
+            stream._scheduled = True
+        if schedule:
+            with self._ready_cond:
+                self._ready.append(stream)
+                self._ready_cond.notify()
+        return replaced
+
+    def _consume(self) -> None:
+        while True:
+            with self._ready_cond:
+                while not self._ready:
+                    self._ready_cond.wait()
+                stream = self._ready.popleft()
+            frame, arrived = stream.take_frame()
+            if frame is not None and not stream.closed:
+                if time.monotonic() - arrived > self.max_frame_age:
+                    with self._lock:
+                        self.stale_dropped += 1
+                    stream.dropped += 1
+                else:
+                    try:
+                        result = self.process(stream.session, frame)
+                    except Exception as e:  # keep the consumer alive; report to the client
+                        result = {"session_id": stream.session.id, "error": True, "message": str(e)}
+                    stream.processed += 1
+                    stream.publish(result)
+            with stream._cond:
+                if stream._frame is not None and not stream.closed:
+                    reschedule = True
+                else:
+                    stream._scheduled = False
+                    reschedule = False
+            if reschedule:
+                with self._ready_cond:
+                    self._ready.append(stream)
+                    self._ready_cond.notify()
+
+    def stats(self) -> dict:
+        with self._lock:
+            streams = list(self._streams.values())
+            stale = self.stale_dropped
+            received, processed, dropped = self._closed_totals
+        return {
+            "streams": len(streams),
+            "consumers": len(self._threads),
+            "frames_received": received + sum(s.received for s in streams),
+            "frames_processed": processed + sum(s.processed for s in streams),
+            "frames_dropped": dropped + sum(s.dropped for s in streams),
+            "stale_dropped": stale,
+        }
@@ -0,0 +1,26 @@
+"""Per-stage wall-clock timings for the recognition pipeline."""
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StageTimer:
+    """
+    Accumulate milliseconds per named stage into a dict.
+
+        timer = StageTimer(timings)
+        with timer.stage("detect"):
+            ...
+    """
+
+    def __init__(self, timings: Optional[Dict[str, float]] = None):
+        self.timings = timings if timings is not None else {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
@@ -0,0 +1,212 @@
+"""
+Face tracks across a stream of frames.
+
+Consecutive streamed frames show the same face at almost the same place, so
+most of them do not need the full pipeline. A FaceTracker keeps the tracks of
+one stream and plans each frame:
+
+- Detection: every `full_every`-th frame, and any frame without a track or
+  right after the track was missed, runs the full-frame detector. Frames in
+  between search only a region around the last box (see
+  FaceDetector.detect_roi), scaled so the face is about TRACK_ROI_FACE_PX
+  wide, which costs a small fraction of a full-frame pass.
+- Identity: a track keeps the identity it was matched to for `identity_ttl`
+  seconds; after that the next frame encodes and matches it again. If the
+  re-match finds someone else, or nobody `max_failures` times in a row, the
+  identity is dropped. A track
+  without an identity retries at most every `retry_interval` seconds, so an
+  unregistered face does not cost an encoding per frame.
+
+Detections are matched to tracks greedily by box IoU (at least `min_iou`); a
+track unmatched for more than `max_misses` frames is dropped, and a detection
+matching no track starts a new one.
+"""
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from config import (
+    LIVENESS_MIN_IOU,
+    TRACK_FULL_DETECT_EVERY,
+    TRACK_IDENTITY_TTL,
+    TRACK_MAX_MISSES,
+    TRACK_RETRY_INTERVAL,
+)
+from .detection import Box, box_iou
+
+
+class TrackerStats:
+    """Counters shared by many trackers (e.g. all sessions of a store)."""
+
+    FIELDS = ("frames", "full_detections", "roi_detections", "identity_runs", "identity_reused", "tracks")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, field: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[field] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        frames = counts["frames"]
+        counts["roi_ratio"] = round(counts["roi_detections"] / frames, 3) if frames else 0.0
+        return counts
+
+
+class Track:
+    """One face followed across frames, with the identity it was matched to."""
+
+    def __init__(self, track_id: int, box: Box, now: float):
+        self.id = track_id
+        self.box = box
+        self.created = self.last_seen = now
+        self.hits = 1
+        self.misses = 0
+        self.user_id: Optional[str] = None
+        self.name: Optional[str] = None
+        self.distance: Optional[float] = None
+        self.encoding = None
+        self.verified_at: Optional[float] = None  # last successful match
+        self.attempted_at: Optional[float] = None  # last identity attempt
+        self.failures = 0  # consecutive re-matches that found nobody
+
+    def clear_identity(self) -> None:
+        self.user_id = self.name = self.distance = self.encoding = self.verified_at = None
+        self.failures = 0
+
+
+class FaceTracker:
+    """IoU tracks for one stream, and the per-frame detection / identity plan."""
+
+    def __init__(
+        self,
+        min_iou: float = LIVENESS_MIN_IOU,
+        full_every: int = TRACK_FULL_DETECT_EVERY,
+        identity_ttl: float = TRACK_IDENTITY_TTL,
+        retry_interval: float = TRACK_RETRY_INTERVAL,
+        max_misses: int = TRACK_MAX_MISSES,
+        max_failures: int = 2,
+        stats: Optional[TrackerStats] = None,
+    ):
+        self.min_iou = min_iou
+        self.full_every = max(1, full_every)
+        self.identity_ttl = identity_ttl
+        self.retry_interval = retry_interval
+        self.max_misses = max_misses
+        self.max_failures = max(1, max_failures)
+        self.stats = stats or TrackerStats()
+        self.tracks: List[Track] = []
+        self.primary: Optional[Track] = None
+        self._next_id = 1
+        self._since_full = 0
+
+    def reset(self) -> None:
+        self.tracks = []
+        self.primary = None
+        self._since_full = 0
+
+    def plan(self, now: Optional[float] = None) -> Tuple[Optional[Box], bool]:
+        """
+        (box to search around, or None for a full-frame detection; whether
+        this frame should encode and match the face).
+        """
+        now = time.monotonic() if now is None else now
+        track = self.primary
+        full = track is None or track.misses > 0 or self._since_full + 1 >= self.full_every
+        if track is None:
+            identify = True
+        elif track.user_id is None:
+            identify = track.attempted_at is None or now - track.attempted_at >= self.retry_interval
+        else:
+            identify = now - track.verified_at >= self.identity_ttl
+        if track is not None and track.user_id is not None and not identify:
+            self.stats.add("identity_reused")
+        return (None if full else track.box), identify
+
+    def update(self, boxes: Sequence[Box], full: bool, now: Optional[float] = None) -> Optional[Track]:
+        """
+        Fold one frame's detections into the tracks. `full` is False when only
+        the region around the primary track was searched; other tracks are
+        then left alone. Returns the primary track (largest face) or None.
+        """
+        now = time.monotonic() if now is None else now
+        self.stats.add("frames")
+        if full:
+            self._since_full = 0
+            self.stats.add("full_detections")
+        else:
+            self._since_full += 1
+            self.stats.add("roi_detections")
+        candidates = self.tracks if full or self.primary is None else [self.primary]
+
+        pairs = sorted(
+            ((box_iou(t.box, b), ti, bi) for ti, t in enumerate(candidates) for bi, b in enumerate(boxes)),
+            reverse=True,
+        )
+        matched_tracks, box_track = set(), {}
+        for iou, ti, bi in pairs:
+            if iou < self.min_iou:
+                break
+            if ti in matched_tracks or bi in box_track:
+                continue
+            matched_tracks.add(ti)
+            box_track[bi] = candidates[ti]
+
+        for ti, track in enumerate(candidates):
+            if ti not in matched_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        for bi, box in enumerate(boxes):
+            track = box_track.get(bi)
+            if track is None:
+                track = Track(self._next_id, box, now)
+                self._next_id += 1
+                self.tracks.append(track)
+                self.stats.add("tracks")
+            else:
+                track.box = box
+                track.last_seen = now
+                track.hits += 1
+                track.misses = 0
+            box_track[bi] = track
+
+        if boxes:
+            largest = max(range(len(boxes)), key=lambda i: (boxes[i][2] - boxes[i][0]) * (boxes[i][1] - boxes[i][3]))
+            self.primary = box_track[largest]
+        elif self.primary is not None and self.primary.misses > self.max_misses:
+            self.primary = None
+        return self.primary if boxes else None
+
+    def identity_checked(
+        self,
+        track: Track,
+        user_id: Optional[str],
+        name: Optional[str],
+        distance: Optional[float],
+        encoding=None,
+        now: Optional[float] = None,
+    ) -> bool:
+        """
+        Fold an identity result (user_id None = no match) into a track.
+        Returns False if this drops the track's identity: a match with
+        someone else, or max_failures misses in a row.
+        """
+        now = time.monotonic() if now is None else now
+        self.stats.add("identity_runs")
+        track.attempted_at = now
+        if track.user_id is not None and user_id is None:
+            track.failures += 1  # verified_at stays old, so the next frame re-checks
+            if track.failures < self.max_failures:
+                return True
+        if track.user_id is not None and user_id != track.user_id:
+            track.clear_identity()
+            return False
+        if user_id is not None:
+            track.failures = 0
+            track.user_id, track.name, track.distance = user_id, name, distance
+            track.encoding = encoding
+            track.verified_at = now
+        return True
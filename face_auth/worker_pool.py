@@ -0,0 +1,237 @@
+"""
+Bounded inference pool for the web app.
+
+Each worker process owns its own FaceIdentifier (dlib detector, shape
+predictor and ResNet) and opens the embedding store read-only; with the packed
+store the gallery rows come from a shared memory map, and workers pick up new
+registrations through the store's change stamp. Spoof/blink state is created
+per call inside identify(), so requests never share it.
+
+Admission is bounded: at most `workers + queue_size` requests may be pending.
+Beyond that `submit` raises PoolSaturated immediately (the app maps it to 429)
+instead of letting requests pile up behind busy workers.
+
+With workers=0 calls run inline in the request thread, still bounded and
+still counted, which suits the threaded dev server and tests.
+
+Models load lazily (face_auth.models), so a worker warms itself up in its
+initializer, and start_warm_up() spawns every worker (or warms the inline
+identifier) in the background. readiness() reports when that has finished.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import EMBEDDINGS_DIR
+
+_identifier = None
+_warm_timings: Dict[str, float] = {}
+
+
+class PoolSaturated(Exception):
+    """All workers busy and the admission queue is full."""
+
+
+def _init_worker(embeddings_dir: str) -> None:
+    global _identifier, _warm_timings
+    from .face_identifier import FaceIdentifier
+    from .face_registry import FaceRegistry
+
+    _identifier = FaceIdentifier(registry=FaceRegistry(Path(embeddings_dir)))
+    _warm_timings = _identifier.warm_up()  # before the first task, so no request meets a cold worker
+
+
+def _warmed() -> Dict[str, float]:
+    """Inside a worker: the timings of its warm-up (done by the initializer)."""
+    return _warm_timings
+
+
+def _timed_call(identifier, method: str, args: tuple, kwargs: dict):
+    """Returns (result, busy_seconds, timings filled in by the call or None)."""
+    start = time.perf_counter()
+    result = getattr(identifier, method)(*args, **kwargs)
+    return result, time.perf_counter() - start, kwargs.get("timings")
+
+
+def _cache_stats(identifier) -> Optional[dict]:
+    cache = identifier.encoding_cache if identifier is not None else None
+    return cache.stats() if cache is not None else None
+
+
+def _call(method: str, args: tuple, kwargs: dict):
+    """Entry point inside a worker process; also reports the worker's encoding cache counters."""
+    return _timed_call(_identifier, method, args, kwargs) + (os.getpid(), _cache_stats(_identifier))
+
+
+def _merge_cache_stats(per_worker: List[dict]) -> Optional[dict]:
+    if not per_worker:
+        return None
+    merged = {key: sum(s[key] for s in per_worker) for key in per_worker[0] if key != "hit_ratio"}
+    lookups = merged["hits"] + merged["near_hits"] + merged["misses"]
+    merged["hit_ratio"] = round((merged["hits"] + merged["near_hits"]) / lookups, 4) if lookups else 0.0
+    return merged
+
+
+class InferencePool:
+    """Run FaceIdentifier methods on a bounded pool of worker processes."""
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        embeddings_dir: Optional[Path] = None,
+        identifier=None,
+    ):
+        self.workers = workers
+        self.capacity = max(1, workers) + queue_size
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._identifier = identifier
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(str(embeddings_dir or EMBEDDINGS_DIR),),
+            )
+        self._started = time.monotonic()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._warm_state = "cold"  # cold -> warming -> ready | failed
+        self._warm_error: Optional[str] = None
+        self._warm_timings: Optional[Dict[str, float]] = None
+        self._warm_seconds: Optional[float] = None
+        self._warm_thread: Optional[threading.Thread] = None
+        self._worker_cache_stats: Dict[int, dict] = {}  # pid -> encoding cache counters after its last call
+
+    def submit(self, method: str, *args, **kwargs):
+        """Run identifier.<method>(*args, **kwargs) and wait for the result."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturated("Recognition is busy. Please retry in a moment.")
+        with self._lock:
+            self._in_flight += 1
+        ok = False
+        try:
+            if self._executor is None:
+                result, busy, _ = _timed_call(self._identifier, method, args, kwargs)
+            else:
+                result, busy, timings, pid, cache = self._executor.submit(_call, method, args, kwargs).result()
+                if cache is not None:
+                    with self._lock:
+                        self._worker_cache_stats[pid] = cache
+                if timings is not None:
+                    # the worker filled a pickled copy; copy back into the caller's dict
+                    kwargs["timings"].update(timings)
+            ok = True
+            with self._lock:
+                self._busy_seconds += busy
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            self._slots.release()
+
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Load models and gallery everywhere inference runs and do one dummy
+        inference: inline, or by spawning every worker (their initializer
+        warms them). Returns ms per step; for workers, the slowest of them.
+        """
+        if self._executor is None:
+            return self._identifier.warm_up()
+        futures = [self._executor.submit(_warmed) for _ in range(self.workers)]
+        merged: Dict[str, float] = {}
+        for future in futures:
+            for step, ms in future.result().items():
+                merged[step] = max(ms, merged.get(step, 0.0))
+        return merged
+
+    def _run_warm_up(self) -> None:
+        start = time.perf_counter()
+        try:
+            timings = self.warm_up()
+        except Exception as e:  # reported by readiness(); requests still load lazily
+            with self._lock:
+                self._warm_state, self._warm_error = "failed", f"{type(e).__name__}: {e}"
+            return
+        with self._lock:
+            self._warm_state = "ready"
+            self._warm_timings = {k: round(v, 1) for k, v in timings.items()}
+            self._warm_seconds = round(time.perf_counter() - start, 3)
+
+    def start_warm_up(self) -> bool:
+        """Warm up in a background thread. False if already warming or warm."""
+        with self._lock:
+            if self._warm_state in ("warming", "ready"):
+                return False
+            self._warm_state, self._warm_error = "warming", None
+        self._warm_thread = threading.Thread(target=self._run_warm_up, name="inference-warm-up", daemon=True)
+        self._warm_thread.start()
+        return True
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        thread = self._warm_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        return self._warm_state == "ready"
+
+    def readiness(self) -> dict:
+        """Warm-up state, how long it took and ms per step."""
+        with self._lock:
+            return {
+                "ready": self._warm_state == "ready",
+                "state": self._warm_state,
+                "seconds": self._warm_seconds,
+                "timings": self._warm_timings,
+                "error": self._warm_error,
+            }
+
+    def encoding_cache_stats(self) -> Optional[dict]:
+        """
+        Encoding cache counters where inference runs: the inline identifier's,
+        or summed over workers as of each one's last call. None if disabled.
+        """
+        if self._executor is None:
+            return _cache_stats(self._identifier)
+        with self._lock:
+            return _merge_cache_stats(list(self._worker_cache_stats.values()))
+
+    def stats(self) -> dict:
+        """Queue depth, in-flight count and worker utilization since start."""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            workers = max(1, self.workers)
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "busy_seconds": round(self._busy_seconds, 3),
+                "utilization": round(min(1.0, self._busy_seconds / (elapsed * workers)), 4),
+                "ready": self._warm_state == "ready",
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
@@ -6,6 +6,15 @@
   var punchInBtn = document.getElementById('punchInBtn');
   var punchOutBtn = document.getElementById('punchOutBtn');
   var punchMessage = document.getElementById('punchMessage');
+  var layout = document.getElementById('attendLayout');
+  var requireBlink = layout && layout.getAttribute('data-require-blink') === 'true';
+  var CONFIRM_TIMEOUT_MS = 10000;
+  var FRAME_GAP_MS = 66; // ~15 fps upper bound; at most one upload in flight
+  var RETRY_MS = 1000;
+  var JPEG_QUALITY = 0.8;
+
+  // Current frame stream: { id, framesUrl, source, latest, waiters, stopped }
+  var stream = null;
 
   function setStatus(text) {
     if (statusEl) statusEl.textContent = text;
@@ -23,39 +32,149 @@
     punchMessage.classList.remove('hidden');
   }
 
-  function sendImageToApi(endpoint) {
-    if (!video || !video.srcObject) {
-      showPunchMessage('Camera not ready.', false);
-      return;
-    }
-    var dataUrl = window.CameraHelper.captureFrame(video);
+  function userError(text) {
+    var err = new Error(text);
+    err.userFacing = true;
+    return err;
+  }
+
+  function postJson(endpoint, body) {
     return fetch(endpoint, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ image: dataUrl }),
+      body: JSON.stringify(body || {}),
     })
       .then(function (r) { return r.json(); });
   }
 
+  // ---------- Continuous frame stream ----------
+  // Frames go up as raw JPEG bodies; results come back over server-sent
+  // events. The server keeps only the newest unprocessed frame per stream.
+
+  function showResult(data) {
+    if (data.confirmed) {
+      setIdentifyResult('Identified: ' + (data.name || data.user_id) + '. Choose Punch In or Punch Out.', true);
+    } else if (data.identified && requireBlink) {
+      setIdentifyResult('Hi ' + (data.name || data.user_id) + ', blink once to confirm.', false);
+    } else if (data.message) {
+      setIdentifyResult(data.message, false);
+    }
+  }
+
+  function onResult(s, data) {
+    if (s.stopped) return;
+    s.latest = data;
+    showResult(data);
+    if (data.confirmed) {
+      s.waiters.splice(0).forEach(function (w) { w(s); });
+    }
+  }
+
+  function pump(s) {
+    if (s.stopped) return;
+    if (document.hidden || !video || !video.srcObject || !video.videoWidth) {
+      setTimeout(function () { pump(s); }, RETRY_MS / 4);
+      return;
+    }
+    window.CameraHelper.captureJpeg(video, JPEG_QUALITY)
+      .then(function (blob) {
+        if (!blob || s.stopped) return null;
+        return fetch(s.framesUrl, {
+          method: 'POST',
+          headers: { 'Content-Type': 'image/jpeg' },
+          body: blob,
+        });
+      })
+      .then(function (r) {
+        if (s.stopped) return;
+        if (r && r.status === 404) {
+          restartStream(); // session expired or consumed
+          return;
+        }
+        setTimeout(function () { pump(s); }, FRAME_GAP_MS);
+      })
+      .catch(function () {
+        setTimeout(function () { pump(s); }, RETRY_MS);
+      });
+  }
+
+  function stopStream() {
+    if (!stream) return;
+    stream.stopped = true;
+    if (stream.source) stream.source.close();
+    stream = null;
+  }
+
+  function startStream() {
+    var s = { id: null, framesUrl: null, source: null, latest: null, waiters: [], stopped: false };
+    stream = s;
+    return postJson('/api/stream')
+      .then(function (info) {
+        if (s.stopped) return;
+        s.id = info.session_id;
+        s.framesUrl = info.frames_url;
+        s.source = new EventSource(info.events_url);
+        s.source.onmessage = function (e) { onResult(s, JSON.parse(e.data)); };
+        s.source.addEventListener('end', function () {
+          if (stream === s) restartStream();
+        });
+        pump(s);
+      })
+      .catch(function () {
+        if (stream === s) setTimeout(restartStream, RETRY_MS);
+      });
+  }
+
+  function restartStream() {
+    stopStream();
+    return startStream();
+  }
+
+  // Resolve with the current stream's session id once the server reports it
+  // confirmed (identified, and live when blink is required).
+  function waitForConfirmed() {
+    var s = stream;
+    if (!s) return Promise.reject(userError('Camera stream not ready.'));
+    if (s.latest && s.latest.confirmed) return Promise.resolve(s.id);
+    return new Promise(function (resolve, reject) {
+      var timer = setTimeout(function () {
+        reject(userError(requireBlink
+          ? 'Liveness check timed out. Please blink and try again.'
+          : 'Face not recognized. Please try again.'));
+      }, CONFIRM_TIMEOUT_MS);
+      s.waiters.push(function (confirmed) {
+        clearTimeout(timer);
+        resolve(confirmed.id);
+      });
+    });
+  }
+
   function doPunch(endpoint, btn) {
     btn.disabled = true;
-    setIdentifyResult('Verifying face and recording…');
-    sendImageToApi(endpoint)
+    setIdentifyResult(requireBlink ? 'Look at the camera and blink once…' : 'Verifying face…');
+    waitForConfirmed()
+      .then(function (sessionId) {
+        stopStream(); // the punch consumes the session
+        setIdentifyResult('Recording…');
+        return postJson(endpoint, { session_id: sessionId });
+      })
       .then(function (data) {
         if (data.success) {
-          showPunchMessage(data.message || 'Recorded.', true);
+          showPunchMessage((data.message || 'Recorded.') + (data.warning ? ' ' + data.warning : ''), true);
           setIdentifyResult('Identified: ' + (data.name || data.user_id), true);
         } else {
           showPunchMessage(data.message || 'Failed.', false);
           setIdentifyResult(data.message || 'No match or verification failed.', false);
         }
       })
-      .catch(function () {
-        showPunchMessage('Network error.', false);
+      .catch(function (err) {
+        var text = (err && err.userFacing) ? err.message : 'Network error.';
+        showPunchMessage(text, false);
         setIdentifyResult('Error.', false);
       })
       .finally(function () {
         btn.disabled = false;
+        if (!stream) startStream();
       });
   }
 
@@ -65,6 +184,7 @@
         setStatus('Camera ready. Look at the camera and blink when prompted, then Punch In or Punch Out.');
         punchInBtn.disabled = false;
         punchOutBtn.disabled = false;
+        startStream();
       })
       .catch(function () {
         setStatus('Could not access camera. Allow camera permission and refresh.');
@@ -83,6 +203,7 @@
   }
 
   window.addEventListener('beforeunload', function () {
+    stopStream();
     window.CameraHelper.stop();
   });
 })();
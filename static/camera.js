@@ -49,6 +49,19 @@
       return canvas.toDataURL(format);
     },
 
+    // Encode the current video frame straight to a JPEG Blob (no base64 step).
+    // Reuses one canvas across calls; resolves with null if the encode fails.
+    captureJpeg: function (videoEl, quality) {
+      var helper = window.CameraHelper;
+      var canvas = helper._jpegCanvas || (helper._jpegCanvas = document.createElement('canvas'));
+      if (canvas.width !== videoEl.videoWidth) canvas.width = videoEl.videoWidth;
+      if (canvas.height !== videoEl.videoHeight) canvas.height = videoEl.videoHeight;
+      canvas.getContext('2d').drawImage(videoEl, 0, 0, canvas.width, canvas.height);
+      return new Promise(function (resolve) {
+        canvas.toBlob(resolve, 'image/jpeg', quality || 0.8);
+      });
+    },
+
     captureBlob: function (videoEl, format) {
       format = format || 'image/jpeg';
       var dataUrl = window.CameraHelper.captureFrame(videoEl, format);